@@ -0,0 +1,69 @@
+"""Поиск обработчика нажатия: фильтры F.data.startswith по очереди
+против CallbackRouter.
+
+Для каждого числа префиксов собирает роутер с одним обработчиком на
+префикс и прогоняет через Dispatcher нажатие на кнопку последнего
+префикса (худший случай для перебора). Печатает время на одно нажатие.
+В сеть ничего не уходит: обработчики не вызывают Bot API.
+
+    python bench/callback_dispatch.py [нажатий]
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from aiogram import Bot, Dispatcher, F, Router
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import Update
+
+from callbacks import CallbackRouter
+
+PREFIX_COUNTS = (5, 20, 40, 80, 160)
+
+def make_router(prefixes: int, indexed: bool) -> Router:
+    router = CallbackRouter() if indexed else Router()
+    for i in range(prefixes):
+        schema = type(f"Item{i}Callback", (CallbackData,), {"__annotations__": {"item_id": int}}, prefix=f"p{i}")
+
+        async def handler(callback_query, callback_data=None):
+            return True
+
+        if indexed:
+            router.button(schema)(handler)
+        else:
+            router.callback_query(F.data.startswith(f"p{i}:"))(handler)
+    return router
+
+def make_update(bot: Bot, data: str) -> Update:
+    return Update.model_validate({"update_id": 1, "callback_query": {
+        "id": "1", "chat_instance": "bench", "data": data,
+        "from": {"id": 1, "is_bot": False, "first_name": "bench"},
+        "message": {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}},
+    }}, context={"bot": bot})
+
+async def measure(bot: Bot, prefixes: int, indexed: bool, presses: int) -> float:
+    dispatcher = Dispatcher()
+    dispatcher.include_router(make_router(prefixes, indexed))
+    update = make_update(bot, f"p{prefixes - 1}:5")
+    for _ in range(presses // 10):
+        await dispatcher.feed_update(bot, update)
+    start = time.perf_counter()
+    for _ in range(presses):
+        await dispatcher.feed_update(bot, update)
+    return (time.perf_counter() - start) / presses
+
+async def main():
+    presses = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    bot = Bot("1:bench")
+    print(f"{'префиксов':>10} {'перебор, мкс':>14} {'CallbackRouter, мкс':>20}")
+    for prefixes in PREFIX_COUNTS:
+        linear = await measure(bot, prefixes, False, presses)
+        indexed = await measure(bot, prefixes, True, presses)
+        print(f"{prefixes:>10} {linear * 1e6:>14.0f} {indexed * 1e6:>20.0f}")
+    await bot.session.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
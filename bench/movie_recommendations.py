@@ -0,0 +1,71 @@
+"""Рекомендации фильмов на N фильмах пары.
+
+Заполняет базу в памяти случайными фильмами (часть просмотрена, часть
+оценена) и печатает время построения признаков (первый вызов или вызов
+после записи) и медиану ранжирования по закэшированным признакам.
+
+    python bench/movie_recommendations.py [N]
+"""
+import functools
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import Database
+from models import Movie, MovieType
+
+WORDS = ("космос любовь война комедия драма ужасы детектив мюзикл аниме вестерн "
+         "роман семья приключения фантастика история музыка спорт").split()
+
+def fill(db: Database, count: int):
+    """Добавляет фильмы двумя пачками run_batch: сами фильмы, потом
+    просмотры и оценки части из них"""
+    random.seed(1)
+    movies = [Movie(
+        title=" ".join(random.sample(WORDS, 2)) + f" {i}",
+        description=" ".join(random.sample(WORDS, 5)),
+        movie_type=random.choice(list(MovieType)),
+        created_by=random.choice((1, 2)),
+        created_at=datetime.now() - timedelta(days=random.randint(0, 400)),
+    ) for i in range(count)]
+    ids = [movie_id for _, movie_id in db.run_batch([functools.partial(db.add_movie, m) for m in movies])]
+
+    updates = []
+    for movie_id in ids:
+        if random.random() < 0.3:
+            updates.append(functools.partial(
+                db.update_movie_watch_status, movie_id, True, datetime.now(), random.choice(WORDS)
+            ))
+        if random.random() < 0.5:
+            updates.append(functools.partial(db.update_movie_rating, movie_id, random.randint(1, 5)))
+    db.run_batch(updates)
+
+def timed(call) -> float:
+    start = time.perf_counter()
+    call()
+    return time.perf_counter() - start
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    db = Database(":memory:")
+    db.add_user(1, 2)
+    db.add_user(2, 1)
+    fill(db, count)
+
+    cold = timed(lambda: db.get_movie_recommendations(1))
+    warm = [timed(lambda: db.get_movie_recommendations(1)) for _ in range(20)]
+    db.add_movie(Movie(title="новый фильм", movie_type=MovieType.PARTNER_MOVIES, created_by=2))
+    rebuild = timed(lambda: db.get_movie_recommendations(1))
+
+    print(f"{count} фильмов")
+    print(f"построение признаков:  {cold * 1e3:6.1f} мс")
+    print(f"ранжирование из кэша:  {statistics.median(warm) * 1e3:6.2f} мс (медиана)")
+    print(f"после записи:          {rebuild * 1e3:6.1f} мс")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Превращение строк базы в модели: прежние классы против Task.from_row.
+
+Прежний путь - обычный класс с __dict__, Enum(value) и разбор даты сразу
+при создании, как было в models.py до неизменяемых моделей со слотами.
+Печатает время на N строк (лучшее из трёх повторов) и занятую память.
+
+    python bench/row_mapping.py [N]
+"""
+import sys
+import timeit
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from models import Task, TaskType, TaskStatus
+
+class LegacyTask:
+    """Task в том виде, в каком он был до слотов"""
+
+    def __init__(self, id=None, title="", description="", task_type=TaskType.FOR_ME,
+                 status=TaskStatus.ACTIVE, created_by=None, created_at=None):
+        self.id = id
+        self.title = title
+        self.description = description
+        self.task_type = task_type
+        self.status = status
+        self.created_by = created_by
+        self.created_at = created_at or datetime.now()
+
+def legacy(rows):
+    return [LegacyTask(id=row[0], title=row[1], description=row[2], task_type=TaskType(row[3]),
+                       status=TaskStatus(row[4]), created_by=row[5],
+                       created_at=datetime.fromisoformat(row[6]))
+            for row in rows]
+
+def slotted(rows):
+    return [Task.from_row(row) for row in rows]
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    rows = [(i, "название", "описание", "for_me", "active", 1, "2024-01-01 10:00:00.123456")
+            for i in range(count)]
+    print(f"{count} строк задач")
+    for mapper in (legacy, slotted):
+        seconds = min(timeit.repeat(lambda: mapper(rows), number=5, repeat=3)) / 5
+        tracemalloc.start()
+        tasks = mapper(rows)
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del tasks
+        print(f"{mapper.__name__:>8}: {seconds * 1e3:5.1f} мс, {memory / 1024:5.0f} КБ")
+
+if __name__ == "__main__":
+    main()
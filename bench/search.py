@@ -0,0 +1,61 @@
+"""Полнотекстовый поиск на N задачах, N желаниях и N фильмах.
+
+Названия и описания собираются из словаря в 3000 слов и нескольких
+настоящих слов. Для каждого запроса печатает медиану первой страницы
+и время второй.
+
+    python bench/search.py [N]
+"""
+import functools
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import Database
+from models import Task, Wish, Movie
+
+WORDS = [f"w{i}" for i in range(3000)] + "кино ужин путешествие подарок ремонт дача".split()
+
+# Обычное слово, два слова, префикс из пяти букв и короткие префиксы,
+# под которые попадает большая часть строк
+QUERIES = ("кино", "ремонт дача", "путеш", "w12", "w1")
+
+def fill(db: Database, count: int):
+    random.seed(2)
+    calls = []
+    for _ in range(count):
+        created_by = random.choice((1, 2))
+        for model in (Task, Wish, Movie):
+            calls.append(functools.partial(getattr(db, f"add_{model.__name__.lower()}"), model(
+                title=" ".join(random.sample(WORDS, 3)),
+                description=" ".join(random.sample(WORDS, 12)),
+                created_by=created_by,
+            )))
+    db.run_batch(calls)
+
+def timed(call) -> float:
+    start = time.perf_counter()
+    call()
+    return time.perf_counter() - start
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    db = Database(":memory:")
+    db.add_user(1, 2)
+    db.add_user(2, 1)
+    fill(db, count)
+
+    print(f"{3 * count} записей")
+    for query in QUERIES:
+        first = [timed(lambda: db.get_search_results(1, query)) for _ in range(10)]
+        page = db.get_search_results(1, query)
+        second = timed(lambda: db.get_search_results(1, query, page.next_cursor))
+        print(f"{query:>12}: страница 1 {statistics.median(first) * 1e3:7.2f} мс, "
+              f"страница 2 {second * 1e3:7.2f} мс")
+
+if __name__ == "__main__":
+    main()
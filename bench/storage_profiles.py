@@ -0,0 +1,41 @@
+"""Задержка записи в профилях хранения "default" и "wal".
+
+Делает N последовательных add_task в файловую базу каждого профиля и
+печатает медиану и 99-й перцентиль одной записи.
+
+    python bench/storage_profiles.py [N]
+"""
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import Database, STORAGE_PROFILES
+from models import Task
+
+def measure(profile: str, writes: int) -> list:
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(str(Path(tmp) / "bench.db"), profile)
+        db.add_user(1, 2)
+        latencies = []
+        for i in range(writes):
+            start = time.perf_counter()
+            db.add_task(Task(title=f"задача {i}", created_by=1))
+            latencies.append(time.perf_counter() - start)
+        db.close()
+    return sorted(latencies)
+
+def main():
+    writes = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    print(f"{writes} последовательных add_task")
+    for profile in STORAGE_PROFILES:
+        latencies = measure(profile, writes)
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"{profile:>8}: медиана {statistics.median(latencies) * 1e6:6.0f} мкс, "
+              f"p99 {p99 * 1e6:6.0f} мкс")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import threading
+from collections import OrderedDict
+
+
+class ListCache:
+    """LRU-кэш страниц списков задач, желаний и фильмов.
+
+    Записи группируются по паре пользователей и таблице, поэтому изменение
+    задачи сбрасывает только списки задач этой пары. Кэш используется из
+    нескольких потоков базы, все операции идут под блокировкой.
+    """
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # Поколение списков (пара, таблица) растёт при каждой инвалидации,
+        # а общее поколение - при полной очистке
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def get_or_load(self, couple: tuple, table: str, key: tuple, loader):
+        """Возвращает значение из кэша или загружает его через loader()"""
+        group = (couple, table)
+        full_key = (group, key)
+        with self._lock:
+            if full_key in self._entries:
+                self._entries.move_to_end(full_key)
+                self.hits += 1
+                return self._entries[full_key]
+            self.misses += 1
+            generation = (self._epoch, self._generations.get(group, 0))
+
+        value = loader()
+
+        with self._lock:
+            # Если список изменили, пока мы читали, результат уже устарел
+            if (self._epoch, self._generations.get(group, 0)) == generation:
+                self._entries[full_key] = value
+                self._entries.move_to_end(full_key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, couple: tuple, table: str):
+        """Сбрасывает все списки таблицы для пары"""
+        group = (couple, table)
+        with self._lock:
+            self._generations[group] = self._generations.get(group, 0) + 1
+            for full_key in [k for k in self._entries if k[0] == group]:
+                del self._entries[full_key]
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
+
+
+class EntityCache:
+    """LRU-кэш отдельных записей по ключу (таблица, id).
+
+    Мутаторы базы кладут сюда строку, которую вернул UPDATE ... RETURNING,
+    поэтому повторный просмотр после изменения не идёт в базу. Модели
+    неизменяемы, поэтому записи отдаются наружу без копирования.
+    """
+
+    def __init__(self, max_size: int = 512):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        # Растёт при каждой записи, чтобы чтение, которое шло параллельно
+        # с изменением, не положило в кэш старую версию
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def get_or_load(self, key: tuple, loader):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            version = self._version
+
+        value = loader()
+
+        with self._lock:
+            if value is not None and self._version == version:
+                self._store(key, value)
+        return value
+
+    def put(self, key: tuple, value):
+        with self._lock:
+            self._version += 1
+            self._store(key, value)
+
+    def discard(self, key: tuple):
+        with self._lock:
+            self._version += 1
+            self._entries.pop(key, None)
+
+    def _store(self, key: tuple, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
@@ -0,0 +1,203 @@
+from typing import Any, Callable, Dict, List, Optional, Type
+from aiogram import Router
+from aiogram.dispatcher.event.handler import FilterObject, HandlerObject
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import CallbackQuery
+from models import TaskType, TaskStatus, WishType, MovieType
+
+# Схемы callback_data кнопок в формате "префикс:поле:поле". Префиксы не
+# пересекаются: выбор поля для редактирования - отдельные *_field. Кнопки
+# старого формата в уже отправленных сообщениях ("edit:title",
+# "edit_wish:title", "view_task:5" без контекста) переводятся в новые схемы
+# в LEGACY_CALLBACKS, на остальные отвечает обработчик устаревших кнопок
+
+# Общие
+class MainMenuCallback(CallbackData, prefix="main_menu"):
+    pass
+
+class CancelCallback(CallbackData, prefix="cancel"):
+    pass
+
+# Задачи
+class TaskTypeCallback(CallbackData, prefix="task_type"):
+    task_type: TaskType
+
+class ViewTaskCallback(CallbackData, prefix="view_task"):
+    task_id: int
+    context: str = "my_tasks"
+
+class TaskStatusCallback(CallbackData, prefix="task_status"):
+    task_id: int
+    status: TaskStatus
+
+class EditTaskCallback(CallbackData, prefix="edit_task"):
+    task_id: int
+
+class TaskFieldCallback(CallbackData, prefix="task_field"):
+    field: str
+
+class DeleteTaskCallback(CallbackData, prefix="delete_task"):
+    task_id: int
+
+class ConfirmDeleteTaskCallback(CallbackData, prefix="confirm_delete"):
+    task_id: int
+
+class TasksPageCallback(CallbackData, prefix="page"):
+    cursor: str
+
+class TasksBackCallback(CallbackData, prefix="back_to_tasks"):
+    context: str = "my_tasks"
+
+# Желания
+class WishTypeCallback(CallbackData, prefix="wish_type"):
+    wish_type: WishType
+
+class ViewWishCallback(CallbackData, prefix="view_wish"):
+    wish_id: int
+    context: str = "my_wishes"
+
+class EditWishCallback(CallbackData, prefix="edit_wish"):
+    wish_id: int
+
+class WishFieldCallback(CallbackData, prefix="wish_field"):
+    field: str
+
+class DeleteWishCallback(CallbackData, prefix="delete_wish"):
+    wish_id: int
+
+class ConfirmDeleteWishCallback(CallbackData, prefix="confirm_delete_wish"):
+    wish_id: int
+
+class WishesPageCallback(CallbackData, prefix="wish_page"):
+    cursor: str
+
+class WishesBackCallback(CallbackData, prefix="back_to_wishes"):
+    context: str = "my_wishes"
+
+# Поиск
+class SearchPageCallback(CallbackData, prefix="search_page"):
+    cursor: str
+
+# Фильмы
+class MoviesMenuCallback(CallbackData, prefix="movies"):
+    action: str
+
+class MovieTypeCallback(CallbackData, prefix="movie_type"):
+    movie_type: MovieType
+
+class ViewMovieCallback(CallbackData, prefix="view_movie"):
+    movie_id: int
+    context: str = "my_movies"
+
+class MarkWatchedCallback(CallbackData, prefix="mark_watched"):
+    movie_id: int
+
+class AddReviewCallback(CallbackData, prefix="add_review"):
+    movie_id: int
+
+class EditMovieCallback(CallbackData, prefix="edit_movie"):
+    movie_id: int
+
+class MovieFieldCallback(CallbackData, prefix="movie_field"):
+    field: str
+
+class DeleteMovieCallback(CallbackData, prefix="delete_movie"):
+    movie_id: int
+
+class ConfirmDeleteMovieCallback(CallbackData, prefix="confirm_delete_movie"):
+    movie_id: int
+
+class MoviesBackCallback(CallbackData, prefix="back_to_movies"):
+    context: str = "my_movies"
+
+class MoviesPageCallback(CallbackData, prefix="movie_page"):
+    cursor: str
+
+class RateMovieCallback(CallbackData, prefix="rate_movie"):
+    movie_id: int
+
+class SetRatingCallback(CallbackData, prefix="set_rating"):
+    movie_id: int
+    rating: int
+
+def _legacy_view(callback_type: Type[CallbackData], id_field: str) -> Callable[[str], Optional[CallbackData]]:
+    """"view_task:5" без контекста - открытие из своего списка"""
+    return lambda value: callback_type(**{id_field: int(value)}) if value.isdigit() else None
+
+def _legacy_field(callback_type: Type[CallbackData]) -> Callable[[str], Optional[CallbackData]]:
+    """"edit:title" - выбор поля. "edit_wish:5" - это открытие меню
+    редактирования в новом формате, его не трогаем"""
+    return lambda value: callback_type(field=value) if value.isalpha() else None
+
+# Префикс кнопки старого формата -> перевод остатка callback_data в новую схему
+LEGACY_CALLBACKS: Dict[str, Callable[[str], Optional[CallbackData]]] = {
+    ViewTaskCallback.__prefix__: _legacy_view(ViewTaskCallback, "task_id"),
+    ViewWishCallback.__prefix__: _legacy_view(ViewWishCallback, "wish_id"),
+    ViewMovieCallback.__prefix__: _legacy_view(ViewMovieCallback, "movie_id"),
+    "edit": _legacy_field(TaskFieldCallback),
+    EditWishCallback.__prefix__: _legacy_field(WishFieldCallback),
+    EditMovieCallback.__prefix__: _legacy_field(MovieFieldCallback),
+}
+
+def upgrade_legacy_data(data: str) -> Optional[str]:
+    """callback_data кнопки старого формата в новой схеме или None"""
+    prefix, _, value = data.partition(":")
+    upgrade = LEGACY_CALLBACKS.get(prefix)
+    callback_data = upgrade(value) if upgrade else None
+    return callback_data.pack() if callback_data else None
+
+class CallbackRouter(Router):
+    """Роутер, который ищет обработчик нажатия по префиксу callback_data.
+
+    Обработчики, зарегистрированные через button(), лежат в словаре по
+    префиксам. Роутер регистрирует один обычный обработчик callback_query,
+    фильтр которого берёт из словаря обработчики нужного префикса и
+    проверяет фильтры только у них, а не у всех обработчиков по очереди.
+    Разобранная схема передаётся обработчику в аргументе callback_data.
+    Кнопки старого формата, которые не подошли ни одной схеме, переводятся
+    в новый формат (upgrade_legacy_data), и обработчик получает нажатие с
+    новой callback_data. Обычные обработчики callback_query тоже работают и
+    проверяются после.
+    """
+
+    def __init__(self, *, name: Optional[str] = None):
+        super().__init__(name=name)
+        self._buttons: Dict[str, List[HandlerObject]] = {}
+        self.callback_query.register(self._call_button, self._find_button)
+
+    def button(self, callback_type: Type[CallbackData], *filters: Any):
+        """Декоратор обработчика кнопок со схемой callback_type (и фильтрами)"""
+        def decorator(callback):
+            self._buttons.setdefault(callback_type.__prefix__, []).append(HandlerObject(
+                callback=callback,
+                filters=[FilterObject(f) for f in (callback_type.filter(), *filters)],
+            ))
+            return callback
+        return decorator
+
+    async def _find_button(self, callback: CallbackQuery, **kwargs: Any) -> Any:
+        """Фильтр: ищет обработчик кнопки среди обработчиков её префикса.
+        Если не нашёлся, нажатие проверяют остальные обработчики роутера"""
+        found = await self._check_buttons(callback, kwargs)
+        if found:
+            return found
+        upgraded = upgrade_legacy_data(callback.data or "")
+        if upgraded is None:
+            return False
+        legacy = callback.model_copy(update={"data": upgraded})
+        found = await self._check_buttons(legacy, kwargs)
+        if found:
+            found["upgraded_callback"] = legacy
+        return found
+
+    async def _check_buttons(self, callback: CallbackQuery, kwargs: Dict[str, Any]) -> Any:
+        prefix = (callback.data or "").partition(":")[0]
+        for handler in self._buttons.get(prefix, ()):
+            passed, data = await handler.check(callback, **kwargs)
+            if passed:
+                return {**data, "button": handler}
+        return False
+
+    async def _call_button(self, callback: CallbackQuery, button: HandlerObject,
+                           upgraded_callback: Optional[CallbackQuery] = None, **kwargs: Any) -> Any:
+        return await button.call(upgraded_callback or callback, **kwargs)
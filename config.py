@@ -33,4 +33,38 @@ else:
     BOT_TOKEN = os.getenv('DEV_BOT_TOKEN')
 
 # Список ID админов бота
-ADMIN_IDS = [int(id) for id in os.getenv('ADMIN_IDS', '').split(',') if id]
\ No newline at end of file
+ADMIN_IDS = [int(id) for id in os.getenv('ADMIN_IDS', '').split(',') if id]
+
+# Профиль хранения SQLite (см. STORAGE_PROFILES в database.py): "wal" или "default"
+DB_PROFILE = os.getenv('DB_PROFILE', 'wal')
+
+# Окно group commit в миллисекундах: записи, пришедшие за это время, коммитятся
+# одной транзакцией. 0 - каждая запись коммитится сразу
+DB_GROUP_COMMIT_MS = int(os.getenv('DB_GROUP_COMMIT_MS', '0'))
+
+# Через сколько дней после выполнения задача переезжает в архив
+TASK_ARCHIVE_DAYS = int(os.getenv('TASK_ARCHIVE_DAYS', '30'))
+
+# Сколько часов хранить незаконченный диалог (состояние FSM) без изменений
+FSM_STATE_TTL_HOURS = int(os.getenv('FSM_STATE_TTL_HOURS', '48'))
+
+# Как получать обновления: "polling" или "webhook"
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+
+# Настройки вебхука. WEBHOOK_BASE_URL - публичный https-адрес, по которому
+# Telegram достучится до бота, WEBHOOK_SECRET - секрет из заголовка
+# X-Telegram-Bot-Api-Secret-Token (оба обязательны в режиме webhook). WEBHOOK_WORKERS - сколько обновлений
+# обрабатывать одновременно (и max_connections для Telegram)
+WEBHOOK_BASE_URL = os.getenv('WEBHOOK_BASE_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '10'))
+
+# Адрес Bot API. Пусто - api.telegram.org, иначе свой сервер Bot API
+# (или тестовый, например http://localhost:8081)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', '')
+
+# Сколько обновлений разных пользователей обрабатывать одновременно
+UPDATE_WORKERS = int(os.getenv('UPDATE_WORKERS', '16'))
@@ -1,566 +1,1166 @@
 import sqlite3
+import asyncio
+import functools
+import queue
+import re
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 from typing import List, Optional
-from models import Task, TaskType, TaskStatus, Wish, WishType
+from models import Task, TaskType, TaskStatus, Wish, WishType, Movie, MovieType, to_epoch
+from cache import ListCache, EntityCache
+from recommendations import MovieFeatures
+from migrations import migrate, rebuild_movie_stats, MOVIE_RATINGS
 from datetime import datetime
 import json
 import logging
 
+# Профили хранения. "default" - стандартный журнал отката и одно соединение,
+# "wal" - журнал WAL: запись идёт через одно соединение, а чтение - через пул
+# соединений только для чтения, которые не ждут, пока пишущее сделает fsync
+STORAGE_PROFILES = {
+    "default": {
+        "pragmas": {},
+        "readers": 0,
+    },
+    "wal": {
+        "pragmas": {
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "mmap_size": 64 * 1024 * 1024,
+            "cache_size": -16000,  # в КиБ, то есть около 16 МБ
+            "temp_store": "MEMORY",
+        },
+        "readers": 2,
+    },
+}
+
+# Размер страницы в списках задач, желаний и фильмов
+PAGE_SIZE = 5
+
+# Сколько страниц списков и отдельных записей держать в кэше
+LIST_CACHE_SIZE = 256
+ENTITY_CACHE_SIZE = 512
+
+# Наборы колонок в порядке from_row моделей. Их читают списки, get_* и
+# мутаторы через RETURNING
+TASK_COLUMNS = "id, title, description, task_type, status, created_by, created_at"
+WISH_COLUMNS = "id, title, description, image_id, wish_type, created_by, created_at"
+MOVIE_COLUMNS = "id, title, description, movie_type, created_by, rating, created_at, watched, watch_date, review"
+
+# Колонки, которые переезжают между tasks и tasks_archive
+ARCHIVE_COLUMNS = "id, title, description, task_type, status, created_by, created_at, completed_at"
+
+# Сколько выполненных задач переносить в архив за одну транзакцию
+ARCHIVE_BATCH_SIZE = 200
+
+# Outbox уведомлений: сколько строк доставлять за раз, сколько попыток
+# давать строке и базовая задержка повтора (удваивается с каждой попыткой)
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_DELAY = 30
+
+# Сколько записей group commit объединяет в одну транзакцию, даже если
+# окно ещё не истекло
+GROUP_COMMIT_MAX_BATCH = 64
+
+# Направление листания, записывается первым символом курсора
+FORWARD = "n"
+BACKWARD = "p"
+
+# Формат курсоров до перехода на эпохи, их ещё можно встретить в старых сообщениях
+LEGACY_CURSOR_FORMAT = "%Y%m%d%H%M%S%f"
+
+def encode_cursor(direction: str, created_at: int, item_id: int) -> str:
+    """Упаковывает ключ (created_at, id) в курсор для callback_data"""
+    return f"{direction}{to_epoch(created_at)}-{item_id}"
+
+def decode_cursor(cursor: Optional[str]) -> tuple:
+    """Распаковывает курсор в (направление, (created_at, id)).
+
+    Для пустого или битого курсора (например, из старых сообщений с номером
+    страницы) возвращает первую страницу.
+    """
+    try:
+        direction = cursor[0]
+        stamp, item_id = cursor[1:].split("-")
+        if direction not in (FORWARD, BACKWARD):
+            raise ValueError(direction)
+        if len(stamp) == len("YYYYmmddHHMMSSffffff"):
+            created_at = to_epoch(datetime.strptime(stamp, LEGACY_CURSOR_FORMAT))
+        else:
+            created_at = int(stamp)
+        return direction, (created_at, int(item_id))
+    except (TypeError, ValueError, IndexError):
+        return FORWARD, None
+
+class Page:
+    """Одна страница списка и курсоры для перехода к соседним страницам"""
+
+    def __init__(self, items: list = None, has_prev: bool = False, has_next: bool = False,
+                 prev_cursor: str = None, next_cursor: str = None):
+        self.items = items or []
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.prev_cursor = prev_cursor
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+class SearchHit:
+    """Одна находка поиска: тип записи ("task", "wish", "movie"), её id,
+    название и фрагмент текста, где найденные слова обрамлены
+    SNIPPET_START и SNIPPET_END"""
+    __slots__ = ("kind", "id", "title", "snippet", "created_by")
+
+    def __init__(self, kind: str, id: int, title: str, snippet: str, created_by: int):
+        self.kind = kind
+        self.id = id
+        self.title = title
+        self.snippet = snippet
+        self.created_by = created_by
+
+# Маркеры подсветки во фрагментах поиска. Управляющие символы не встречаются
+# в тексте, поэтому их можно заменить на разметку после экранирования
+SNIPPET_START = "\x02"
+SNIPPET_END = "\x03"
+SNIPPET_TOKENS = 10
+
+SEARCH_TOKEN_RE = re.compile(r"\w+")
+
+def build_match_query(text: str) -> Optional[str]:
+    """Превращает ввод пользователя в запрос FTS5: все слова как префиксы.
+
+    Слова берутся в кавычки, поэтому операторы FTS5 и спецсимволы из
+    ввода не ломают запрос.
+    """
+    tokens = SEARCH_TOKEN_RE.findall(text.lower())
+    if not tokens:
+        return None
+    return " ".join(f'"{token}"*' for token in tokens)
+
+def cached_list(table: str):
+    """Кэширует страницы списка table для пары, к которой относится user_id"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, user_id: int, *args, **kwargs):
+            key = (method.__name__, user_id, args, tuple(sorted(kwargs.items())))
+            return self.list_cache.get_or_load(
+                self._couple(user_id), table, key,
+                lambda: method(self, user_id, *args, **kwargs)
+            )
+        return wrapper
+    return decorator
+
+def with_outbox(method):
+    """Даёт мутатору параметр notify - список уведомлений (chat_id, method,
+    kwargs). Они пишутся в outbox в той же транзакции, что и изменение, и
+    только если мутатор что-то изменил (вернул не None и не False)."""
+    @functools.wraps(method)
+    def wrapper(self, *args, notify=(), **kwargs):
+        if not notify:
+            return method(self, *args, **kwargs)
+        if self._batching:
+            # Внутри run_batch транзакцию и её commit ведёт пачка
+            result = method(self, *args, **kwargs)
+            if result:
+                self._add_to_outbox(notify)
+            return result
+
+        self._batching = True
+        try:
+            result = method(self, *args, **kwargs)
+            if result:
+                self._add_to_outbox(notify)
+        except Exception:
+            self.conn.rollback()
+            self._commit_hooks.clear()
+            raise
+        finally:
+            self._batching = False
+        self._commit()
+        return result
+    return wrapper
+
 class Database:
-    def __init__(self, db_file: str = "couple_tasks.db"):
+    def __init__(self, db_file: str = "couple_tasks.db", profile: str = "default"):
         self.db_file = db_file
-        self.conn = sqlite3.connect(db_file)
-        self.cursor = self.conn.cursor()
-        self.create_tables()
-        
-    def create_tables(self):
-        self.cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            partner_id INTEGER
-        )
-        """)
+        self.profile = STORAGE_PROFILES[profile]
+        # Соединения передаются между потоками AsyncDatabase, но каждое
+        # в один момент времени используется только одним потоком
+        self.conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._apply_pragmas(self.conn)
+        migrate(self.conn)
+
+        # Пары меняются только в add_user, поэтому держим их в памяти
+        # и не ходим в базу за партнёром на каждый запрос списка
+        self._partners = dict(self.conn.execute("SELECT user_id, partner_id FROM users"))
+        # Обновления кэшей, которые ждут commit, и признак пачки group commit
+        self._commit_hooks = []
+        self._batching = False
+        # Вызывается после commit, который добавил строки в outbox
+        self._outbox_listener = None
+        self.list_cache = ListCache(LIST_CACHE_SIZE)
+        self.entity_cache = EntityCache(ENTITY_CACHE_SIZE)
+
+        # Пул соединений только для чтения. Для базы в памяти его не бывает:
+        # другие соединения её просто не увидят
+        self._readers = None
+        if self.profile["readers"] and db_file != ":memory:":
+            self._readers = queue.Queue()
+            uri = Path(db_file).absolute().as_uri() + "?mode=ro"
+            for _ in range(self.profile["readers"]):
+                reader = sqlite3.connect(uri, uri=True, check_same_thread=False)
+                self._apply_pragmas(reader)
+                self._readers.put(reader)
+
+    @property
+    def readers(self) -> int:
+        """Сколько соединений для чтения в пуле"""
+        return self._readers.qsize() if self._readers else 0
+
+    def _apply_pragmas(self, conn: sqlite3.Connection):
+        for name, value in self.profile["pragmas"].items():
+            conn.execute(f"PRAGMA {name} = {value}")
+
+    @contextmanager
+    def _reader(self):
+        """Берёт соединение для чтения из пула, а без пула - пишущее"""
+        if self._readers is None:
+            yield self.conn
+            return
+
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put(conn)
+
+    def _read(self, query: str, params=()) -> list:
+        with self._reader() as conn:
+            return conn.execute(query, params).fetchall()
+
+    def _read_one(self, query: str, params=()):
+        with self._reader() as conn:
+            return conn.execute(query, params).fetchone()
+
+    def close(self):
+        if self._readers is not None:
+            while not self._readers.empty():
+                self._readers.get().close()
+        self.conn.close()
         
-        self.cursor.execute("""
-        CREATE TABLE IF NOT EXISTS tasks (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            description TEXT,
-            task_type TEXT NOT NULL,
-            status TEXT NOT NULL,
-            created_by INTEGER NOT NULL,
-            created_at TIMESTAMP NOT NULL
-        )
-        """)
-
-        self.cursor.execute("""
-        CREATE TABLE IF NOT EXISTS wishes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            description TEXT,
-            image_id TEXT,
-            wish_type TEXT NOT NULL,
-            created_by INTEGER NOT NULL,
-            created_at TIMESTAMP NOT NULL
-        )
-        """)
-
-        self.cursor.execute("""
-        CREATE TABLE IF NOT EXISTS movies (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            description TEXT,
-            movie_type TEXT NOT NULL,
-            created_by INTEGER NOT NULL,
-            rating INTEGER,
-            created_at TIMESTAMP NOT NULL,
-            watched BOOLEAN DEFAULT 0,
-            watch_date TIMESTAMP,
-            review TEXT,
-            FOREIGN KEY (created_by) REFERENCES users(id)
-        )
-        """)
-        self.conn.commit()
+    def _commit(self):
+        """Фиксирует транзакцию и выполняет действия, отложенные до commit.
+
+        Внутри пачки group commit (run_batch) ничего не делает: пачка
+        коммитится один раз целиком.
+        """
+        if self._batching:
+            return
+        try:
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            self._commit_hooks.clear()
+            raise
+        hooks, self._commit_hooks = self._commit_hooks, []
+        for hook in hooks:
+            hook()
+
+    def _on_commit(self, hook):
+        """Откладывает обновление кэшей до commit, чтобы читатели не
+        закэшировали данные, которых ещё нет в базе"""
+        self._commit_hooks.append(hook)
+
+    def run_batch(self, calls: list) -> list:
+        """Выполняет пачку записей в одной транзакции с одним commit.
+
+        Каждая запись идёт в своей точке сохранения: ошибка откатывает только
+        её, остальные записи пачки сохраняются. Возвращает список пар
+        (успех, результат или исключение) в порядке calls.
+        """
+        results = []
+        self.conn.execute("BEGIN")
+        self._batching = True
+        try:
+            for call in calls:
+                self.conn.execute("SAVEPOINT batch_write")
+                hooks = len(self._commit_hooks)
+                try:
+                    results.append((True, call()))
+                    self.conn.execute("RELEASE batch_write")
+                except Exception as e:
+                    self.conn.execute("ROLLBACK TO batch_write")
+                    self.conn.execute("RELEASE batch_write")
+                    del self._commit_hooks[hooks:]
+                    results.append((False, e))
+        except Exception:
+            self.conn.rollback()
+            self._commit_hooks.clear()
+            raise
+        finally:
+            self._batching = False
+        self._commit()
+        return results
         
     def add_user(self, user_id: int, partner_id: int = None):
-        self.cursor.execute("INSERT OR REPLACE INTO users VALUES (?, ?)", (user_id, partner_id))
-        self.conn.commit()
+        self.conn.execute("INSERT OR REPLACE INTO users VALUES (?, ?)", (user_id, partner_id))
+        self._on_commit(lambda: self._set_partner(user_id, partner_id))
+        self._commit()
+
+    def _set_partner(self, user_id: int, partner_id: Optional[int]):
+        self._partners[user_id] = partner_id
+        # Пара поменялась, ключи кэша списков больше не годятся
+        self.list_cache.clear()
         
     def get_partner_id(self, user_id: int) -> Optional[int]:
-        self.cursor.execute("SELECT partner_id FROM users WHERE user_id = ?", (user_id,))
-        result = self.cursor.fetchone()
-        return result[0] if result else None
+        return self._partners.get(user_id)
+
+    def _couple(self, user_id: int) -> tuple:
+        """Ключ пары: оба пользователя видят одни и те же списки"""
+        partner_id = self.get_partner_id(user_id)
+        return tuple(sorted({user_id, partner_id} - {None}))
+
+    def _invalidate_lists(self, table: str, created_by: int):
+        couple = self._couple(created_by)
+        self._on_commit(functools.partial(self.list_cache.invalidate, couple, table))
+        # Счётчики главного меню зависят от всех списков пары
+        self._on_commit(functools.partial(self.list_cache.invalidate, couple, "dashboard"))
+
+    def _cache_entity(self, table: str, entity):
+        self._on_commit(functools.partial(self.entity_cache.put, (table, entity.id), entity))
+
+    def _forget_entity(self, table: str, entity_id: int):
+        self._on_commit(functools.partial(self.entity_cache.discard, (table, entity_id)))
         
+    @with_outbox
     def add_task(self, task: Task) -> int:
-        self.cursor.execute("""
-        INSERT INTO tasks (title, description, task_type, status, created_by, created_at)
-        VALUES (?, ?, ?, ?, ?, ?)
-        """, (task.title, task.description, task.task_type.value, task.status.value, task.created_by, task.created_at))
-        self.conn.commit()
-        return self.cursor.lastrowid
+        cur = self.conn.execute("""
+        INSERT INTO tasks (title, description, task_type, status, created_by, created_at, completed_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (task.title, task.description, task.task_type.value, task.status.value, task.created_by,
+              to_epoch(task.created_at),
+              to_epoch(task.created_at) if task.status == TaskStatus.COMPLETED else None))
+        self._invalidate_lists("tasks", task.created_by)
+        self._commit()
+        return cur.lastrowid
         
-    def get_tasks(self, user_id: int) -> List[Task]:
+    def _fetch_page(self, table: str, columns: str, where: str, branches: list,
+                    cursor: Optional[str] = None, page_size: Optional[int] = None,
+                    factory=None) -> Page:
+        """Читает страницу списка по keyset-курсору (created_at, id).
+
+        Для каждого набора параметров из branches строится ветка UNION ALL с
+        условием where. Ветки идут по своим индексам уже отсортированными,
+        поэтому SQLite сливает их без сканирования и временного B-дерева,
+        а страница N стоит столько же, сколько первая. При page_size=None
+        возвращается весь список. Строки превращаются в объекты через factory.
+        """
+        if not branches:
+            return Page()
+
+        direction, key = decode_cursor(cursor)
+        if key is not None:
+            where += " AND (created_at, id) > (?, ?)" if direction == BACKWARD else " AND (created_at, id) < (?, ?)"
+        order = "ASC" if direction == BACKWARD else "DESC"
+
+        query = " UNION ALL ".join(f"SELECT {columns} FROM {table} WHERE {where}" for _ in branches)
+        query += f" ORDER BY created_at {order}, id {order}"
+        params = []
+        for branch in branches:
+            params.extend(branch)
+            if key is not None:
+                params.extend(key)
+        if page_size is not None:
+            # Берём одну лишнюю строку, чтобы понять, есть ли следующая страница
+            query += " LIMIT ?"
+            params.append(page_size + 1)
+
+        rows = self._read(query, params)
+        has_more = page_size is not None and len(rows) > page_size
+        rows = rows[:page_size]
+
+        if direction == BACKWARD:
+            rows.reverse()
+            page = Page(rows, has_prev=has_more, has_next=True)
+        else:
+            page = Page(rows, has_prev=key is not None, has_next=has_more)
+
+        if rows:
+            created_at = columns.split(", ").index("created_at")
+            page.prev_cursor = encode_cursor(BACKWARD, rows[0][created_at], rows[0][0])
+            page.next_cursor = encode_cursor(FORWARD, rows[-1][created_at], rows[-1][0])
+        if factory is not None:
+            page.items = [factory(row) for row in rows]
+        return page
+
+    def _select_tasks(self, branches: list, cursor: Optional[str] = None,
+                      page_size: Optional[int] = PAGE_SIZE, table: str = "tasks") -> Page:
+        """Выбирает задачи по веткам (created_by, task_type, status).
+
+        Каждая ветка читается по индексу idx_tasks_owner_type_status (для
+        all_tasks - ещё и по такому же индексу архива).
+        """
+        return self._fetch_page(
+            table,
+            TASK_COLUMNS,
+            "created_by = ? AND task_type = ? AND status = ?",
+            [(created_by, task_type.value, status.value)
+             for created_by, task_type, status in branches if created_by is not None],
+            cursor, page_size, Task.from_row
+        )
+
+    @cached_list("tasks")
+    def get_tasks(self, user_id: int, cursor: Optional[str] = None,
+                  page_size: Optional[int] = PAGE_SIZE) -> Page:
         partner_id = self.get_partner_id(user_id)
         
         # Получаем ВСЕ задачи, связанные с пользователем и партнёром
-        self.cursor.execute("""
-        SELECT id, title, description, task_type, status, created_by, created_at
-        FROM tasks
-        WHERE created_by = ? OR created_by = ?
-        ORDER BY created_at DESC
-        """, (user_id, partner_id or -1))  # Используем -1 если партнёра нет
-        
-        tasks = []
-        for row in self.cursor.fetchall():
-            task = Task(
-                id=row[0],
-                title=row[1],
-                description=row[2],
-                task_type=TaskType(row[3]),
-                status=TaskStatus(row[4]),
-                created_by=row[5],
-                created_at=datetime.fromisoformat(row[6])
-            )
-            tasks.append(task)
-        
-        return tasks
+        return self._select_tasks([
+            (created_by, task_type, status)
+            for created_by in (user_id, partner_id)
+            for task_type in TaskType
+            for status in TaskStatus
+        ], cursor, page_size)
     
-    def get_user_tasks(self, user_id: int) -> List[Task]:
+    @cached_list("tasks")
+    def get_user_tasks(self, user_id: int, cursor: Optional[str] = None,
+                       page_size: Optional[int] = PAGE_SIZE) -> Page:
         """Получает задачи, которые предназначены для пользователя"""
         partner_id = self.get_partner_id(user_id)
-        if not partner_id:
-            partner_id = -1  # Используем -1 если партнёра нет
         
-        self.cursor.execute("""
-        SELECT id, title, description, task_type, status, created_by, created_at
-        FROM tasks
-        WHERE ((created_by = ? AND task_type = ?) OR
-            (created_by = ? AND task_type = ?) OR
-            (task_type = ? AND (created_by = ? OR created_by = ?)))
-        AND status = ?
-        ORDER BY created_at DESC
-        """, (user_id, TaskType.FOR_ME.value, 
-            partner_id, TaskType.FOR_PARTNER.value, 
-            TaskType.FOR_BOTH.value, user_id, partner_id,
-            TaskStatus.ACTIVE.value))
-
-        tasks = []
-        for row in self.cursor.fetchall():
-            task = Task(
-                id=row[0],
-                title=row[1],
-                description=row[2],
-                task_type=TaskType(row[3]),
-                status=TaskStatus(row[4]),
-                created_by=row[5],
-                created_at=datetime.fromisoformat(row[6])
-            )
-            tasks.append(task)
-        
-        return tasks
+        return self._select_tasks([
+            (user_id, TaskType.FOR_ME, TaskStatus.ACTIVE),
+            (partner_id, TaskType.FOR_PARTNER, TaskStatus.ACTIVE),
+            (user_id, TaskType.FOR_BOTH, TaskStatus.ACTIVE),
+            (partner_id, TaskType.FOR_BOTH, TaskStatus.ACTIVE),
+        ], cursor, page_size)
     
-    def get_partner_tasks(self, user_id: int) -> List[Task]:
+    @cached_list("tasks")
+    def get_partner_tasks(self, user_id: int, cursor: Optional[str] = None,
+                          page_size: Optional[int] = PAGE_SIZE) -> Page:
         """Получает задачи, которые предназначены для партнёра"""
         partner_id = self.get_partner_id(user_id)
         if not partner_id:
-            return []  # Если партнёра нет, то и задач для него нет
-        
-        self.cursor.execute("""
-        SELECT id, title, description, task_type, status, created_by, created_at
-        FROM tasks
-        WHERE ((created_by = ? AND task_type = ?) OR
-            (created_by = ? AND task_type = ?))
-        AND status = ?
-        ORDER BY created_at DESC
-        """, (user_id, TaskType.FOR_PARTNER.value, 
-            partner_id, TaskType.FOR_ME.value,
-            TaskStatus.ACTIVE.value))
+            return Page()  # Если партнёра нет, то и задач для него нет
         
-        tasks = []
-        for row in self.cursor.fetchall():
-            task = Task(
-                id=row[0],
-                title=row[1],
-                description=row[2],
-                task_type=TaskType(row[3]),
-                status=TaskStatus(row[4]),
-                created_by=row[5],
-                created_at=datetime.fromisoformat(row[6])
-            )
-            tasks.append(task)
-        
-        return tasks
+        return self._select_tasks([
+            (user_id, TaskType.FOR_PARTNER, TaskStatus.ACTIVE),
+            (partner_id, TaskType.FOR_ME, TaskStatus.ACTIVE),
+        ], cursor, page_size)
     
-    def get_common_tasks(self, user_id: int) -> List[Task]:
+    @cached_list("tasks")
+    def get_common_tasks(self, user_id: int, cursor: Optional[str] = None,
+                         page_size: Optional[int] = PAGE_SIZE) -> Page:
         """Получает общие задачи"""
         partner_id = self.get_partner_id(user_id)
         
-        self.cursor.execute("""
-        SELECT id, title, description, task_type, status, created_by, created_at
-        FROM tasks
-        WHERE task_type = ? AND (created_by = ? OR created_by = ?)
-        AND status = ?
-        ORDER BY created_at DESC
-        """, (TaskType.FOR_BOTH.value, user_id, partner_id or -1,
-            TaskStatus.ACTIVE.value))
-        
-        tasks = []
-        for row in self.cursor.fetchall():
-            task = Task(
-                id=row[0],
-                title=row[1],
-                description=row[2],
-                task_type=TaskType(row[3]),
-                status=TaskStatus(row[4]),
-                created_by=row[5],
-                created_at=datetime.fromisoformat(row[6])
-            )
-            tasks.append(task)
-        
-        return tasks
+        return self._select_tasks([
+            (user_id, TaskType.FOR_BOTH, TaskStatus.ACTIVE),
+            (partner_id, TaskType.FOR_BOTH, TaskStatus.ACTIVE),
+        ], cursor, page_size)
         
     def get_task(self, task_id: int) -> Optional[Task]:
-        self.cursor.execute("""
-        SELECT id, title, description, task_type, status, created_by, created_at
-        FROM tasks
-        WHERE id = ?
-        """, (task_id,))
+        return self.entity_cache.get_or_load(("tasks", task_id), lambda: self._load_task(task_id))
+
+    def _load_task(self, task_id: int) -> Optional[Task]:
+        row = self._read_one(f"SELECT {TASK_COLUMNS} FROM all_tasks WHERE id = ?", (task_id,))
         
-        row = self.cursor.fetchone()
         if not row:
             return None
             
-        return Task(
-            id=row[0],
-            title=row[1],
-            description=row[2],
-            task_type=TaskType(row[3]),
-            status=TaskStatus(row[4]),
-            created_by=row[5],
-            created_at=datetime.fromisoformat(row[6])
-        )
+        return Task.from_row(row)
+
+    def _store_task(self, row) -> Optional[Task]:
+        """Готовит обновление кэшей строкой из RETURNING и возвращает задачу"""
+        if not row:
+            return None
+        task = Task.from_row(row)
+        self._cache_entity("tasks", task)
+        self._invalidate_lists("tasks", task.created_by)
+        return task
         
-    def update_task(self, task: Task) -> bool:
-        self.cursor.execute("""
+    def _update_task(self, task_id: int, status: TaskStatus, assignments: str, params: tuple) -> Optional[Task]:
+        """Выполняет UPDATE задачи и возвращает её новую версию.
+
+        completed_at ставится при первом переходе в выполненные и сбрасывается
+        при возврате в активные. Задачу из архива UPDATE не найдёт - тогда
+        она сначала переезжает обратно в tasks.
+        """
+        query = f"""
         UPDATE tasks
-        SET title = ?, description = ?, task_type = ?, status = ?
+        SET {assignments},
+            completed_at = CASE WHEN ? = ? THEN COALESCE(completed_at, ?) END
         WHERE id = ?
-        """, (task.title, task.description, task.task_type.value, task.status.value, task.id))
-        self.conn.commit()
-        return self.cursor.rowcount > 0
+        RETURNING {TASK_COLUMNS}
+        """
+        values = (*params, status.value, TaskStatus.COMPLETED.value, to_epoch(datetime.now()), task_id)
+        row = self.conn.execute(query, values).fetchone()
+        if row is None and self._unarchive_task(task_id):
+            row = self.conn.execute(query, values).fetchone()
+        task = self._store_task(row)
+        self._commit()
+        return task
+
+    def _unarchive_task(self, task_id: int) -> bool:
+        """Возвращает задачу из архива в tasks (без commit)"""
+        cur = self.conn.execute(
+            f"INSERT INTO tasks ({ARCHIVE_COLUMNS}) SELECT {ARCHIVE_COLUMNS} FROM tasks_archive WHERE id = ?",
+            (task_id,)
+        )
+        if not cur.rowcount:
+            return False
+        self.conn.execute("DELETE FROM tasks_archive WHERE id = ?", (task_id,))
+        return True
+        
+    @with_outbox
+    def update_task(self, task: Task) -> Optional[Task]:
+        """Обновляет задачу и возвращает её новую версию (None, если задачи нет)"""
+        return self._update_task(
+            task.id, task.status,
+            "title = ?, description = ?, task_type = ?, status = ?",
+            (task.title, task.description, task.task_type.value, task.status.value)
+        )
+
+    @with_outbox
+    def update_task_status(self, task_id: int, status: TaskStatus) -> Optional[Task]:
+        """Меняет статус одним запросом и возвращает обновлённую задачу"""
+        return self._update_task(task_id, status, "status = ?", (status.value,))
         
+    @with_outbox
     def delete_task(self, task_id: int) -> bool:
-        self.cursor.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
-        self.conn.commit()
-        return self.cursor.rowcount > 0
+        cur = self.conn.execute("DELETE FROM tasks WHERE id = ? RETURNING created_by", (task_id,))
+        row = cur.fetchone() or self.conn.execute(
+            "DELETE FROM tasks_archive WHERE id = ? RETURNING created_by", (task_id,)
+        ).fetchone()
+        self._forget_entity("tasks", task_id)
+        if row:
+            self._invalidate_lists("tasks", row[0])
+        self._commit()
+        return row is not None
+
+    def archive_completed_tasks(self, older_than: datetime, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+        """Переносит в архив пачку задач, выполненных раньше older_than.
+
+        Возвращает число перенесённых задач, 0 - переносить больше нечего.
+        Списки и кэши не сбрасываются: выполненные задачи читаются через
+        all_tasks, и для читателя перенос ничего не меняет.
+        """
+        # Идёт по idx_tasks_status_completed_at: у выполненных задач
+        # completed_at всегда задан (см. миграцию 10)
+        ids = [row[0] for row in self.conn.execute("""
+        SELECT id FROM tasks
+        WHERE status = ? AND completed_at < ?
+        ORDER BY completed_at
+        LIMIT ?
+        """, (TaskStatus.COMPLETED.value, to_epoch(older_than), batch_size))]
+        if not ids:
+            return 0
+
+        placeholders = ", ".join("?" * len(ids))
+        self.conn.execute(
+            f"INSERT INTO tasks_archive ({ARCHIVE_COLUMNS}) SELECT {ARCHIVE_COLUMNS} FROM tasks WHERE id IN ({placeholders})",
+            ids
+        )
+        self.conn.execute(f"DELETE FROM tasks WHERE id IN ({placeholders})", ids)
+        self._commit()
+        return len(ids)
 
+    @with_outbox
     def add_wish(self, wish: Wish) -> int:
-        self.cursor.execute("""
+        cur = self.conn.execute("""
         INSERT INTO wishes (title, description, image_id, wish_type, created_by, created_at)
         VALUES (?, ?, ?, ?, ?, ?)
-        """, (wish.title, wish.description, wish.image_id, wish.wish_type.value, wish.created_by, wish.created_at))
-        self.conn.commit()
-        return self.cursor.lastrowid
+        """, (wish.title, wish.description, wish.image_id, wish.wish_type.value, wish.created_by, to_epoch(wish.created_at)))
+        self._invalidate_lists("wishes", wish.created_by)
+        self._commit()
+        return cur.lastrowid
         
-    def get_wishes(self, user_id: int) -> List[Wish]:
+    def _select_wishes(self, where: str, branches: list, cursor: Optional[str] = None,
+                       page_size: Optional[int] = PAGE_SIZE) -> Page:
+        return self._fetch_page(
+            "wishes",
+            WISH_COLUMNS,
+            where, branches, cursor, page_size, Wish.from_row
+        )
+
+    @cached_list("wishes")
+    def get_wishes(self, user_id: int, cursor: Optional[str] = None,
+                   page_size: Optional[int] = PAGE_SIZE) -> Page:
         partner_id = self.get_partner_id(user_id)
         
-        self.cursor.execute("""
-        SELECT id, title, description, image_id, wish_type, created_by, created_at
-        FROM wishes
-        WHERE created_by = ? OR created_by = ?
-        ORDER BY created_at DESC
-        """, (user_id, partner_id or -1))
-        
-        wishes = []
-        for row in self.cursor.fetchall():
-            wish = Wish(
-                id=row[0],
-                title=row[1],
-                description=row[2],
-                image_id=row[3],
-                wish_type=WishType(row[4]),
-                created_by=row[5],
-                created_at=datetime.fromisoformat(row[6])
-            )
-            wishes.append(wish)
-        
-        return wishes
-        
-    def get_my_wishes(self, user_id: int) -> List[Wish]:
-        self.cursor.execute("""
-        SELECT id, title, description, image_id, wish_type, created_by, created_at
-        FROM wishes
-        WHERE created_by = ? AND wish_type = ?
-        ORDER BY created_at DESC
-        """, (user_id, WishType.MY_WISH.value))
-        
-        wishes = []
-        for row in self.cursor.fetchall():
-            wish = Wish(
-                id=row[0],
-                title=row[1],
-                description=row[2],
-                image_id=row[3],
-                wish_type=WishType(row[4]),
-                created_by=row[5],
-                created_at=datetime.fromisoformat(row[6])
-            )
-            wishes.append(wish)
+        # Две ветки по индексу idx_wishes_owner сливаются без сортировки
+        return self._select_wishes(
+            "created_by = ?",
+            [(user_id,), (partner_id or -1,)],
+            cursor, page_size
+        )
         
-        return wishes
+    @cached_list("wishes")
+    def get_my_wishes(self, user_id: int, cursor: Optional[str] = None,
+                      page_size: Optional[int] = PAGE_SIZE) -> Page:
+        return self._select_wishes(
+            "created_by = ? AND wish_type = ?",
+            [(user_id, WishType.MY_WISH.value)],
+            cursor, page_size
+        )
         
-    def get_partner_wishes(self, user_id: int) -> List[Wish]:
+    @cached_list("wishes")
+    def get_partner_wishes(self, user_id: int, cursor: Optional[str] = None,
+                           page_size: Optional[int] = PAGE_SIZE) -> Page:
         partner_id = self.get_partner_id(user_id)
         if not partner_id:
-            return []
-        
-        self.cursor.execute("""
-        SELECT id, title, description, image_id, wish_type, created_by, created_at
-        FROM wishes
-        WHERE created_by = ? AND wish_type = ?
-        ORDER BY created_at DESC
-        """, (partner_id, WishType.MY_WISH.value))
-        
-        wishes = []
-        for row in self.cursor.fetchall():
-            wish = Wish(
-                id=row[0],
-                title=row[1],
-                description=row[2],
-                image_id=row[3],
-                wish_type=WishType(row[4]),
-                created_by=row[5],
-                created_at=datetime.fromisoformat(row[6])
-            )
-            wishes.append(wish)
+            return Page()
         
-        return wishes
+        return self._select_wishes(
+            "created_by = ? AND wish_type = ?",
+            [(partner_id, WishType.MY_WISH.value)],
+            cursor, page_size
+        )
         
     def get_wish(self, wish_id: int) -> Optional[Wish]:
-        self.cursor.execute("""
-        SELECT id, title, description, image_id, wish_type, created_by, created_at
-        FROM wishes
-        WHERE id = ?
-        """, (wish_id,))
+        return self.entity_cache.get_or_load(("wishes", wish_id), lambda: self._load_wish(wish_id))
+
+    def _load_wish(self, wish_id: int) -> Optional[Wish]:
+        row = self._read_one(f"SELECT {WISH_COLUMNS} FROM wishes WHERE id = ?", (wish_id,))
         
-        row = self.cursor.fetchone()
         if not row:
             return None
             
-        return Wish(
-            id=row[0],
-            title=row[1],
-            description=row[2],
-            image_id=row[3],
-            wish_type=WishType(row[4]),
-            created_by=row[5],
-            created_at=datetime.fromisoformat(row[6])
-        )
+        return Wish.from_row(row)
         
-    def update_wish(self, wish: Wish) -> bool:
-        self.cursor.execute("""
+    @with_outbox
+    def update_wish(self, wish: Wish) -> Optional[Wish]:
+        """Обновляет желание и возвращает его новую версию (None, если желания нет)"""
+        cur = self.conn.execute(f"""
         UPDATE wishes
         SET title = ?, description = ?, image_id = ?, wish_type = ?
         WHERE id = ?
+        RETURNING {WISH_COLUMNS}
         """, (wish.title, wish.description, wish.image_id, wish.wish_type.value, wish.id))
-        self.conn.commit()
-        return self.cursor.rowcount > 0
+        row = cur.fetchone()
+        if not row:
+            self._commit()
+            return None
+        wish = Wish.from_row(row)
+        self._cache_entity("wishes", wish)
+        self._invalidate_lists("wishes", wish.created_by)
+        self._commit()
+        return wish
         
+    @with_outbox
     def delete_wish(self, wish_id: int) -> bool:
-        self.cursor.execute("DELETE FROM wishes WHERE id = ?", (wish_id,))
-        self.conn.commit()
-        return self.cursor.rowcount > 0
+        cur = self.conn.execute("DELETE FROM wishes WHERE id = ? RETURNING created_by", (wish_id,))
+        row = cur.fetchone()
+        self._forget_entity("wishes", wish_id)
+        if row:
+            self._invalidate_lists("wishes", row[0])
+        self._commit()
+        return row is not None
 
-    def get_completed_tasks(self, user_id: int) -> List[Task]:
-        """Получает выполненные задачи пользователя"""
+    @cached_list("tasks")
+    def get_completed_tasks(self, user_id: int, cursor: Optional[str] = None,
+                            page_size: Optional[int] = PAGE_SIZE) -> Page:
+        """Получает выполненные задачи пользователя, в том числе из архива"""
         partner_id = self.get_partner_id(user_id)
-        if not partner_id:
-            partner_id = -1  # Используем -1 если партнёра нет
-        
-        self.cursor.execute("""
-        SELECT id, title, description, task_type, status, created_by, created_at
-        FROM tasks
-        WHERE ((created_by = ? AND task_type = ?) OR
-            (created_by = ? AND task_type = ?) OR
-            (task_type = ? AND (created_by = ? OR created_by = ?)) OR
-            (created_by = ? AND task_type = ?) OR
-            (created_by = ? AND task_type = ?))
-        AND status = ?
-        ORDER BY created_at DESC
-        """, (user_id, TaskType.FOR_ME.value, 
-            partner_id, TaskType.FOR_PARTNER.value, 
-            TaskType.FOR_BOTH.value, user_id, partner_id,
-            user_id, TaskType.FOR_PARTNER.value,
-            partner_id, TaskType.FOR_ME.value,
-            TaskStatus.COMPLETED.value))
-        
-        tasks = []
-        for row in self.cursor.fetchall():
-            task = Task(
-                id=row[0],
-                title=row[1],
-                description=row[2],
-                task_type=TaskType(row[3]),
-                status=TaskStatus(row[4]),
-                created_by=row[5],
-                created_at=datetime.fromisoformat(row[6])
-            )
-            tasks.append(task)
         
-        return tasks
+        return self._select_tasks([
+            (created_by, task_type, TaskStatus.COMPLETED)
+            for created_by in (user_id, partner_id)
+            for task_type in TaskType
+        ], cursor, page_size, table="all_tasks")
 
-    def add_movie(self, title: str, description: str, movie_type: str, created_by: int) -> int:
-        self.cursor.execute("""
+    @with_outbox
+    def add_movie(self, movie: Movie) -> int:
+        cur = self.conn.execute("""
         INSERT INTO movies (title, description, movie_type, created_by, created_at)
         VALUES (?, ?, ?, ?, ?)
-        """, (title, description, movie_type, created_by, datetime.now()))
-        self.conn.commit()
-        return self.cursor.lastrowid
-
-    def get_my_movies(self, user_id: int) -> List[dict]:
-        self.cursor.execute("""
-        SELECT id, title, description, movie_type, rating, created_at, watched, watch_date, review
-        FROM movies
-        WHERE created_by = ? AND movie_type = 'my_movies'
-        ORDER BY created_at DESC
-        """, (user_id,))
-        
-        movies = []
-        for row in self.cursor.fetchall():
-            movies.append({
-                'id': row[0],
-                'title': row[1],
-                'description': row[2],
-                'movie_type': row[3],
-                'rating': row[4],
-                'created_at': datetime.fromisoformat(row[5]),
-                'watched': bool(row[6]),
-                'watch_date': datetime.fromisoformat(row[7]) if row[7] else None,
-                'review': row[8]
-            })
-        return movies
-
-    def get_partner_movies(self, user_id: int) -> List[dict]:
+        """, (movie.title, movie.description, movie.movie_type.value, movie.created_by, to_epoch(movie.created_at)))
+        self._invalidate_lists("movies", movie.created_by)
+        self._commit()
+        return cur.lastrowid
+
+    def _select_movies(self, where: str, branches: list, cursor: Optional[str] = None,
+                       page_size: Optional[int] = PAGE_SIZE) -> Page:
+        return self._fetch_page(
+            "movies",
+            MOVIE_COLUMNS,
+            where, branches, cursor, page_size, Movie.from_row
+        )
+
+    @cached_list("movies")
+    def get_my_movies(self, user_id: int, cursor: Optional[str] = None,
+                      page_size: Optional[int] = PAGE_SIZE) -> Page:
+        return self._select_movies(
+            "created_by = ? AND movie_type = ?",
+            [(user_id, MovieType.MY_MOVIES.value)],
+            cursor, page_size
+        )
+
+    @cached_list("movies")
+    def get_partner_movies(self, user_id: int, cursor: Optional[str] = None,
+                           page_size: Optional[int] = PAGE_SIZE) -> Page:
         partner_id = self.get_partner_id(user_id)
         if not partner_id:
-            return []
+            return Page()
             
-        self.cursor.execute("""
-        SELECT id, title, description, movie_type, rating, created_at, watched, watch_date, review
-        FROM movies
-        WHERE created_by = ?
-        ORDER BY created_at DESC
-        """, (partner_id,))
-        
-        movies = []
-        for row in self.cursor.fetchall():
-            movies.append({
-                'id': row[0],
-                'title': row[1],
-                'description': row[2],
-                'movie_type': row[3],
-                'rating': row[4],
-                'created_at': datetime.fromisoformat(row[5]),
-                'watched': bool(row[6]),
-                'watch_date': datetime.fromisoformat(row[7]) if row[7] else None,
-                'review': row[8]
-            })
-        return movies
-
-    def get_movie(self, movie_id: int) -> Optional[dict]:
-        self.cursor.execute("""
-        SELECT id, title, description, movie_type, created_by, rating, created_at
-        FROM movies
-        WHERE id = ?
-        """, (movie_id,))
+        return self._select_movies("created_by = ?", [(partner_id,)], cursor, page_size)
+
+    def get_movie(self, movie_id: int) -> Optional[Movie]:
+        return self.entity_cache.get_or_load(("movies", movie_id), lambda: self._load_movie(movie_id))
+
+    def _load_movie(self, movie_id: int) -> Optional[Movie]:
+        row = self._read_one(f"SELECT {MOVIE_COLUMNS} FROM movies WHERE id = ?", (movie_id,))
         
-        row = self.cursor.fetchone()
         if not row:
             return None
             
-        return {
-            'id': row[0],
-            'title': row[1],
-            'description': row[2],
-            'movie_type': row[3],
-            'created_by': row[4],
-            'rating': row[5],
-            'created_at': datetime.fromisoformat(row[6])
-        }
+        return Movie.from_row(row)
 
-    def update_movie(self, movie_id: int, title: str, description: str) -> bool:
+    def _update_movie(self, assignments: str, params: tuple) -> Optional[Movie]:
+        """Выполняет UPDATE фильма одним запросом и возвращает его новую версию"""
+        cur = self.conn.execute(f"""
+        UPDATE movies
+        SET {assignments}
+        WHERE id = ?
+        RETURNING {MOVIE_COLUMNS}
+        """, params)
+        row = cur.fetchone()
+        if not row:
+            self._commit()
+            return None
+        movie = Movie.from_row(row)
+        self._cache_entity("movies", movie)
+        self._invalidate_lists("movies", movie.created_by)
+        self._commit()
+        return movie
+
+    @with_outbox
+    def update_movie(self, movie_id: int, title: str, description: str) -> Optional[Movie]:
         try:
-            self.cursor.execute("""
-            UPDATE movies
-            SET title = ?, description = ?
-            WHERE id = ?
-            """, (title, description, movie_id))
-            self.conn.commit()
-            return True
-        except:
-            return False
+            return self._update_movie("title = ?, description = ?", (title, description, movie_id))
+        except Exception as e:
+            logging.error(f"Error updating movie: {e}")
+            return None
 
+    @with_outbox
     def delete_movie(self, movie_id: int) -> bool:
-        try:
-            self.cursor.execute("DELETE FROM movies WHERE id = ?", (movie_id,))
-            self.conn.commit()
-            return True
-        except:
-            return False
+        cur = self.conn.execute("DELETE FROM movies WHERE id = ? RETURNING created_by", (movie_id,))
+        row = cur.fetchone()
+        if row:
+            self._forget_entity("movies", movie_id)
+            self._invalidate_lists("movies", row[0])
+        self._commit()
+        return row is not None
 
-    def update_movie_rating(self, movie_id: int, rating: int) -> bool:
+    @with_outbox
+    def update_movie_rating(self, movie_id: int, rating: int) -> Optional[Movie]:
         try:
-            self.cursor.execute("""
-            UPDATE movies
-            SET rating = ?
-            WHERE id = ?
-            """, (rating, movie_id))
-            self.conn.commit()
-            return True
-        except:
-            return False
+            return self._update_movie("rating = ?", (rating, movie_id))
+        except Exception as e:
+            logging.error(f"Error updating movie rating: {e}")
+            return None
 
-    def update_movie_watch_status(self, movie_id: int, watched: bool, watch_date: datetime = None, review: str = None) -> bool:
+    @with_outbox
+    def update_movie_watch_status(self, movie_id: int, watched: bool, watch_date: datetime = None, review: str = None) -> Optional[Movie]:
         try:
-            self.cursor.execute("""
-            UPDATE movies
-            SET watched = ?, watch_date = ?, review = ?
-            WHERE id = ?
-            """, (watched, watch_date.isoformat() if watch_date else None, review, movie_id))
-            self.conn.commit()
-            return True
+            return self._update_movie(
+                "watched = ?, watch_date = ?, review = ?",
+                (watched, to_epoch(watch_date), review, movie_id)
+            )
         except Exception as e:
             logging.error(f"Error updating movie watch status: {e}")
-            return False
+            return None
+
+    def set_outbox_listener(self, listener):
+        """listener() вызывается из пишущего потока после commit с новыми
+        уведомлениями, чтобы доставка не ждала следующего опроса"""
+        self._outbox_listener = listener
+
+    def _add_to_outbox(self, notifications):
+        now = to_epoch(datetime.now())
+        self.conn.executemany("""
+        INSERT INTO outbox (chat_id, method, payload, created_at, next_attempt_at)
+        VALUES (?, ?, ?, ?, ?)
+        """, [
+            (chat_id, method, json.dumps(kwargs, ensure_ascii=False), now, now)
+            for chat_id, method, kwargs in notifications
+        ])
+        if self._outbox_listener is not None:
+            self._on_commit(self._outbox_listener)
+
+    def get_outbox_batch(self, limit: int = OUTBOX_BATCH_SIZE) -> list:
+        """Уведомления, которые пора отправить: (id, chat_id, method, payload).
+        Порядок совпадает с idx_outbox_pending, поэтому доставленные строки
+        не читаются"""
+        return self._read("""
+        SELECT id, chat_id, method, payload FROM outbox
+        WHERE next_attempt_at <= ?
+        ORDER BY next_attempt_at, id
+        LIMIT ?
+        """, (to_epoch(datetime.now()), limit))
+
+    def mark_outbox_delivered(self, outbox_id: int):
+        self.conn.execute(
+            "UPDATE outbox SET delivered_at = ?, next_attempt_at = NULL WHERE id = ?",
+            (to_epoch(datetime.now()), outbox_id)
+        )
+        self._commit()
+
+    def mark_outbox_failed(self, outbox_id: int, error: str):
+        """Откладывает повтор с удвоением задержки, а после OUTBOX_MAX_ATTEMPTS
+        попыток снимает уведомление с отправки"""
+        self.conn.execute("""
+        UPDATE outbox
+        SET attempts = attempts + 1, last_error = ?,
+            next_attempt_at = CASE WHEN attempts + 1 >= ? THEN NULL
+                                   ELSE ? + ? * (1 << attempts) END
+        WHERE id = ?
+        """, (error, OUTBOX_MAX_ATTEMPTS, to_epoch(datetime.now()), OUTBOX_RETRY_DELAY * 1_000_000, outbox_id))
+        self._commit()
+
+    def mark_outbox_rejected(self, outbox_id: int, error: str):
+        """Снимает уведомление с отправки без повторов: Telegram отказал
+        окончательно (бот заблокирован, чат не найден и т.п.)"""
+        self.conn.execute("""
+        UPDATE outbox SET attempts = attempts + 1, last_error = ?, next_attempt_at = NULL
+        WHERE id = ?
+        """, (error, outbox_id))
+        self._commit()
+
+    def purge_outbox(self, older_than: datetime) -> int:
+        """Удаляет уведомления, доставленные раньше older_than"""
+        cur = self.conn.execute("DELETE FROM outbox WHERE delivered_at < ?", (to_epoch(older_than),))
+        self._commit()
+        return cur.rowcount
+
+    def get_update_offset(self) -> Optional[int]:
+        """offset, с которого продолжать getUpdates после перезапуска"""
+        row = self._read_one("SELECT value FROM bot_state WHERE key = 'update_offset'")
+        return row[0] if row else None
+
+    def get_recent_updates(self, limit: int) -> List[int]:
+        """Последние обработанные update_id, от новых к старым"""
+        return [row[0] for row in self._read(
+            "SELECT update_id FROM processed_updates ORDER BY update_id DESC LIMIT ?", (limit,)
+        )]
+
+    def get_update_processed(self, update_id: int) -> bool:
+        return self._read_one("SELECT 1 FROM processed_updates WHERE update_id = ?", (update_id,)) is not None
+
+    def save_received_updates(self, updates: list):
+        """Запоминает тела полученных обновлений (update_id, JSON) до их
+        обработки. Уже обработанные повторы не записываются"""
+        received_at = to_epoch(datetime.now())
+        self.conn.executemany("""
+        INSERT OR IGNORE INTO received_updates (update_id, payload, received_at)
+        SELECT ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM processed_updates WHERE update_id = ?)
+        """, [(update_id, payload, received_at, update_id) for update_id, payload in updates])
+        self._commit()
+
+    def get_received_updates(self) -> List[tuple]:
+        """Полученные, но не обработанные обновления (update_id, JSON) по порядку"""
+        return self._read("SELECT update_id, payload FROM received_updates ORDER BY update_id")
+
+    def mark_updates_processed(self, update_ids: list, offset: int):
+        """Отмечает пачку обновлений обработанными и двигает offset (только
+        вперёд) одной транзакцией"""
+        processed_at = to_epoch(datetime.now())
+        self.conn.executemany(
+            "INSERT OR IGNORE INTO processed_updates (update_id, processed_at) VALUES (?, ?)",
+            [(update_id, processed_at) for update_id in update_ids]
+        )
+        self.conn.executemany(
+            "DELETE FROM received_updates WHERE update_id = ?", [(update_id,) for update_id in update_ids]
+        )
+        self.conn.execute("""
+        INSERT INTO bot_state (key, value) VALUES ('update_offset', ?)
+        ON CONFLICT (key) DO UPDATE SET value = MAX(value, excluded.value)
+        """, (offset,))
+        self._commit()
+
+    def purge_processed_updates(self, older_than: datetime) -> int:
+        """Удаляет записи журнала старше older_than. Telegram хранит
+        недоставленные обновления сутки, более старые повторы не придут"""
+        cur = self.conn.execute(
+            "DELETE FROM processed_updates WHERE processed_at < ?", (to_epoch(older_than),)
+        )
+        self.conn.execute("DELETE FROM received_updates WHERE received_at < ?", (to_epoch(older_than),))
+        self._commit()
+        return cur.rowcount
+
+    def get_fsm_record(self, key: str) -> Optional[tuple]:
+        """Состояние FSM по ключу: (state, data в JSON, updated_at) или None"""
+        return self._read_one("SELECT state, data, updated_at FROM fsm_states WHERE key = ?", (key,))
+
+    def save_fsm_records(self, records: list):
+        """Сохраняет пачку состояний FSM (key, state, data, updated_at) одной
+        транзакцией. Пустые состояния удаляются"""
+        kept, removed = [], []
+        for record in records:
+            if record[1] is None and record[2] == "{}":
+                removed.append((record[0],))
+            else:
+                kept.append(record)
+        self.conn.executemany("""
+        INSERT INTO fsm_states (key, state, data, updated_at) VALUES (?, ?, ?, ?)
+        ON CONFLICT (key) DO UPDATE SET state = excluded.state, data = excluded.data,
+            updated_at = excluded.updated_at
+        """, kept)
+        self.conn.executemany("DELETE FROM fsm_states WHERE key = ?", removed)
+        self._commit()
+
+    def purge_fsm_records(self, older_than: int) -> int:
+        """Удаляет состояния FSM, которые не менялись с older_than (эпоха в мкс)"""
+        cur = self.conn.execute("DELETE FROM fsm_states WHERE updated_at < ?", (older_than,))
+        self._commit()
+        return cur.rowcount
+
+    @cached_list("dashboard")
+    def get_dashboard_counts(self, user_id: int) -> dict:
+        """Счётчики для главного меню одним запросом.
+
+        Каждая ветка UNION ALL группирует строки пары по префиксу своего
+        индекса, поэтому читается только индекс, без сортировки. Раскладка
+        по спискам повторяет условия get_user_tasks, get_partner_tasks и т.д.
+        """
+        partner_id = self.get_partner_id(user_id)
+        owners = (user_id, partner_id or -1)
+        rows = self._read("""
+        SELECT 'tasks', created_by, task_type, status, COUNT(*) FROM tasks
+        WHERE created_by IN (?, ?) GROUP BY created_by, task_type, status
+        UNION ALL
+        SELECT 'tasks', created_by, task_type, status, COUNT(*) FROM tasks_archive
+        WHERE created_by IN (?, ?) GROUP BY created_by, task_type, status
+        UNION ALL
+        SELECT 'wishes', created_by, wish_type, NULL, COUNT(*) FROM wishes
+        WHERE created_by IN (?, ?) GROUP BY created_by, wish_type
+        UNION ALL
+        SELECT 'movies', created_by, movie_type, watched, COUNT(*) FROM movies
+        WHERE created_by IN (?, ?) GROUP BY created_by, movie_type, watched
+        """, owners * 4)
+
+        counts = dict.fromkeys((
+            'my_tasks', 'partner_tasks', 'common_tasks', 'completed_tasks',
+            'my_wishes', 'partner_wishes', 'unwatched_movies'
+        ), 0)
+        for table, created_by, kind, state, count in rows:
+            mine = created_by == user_id
+            if table == 'tasks':
+                if state == TaskStatus.COMPLETED.value:
+                    counts['completed_tasks'] += count
+                elif kind == TaskType.FOR_BOTH.value:
+                    counts['my_tasks'] += count
+                    counts['common_tasks'] += count
+                elif (kind == TaskType.FOR_ME.value) == mine:
+                    counts['my_tasks'] += count
+                elif partner_id:
+                    counts['partner_tasks'] += count
+            elif table == 'wishes':
+                if kind == WishType.MY_WISH.value:
+                    counts['my_wishes' if mine else 'partner_wishes'] += count
+            elif not state and (not mine or kind == MovieType.MY_MOVIES.value):
+                counts['unwatched_movies'] += count
+        return counts
 
     def get_movie_stats(self, user_id: int) -> dict:
-        self.cursor.execute("""
-        SELECT 
-            COUNT(*) as total_movies,
-            SUM(CASE WHEN watched = 1 THEN 1 ELSE 0 END) as watched_movies,
-            AVG(CASE WHEN rating IS NOT NULL THEN rating ELSE NULL END) as avg_rating
-        FROM movies
-        WHERE created_by = ?
-        """, (user_id,))
+        """Статистика фильмов пользователя из movie_stats, которую ведут триггеры"""
+        histogram = ", ".join(f"rating_{rating}" for rating in MOVIE_RATINGS)
+        row = self._read_one(f"""
+        SELECT total_movies, watched_movies, rated_movies, rating_sum, {histogram}
+        FROM movie_stats
+        WHERE user_id = ?
+        """, (user_id,)) or (0,) * (4 + len(MOVIE_RATINGS))
         
-        row = self.cursor.fetchone()
+        total_movies, watched_movies, rated_movies, rating_sum = row[:4]
         return {
-            'total_movies': row[0],
-            'watched_movies': row[1],
-            'avg_rating': round(row[2], 1) if row[2] is not None else None
+            'total_movies': total_movies,
+            'watched_movies': watched_movies,
+            'avg_rating': round(rating_sum / rated_movies, 1) if rated_movies else None,
+            'ratings': dict(zip(MOVIE_RATINGS, row[4:]))
         }
 
-    def get_movie_recommendations(self, user_id: int, limit: int = 5) -> List[dict]:
-        # Получаем средний рейтинг пользователя
-        self.cursor.execute("""
-        SELECT AVG(rating)
-        FROM movies
-        WHERE created_by = ? AND rating IS NOT NULL
-        """, (user_id,))
-        avg_rating = self.cursor.fetchone()[0] or 4  # По умолчанию 4, если нет оценок
-        
-        # Получаем рекомендации на основе оценок партнера
+    def rebuild_movie_stats(self):
+        """Пересчитывает статистику фильмов с нуля, если она разошлась с movies"""
+        rebuild_movie_stats(self.conn)
+        self._commit()
+
+    @cached_list("movies")
+    def _movie_features(self, user_id: int) -> MovieFeatures:
+        """Признаки всех фильмов пары. Лежат в кэше списков фильмов, поэтому
+        перестраиваются только после изменения фильмов пары"""
+        partner_id = self.get_partner_id(user_id)
+        rows = self._read(
+            f"SELECT {MOVIE_COLUMNS} FROM movies WHERE created_by IN (?, ?)",
+            (user_id, partner_id or -1)
+        )
+        return MovieFeatures([Movie.from_row(row) for row in rows])
+
+    def get_movie_recommendations(self, user_id: int, limit: int = 5) -> List[Movie]:
         partner_id = self.get_partner_id(user_id)
         if not partner_id:
             return []
-            
-        self.cursor.execute("""
-        SELECT id, title, description, rating
-        FROM movies
-        WHERE created_by = ? 
-        AND movie_type = 'partner_movies'
-        AND watched = 0
-        AND rating >= ?
-        ORDER BY rating DESC, created_at DESC
-        LIMIT ?
-        """, (partner_id, avg_rating, limit))
         
-        recommendations = []
-        for row in self.cursor.fetchall():
-            recommendations.append({
-                'id': row[0],
-                'title': row[1],
-                'description': row[2],
-                'rating': row[3]
-            })
-        return recommendations
\ No newline at end of file
+        return self._movie_features(user_id).recommend(partner_id, limit)
+
+
+    def get_search_results(self, user_id: int, text: str, cursor: Optional[str] = None,
+               page_size: int = PAGE_SIZE) -> Page:
+        """Ищет по задачам, желаниям и фильмам пары, лучшие совпадения первыми.
+
+        Курсор - смещение в списке находок: порядок задаёт bm25, а не
+        (created_at, id), поэтому keyset тут не подходит.
+        """
+        match = build_match_query(text)
+        if match is None:
+            return Page()
+        try:
+            offset = max(int(cursor or 0), 0)
+        except ValueError:
+            offset = 0
+
+        owners = (user_id, self.get_partner_id(user_id) or -1)
+        branches = []
+        params = []
+        for kind, table in (("task", "tasks"), ("task", "tasks_archive"), ("wish", "wishes"), ("movie", "movies")):
+            fts = f"{table}_fts"
+            # rank - это bm25, и по нему FTS5 отдаёт строки уже упорядоченными,
+            # поэтому ветки сливаются без временного B-дерева
+            branches.append(f"""
+            SELECT * FROM (
+                SELECT '{kind}' AS kind, {table}.id AS id, {table}.title, {table}.created_by,
+                    snippet({fts}, -1, ?, ?, '…', {SNIPPET_TOKENS}), {fts}.rank AS score
+                FROM {fts} JOIN {table} ON {table}.id = {fts}.rowid
+                WHERE {fts} MATCH ? AND {table}.created_by IN (?, ?)
+                ORDER BY {fts}.rank
+            )
+            """)
+            params.extend((SNIPPET_START, SNIPPET_END, match, *owners))
+        query = " UNION ALL ".join(branches) + " ORDER BY score LIMIT ? OFFSET ?"
+        params.extend((page_size + 1, offset))
+
+        rows = self._read(query, params)
+        hits = [
+            SearchHit(kind, item_id, title, snippet, created_by)
+            for kind, item_id, title, created_by, snippet, _ in rows[:page_size]
+        ]
+        return Page(
+            hits,
+            has_prev=offset > 0,
+            has_next=len(rows) > page_size,
+            prev_cursor=str(max(offset - page_size, 0)),
+            next_cursor=str(offset + page_size)
+        )
+
+
+class AsyncDatabase:
+    """Асинхронная обёртка над Database.
+
+    Все запросы выполняются в отдельных потоках, чтобы sqlite3 и commit не
+    блокировали event loop. Методы те же, что у Database, но их нужно await-ить.
+    Запись идёт через один поток с пишущим соединением, а методы get_* - через
+    потоки по числу соединений в пуле чтения (или через тот же поток, если пула нет).
+
+    При group_commit_window > 0 записи, пришедшие в течение окна (или пока их
+    не наберётся group_commit_max_batch), выполняются одной транзакцией с
+    одним commit. Каждый вызов завершается только после этого commit.
+    """
+
+    def __init__(self, db_file: str = "couple_tasks.db", profile: str = "default",
+                 group_commit_window: float = 0, group_commit_max_batch: int = GROUP_COMMIT_MAX_BATCH):
+        # Один поток на пишущее соединение, поэтому записи не пересекаются
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="database")
+        self._db = self._executor.submit(Database, db_file, profile).result()
+        if self._db.readers:
+            self._read_executor = ThreadPoolExecutor(max_workers=self._db.readers, thread_name_prefix="database-read")
+        else:
+            self._read_executor = self._executor
+
+        self._group_commit_window = group_commit_window
+        self._group_commit_max_batch = group_commit_max_batch
+        self._pending_writes = []
+        self._flush_handle = None
+        self._batches = set()
+
+    def __getattr__(self, name):
+        method = getattr(self._db, name)
+        if not callable(method):
+            return method
+
+        if name.startswith("get_") or not self._group_commit_window:
+            executor = self._read_executor if name.startswith("get_") else self._executor
+
+            @functools.wraps(method)
+            async def wrapper(*args, **kwargs):
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(executor, functools.partial(method, *args, **kwargs))
+        else:
+            @functools.wraps(method)
+            async def wrapper(*args, **kwargs):
+                return await self._write(functools.partial(method, *args, **kwargs))
+
+        # Запоминаем обёртку, чтобы не создавать её на каждый вызов
+        setattr(self, name, wrapper)
+        return wrapper
+
+    async def get_partner_id(self, user_id: int) -> Optional[int]:
+        # Партнёр берётся из памяти, поэтому в поток базы не ходим
+        return self._db.get_partner_id(user_id)
+
+    def _write(self, call) -> asyncio.Future:
+        """Ставит запись в текущую пачку group commit"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending_writes.append((call, future))
+        if len(self._pending_writes) >= self._group_commit_max_batch:
+            self._flush_writes()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._group_commit_window, self._flush_writes)
+        return future
+
+    def _flush_writes(self):
+        """Отправляет накопленные записи в пишущий поток одной пачкой"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        writes, self._pending_writes = self._pending_writes, []
+        if not writes:
+            return
+
+        loop = asyncio.get_running_loop()
+        batch = loop.run_in_executor(self._executor, self._db.run_batch, [call for call, _ in writes])
+        self._batches.add(batch)
+        batch.add_done_callback(functools.partial(self._finish_batch, writes))
+
+    def _finish_batch(self, writes: list, batch: asyncio.Future):
+        self._batches.discard(batch)
+        error = batch.exception()
+        results = batch.result() if error is None else None
+        for index, (_, future) in enumerate(writes):
+            if future.done():
+                continue  # вызывающий уже не ждёт результата
+            if error is not None:
+                future.set_exception(error)
+                continue
+            ok, value = results[index]
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    async def close(self):
+        # Досылаем накопленные записи и ждём их commit
+        self._flush_writes()
+        if self._batches:
+            await asyncio.gather(*self._batches, return_exceptions=True)
+        # Сначала дожидаемся чтений, потом закрываем соединения в пишущем потоке
+        if self._read_executor is not self._executor:
+            self._read_executor.shutdown(wait=True)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._db.close)
+        self._executor.shutdown(wait=True)
@@ -33,6 +33,24 @@ error() {
     exit 1
 }
 
+# The database runs in WAL mode: recent commits may live only in the
+# -wal file, so a plain cp of the main file is not a consistent copy.
+# sqlite3 .backup takes a consistent snapshot even while the bot is running.
+backup_db() {
+    sqlite3 "$1" ".backup '$2'" || error "Failed to back up database $1"
+}
+
+# Restores a database snapshot. The service must be stopped: stale -wal/-shm
+# files of the old database are removed so they are not replayed on top
+restore_db() {
+    rm -f "$2-wal" "$2-shm"
+    cp "$1" "$2"
+    # Backups made before .backup was used may carry their own -wal file
+    if [ -f "$1-wal" ]; then
+        cp "$1-wal" "$2-wal"
+    fi
+}
+
 show_help() {
     echo "Usage: $0 [OPTIONS]"
     echo
@@ -120,26 +138,29 @@ if [ -n "$ROLLBACK_DIR" ]; then
         mkdir -p "$PRE_ROLLBACK_BACKUP"
         log "Creating backup of current state before rollback: $PRE_ROLLBACK_BACKUP"
         
-        # Copy all files except the virtual environment
+        # Copy all files except the virtual environment and the database
         cd "$DEPLOY_DIR"
-        find . -maxdepth 1 -not -name "venv" -not -name "." | xargs -I{} cp -r {} "$PRE_ROLLBACK_BACKUP"
+        find . -maxdepth 1 -not -name "venv" -not -name "." -not -name "${DB_FILE}*" | xargs -I{} cp -r {} "$PRE_ROLLBACK_BACKUP"
+        if [ -f "${DEPLOY_DIR}/${DB_FILE}" ]; then
+            backup_db "${DEPLOY_DIR}/${DB_FILE}" "${PRE_ROLLBACK_BACKUP}/${DB_FILE}"
+        fi
     fi
     
     # Restore from backup
     log "Restoring files from backup..."
     mkdir -p "$DEPLOY_DIR"
     
-    # Copy all files from backup except database if it doesn't exist
+    # Copy all files from backup except the database (and its -wal/-shm files)
     cd "$ROLLBACK_DIR"
-    find . -maxdepth 1 -not -name "." -not -name "$DB_FILE" | xargs -I{} cp -r {} "$DEPLOY_DIR"
+    find . -maxdepth 1 -not -name "." -not -name "${DB_FILE}*" | xargs -I{} cp -r {} "$DEPLOY_DIR"
     
     # Only restore database if it doesn't exist in current deployment
     if [ ! -f "${DEPLOY_DIR}/${DB_FILE}" ] && [ -f "${ROLLBACK_DIR}/${DB_FILE}" ]; then
         log "Restoring database file..."
-        cp "${ROLLBACK_DIR}/${DB_FILE}" "${DEPLOY_DIR}/${DB_FILE}"
+        restore_db "${ROLLBACK_DIR}/${DB_FILE}" "${DEPLOY_DIR}/${DB_FILE}"
     elif [ -f "${ROLLBACK_DIR}/${DB_FILE}" ]; then
-        log "Database file already exists. To restore database, manually copy:"
-        log "cp ${ROLLBACK_DIR}/${DB_FILE} ${DEPLOY_DIR}/${DB_FILE}"
+        log "Database file already exists. To restore database, stop the service and run:"
+        log "sqlite3 ${DEPLOY_DIR}/${DB_FILE} \".restore '${ROLLBACK_DIR}/${DB_FILE}'\""
     fi
     
     # Set permissions
@@ -196,9 +217,13 @@ if [ -d "$DEPLOY_DIR" ]; then
     
     log "Creating backup of existing installation: $BACKUP_DIR"
     
-    # Copy all files except the virtual environment
+    # Copy all files except the virtual environment and the database, which
+    # is still in use by the running service
     cd "$DEPLOY_DIR"
-    find . -maxdepth 1 -not -name "venv" -not -name "." | xargs -I{} cp -r {} "$BACKUP_DIR"
+    find . -maxdepth 1 -not -name "venv" -not -name "." -not -name "${DB_FILE}*" | xargs -I{} cp -r {} "$BACKUP_DIR"
+    if [ -f "${DEPLOY_DIR}/${DB_FILE}" ]; then
+        backup_db "${DEPLOY_DIR}/${DB_FILE}" "${BACKUP_DIR}/${DB_FILE}"
+    fi
     
     # If it's a fresh install (overwrite), move existing deployment out of the way
     if ! $UPDATE_MODE; then
@@ -223,7 +248,7 @@ if $UPDATE_MODE; then
     # Save database file if it exists
     if [ -f "${DEPLOY_DIR}/${DB_FILE}" ]; then
         log "Saving database file..."
-        cp "${DEPLOY_DIR}/${DB_FILE}" "${TEMP_SAVE_DIR}/"
+        backup_db "${DEPLOY_DIR}/${DB_FILE}" "${TEMP_SAVE_DIR}/${DB_FILE}"
     else
         warn "No database file found at ${DEPLOY_DIR}/${DB_FILE}"
     fi
@@ -279,10 +304,11 @@ cp -r "${TEMP_CLONE_DIR}"/* "$DEPLOY_DIR/"
 if $UPDATE_MODE; then
     log "Restoring important files..."
     
-    # Restore database file
-    if [ -f "${TEMP_SAVE_DIR}/${DB_FILE}" ]; then
+    # Restore database file only if the update removed it. The live database
+    # is still used by the running service and must not be overwritten
+    if [ ! -f "${DEPLOY_DIR}/${DB_FILE}" ] && [ -f "${TEMP_SAVE_DIR}/${DB_FILE}" ]; then
         log "Restoring database file..."
-        cp "${TEMP_SAVE_DIR}/${DB_FILE}" "${DEPLOY_DIR}/"
+        restore_db "${TEMP_SAVE_DIR}/${DB_FILE}" "${DEPLOY_DIR}/${DB_FILE}"
     fi
     
     # Restore config.py if it was saved
@@ -468,7 +494,7 @@ echo -e "View logs:        ${GREEN}sudo journalctl -u ${SERVICE_NAME} -f${NC}"
 echo
 echo -e "${BLUE}=== Database Location ===${NC}"
 echo -e "Database file:    ${GREEN}${DEPLOY_DIR}/${DB_FILE}${NC}"
-echo -e "To backup:        ${GREEN}cp ${DEPLOY_DIR}/${DB_FILE} /path/to/backup/${NC}"
+echo -e "To backup:        ${GREEN}sqlite3 ${DEPLOY_DIR}/${DB_FILE} \".backup '/path/to/backup/${DB_FILE}'\"${NC}"
 echo
 echo -e "${BLUE}=== Update & Rollback ===${NC}"
 echo -e "Update bot:       ${GREEN}sudo $0 --update${NC}"
@@ -1,25 +1,41 @@
-import logging
-from aiogram import Router, F, types
-from aiogram.filters import Command, StateFilter
+import html
+from aiogram import F, types
+from aiogram.filters import Command, CommandObject, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, CallbackQuery
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from models import Task, TaskType, TaskStatus, Wish, WishType, Movie, MovieType
 from datetime import datetime
 
-from config import ADMIN_IDS
-from database import Database
+from config import ADMIN_IDS, DB_PROFILE, DB_GROUP_COMMIT_MS
+from database import AsyncDatabase, SNIPPET_START, SNIPPET_END
+from notifications import Notifier, notification
+from callbacks import (
+    CallbackRouter, MainMenuCallback, CancelCallback, TaskTypeCallback, ViewTaskCallback, TaskStatusCallback,
+    EditTaskCallback, TaskFieldCallback, DeleteTaskCallback, ConfirmDeleteTaskCallback, TasksPageCallback,
+    TasksBackCallback, WishTypeCallback, ViewWishCallback, EditWishCallback, WishFieldCallback,
+    DeleteWishCallback, ConfirmDeleteWishCallback, WishesPageCallback, WishesBackCallback, SearchPageCallback,
+    MoviesMenuCallback, MovieTypeCallback, ViewMovieCallback, MarkWatchedCallback, AddReviewCallback,
+    EditMovieCallback, MovieFieldCallback, DeleteMovieCallback, ConfirmDeleteMovieCallback, MoviesBackCallback,
+    MoviesPageCallback, RateMovieCallback, SetRatingCallback
+)
 from keyboards import (
     get_edit_menu_keyboard, get_main_keyboard, get_task_type_keyboard, get_task_action_keyboard,
     get_tasks_list_keyboard, get_cancel_keyboard, get_confirm_keyboard, get_wish_type_keyboard, 
-    get_wishes_list_keyboard, get_wishes_list_keyboard, get_wish_action_keyboard, get_edit_wish_menu_keyboard,
+    get_wishes_list_keyboard, get_wish_action_keyboard, get_edit_wish_menu_keyboard,
     get_movies_menu_keyboard, get_movies_list_keyboard, get_movie_type_keyboard, get_movie_action_keyboard,
-    get_edit_movie_menu_keyboard, get_movie_rating_keyboard
+    get_edit_movie_menu_keyboard, get_movie_rating_keyboard, get_search_results_keyboard
 )
 
-router = Router()
-db = Database()
+# Нажатия кнопок находятся по префиксу callback_data, а не перебором фильтров
+router = CallbackRouter()
+db = AsyncDatabase(profile=DB_PROFILE, group_commit_window=DB_GROUP_COMMIT_MS / 1000)
+# Уведомления партнёру уходят в фоне, обработчик их не ждёт
+notifier = Notifier()
+
+async def main_keyboard(user_id: int):
+    """Главное меню со счётчиками списков пользователя"""
+    return get_main_keyboard(await db.get_dashboard_counts(user_id))
 
 # Состояния для FSM (машины состояний)
 class TaskStates(StatesGroup):
@@ -42,6 +58,9 @@ class WishStates(StatesGroup):
     edit_image = State()
     edit_type = State()
 
+class SearchStates(StatesGroup):
+    waiting_for_query = State()
+
 # Обработчик команды /start
 @router.message(Command("start"))
 async def cmd_start(message: Message):
@@ -55,7 +74,7 @@ async def cmd_start(message: Message):
     partner_id = None
     
     # Если пользователь уже есть в базе, получаем его партнера
-    existing_partner = db.get_partner_id(user_id)
+    existing_partner = await db.get_partner_id(user_id)
     if existing_partner:
         partner_id = existing_partner
     else:
@@ -66,17 +85,17 @@ async def cmd_start(message: Message):
                 break
     
     # Добавляем пользователя с партнером
-    db.add_user(user_id, partner_id)
+    await db.add_user(user_id, partner_id)
     
     # Важно! Также добавляем обратную связь - чтобы партнер тоже видел пользователя
     if partner_id:
-        db.add_user(partner_id, user_id)
+        await db.add_user(partner_id, user_id)
     
     # Отправляем приветственное сообщение
     await message.answer(
         f"👋 Привет! Это бот для управления задачами для пары."
         f"Вы можете создавать задачи для себя, для партнера или для обоих!",
-        reply_markup=get_main_keyboard()
+        reply_markup=await main_keyboard(message.from_user.id)
     )
 
 # Обработчик кнопки "Добавить задачу"
@@ -117,9 +136,9 @@ async def process_task_description(message: Message, state: FSMContext):
     await state.set_state(TaskStates.waiting_for_type)
 
 # Обработчик выбора типа задачи
-@router.callback_query(TaskStates.waiting_for_type, F.data.startswith("task_type:"))
-async def process_task_type(callback: CallbackQuery, state: FSMContext):
-    task_type = callback.data.split(":")[1]
+@router.button(TaskTypeCallback, TaskStates.waiting_for_type)
+async def process_task_type(callback: CallbackQuery, callback_data: TaskTypeCallback, state: FSMContext):
+    task_type = callback_data.task_type
     
     # Получаем все данные из состояния
     data = await state.get_data()
@@ -130,56 +149,54 @@ async def process_task_type(callback: CallbackQuery, state: FSMContext):
     task = Task(
         title=title,
         description=description,
-        task_type=TaskType(task_type),
+        task_type=task_type,
         status=TaskStatus.ACTIVE,
         created_by=callback.from_user.id
     )
     
+    # Всегда уведомляем партнера: уведомление пишется в outbox вместе с задачей
+    notify = []
+    partner_id = await db.get_partner_id(callback.from_user.id)
+    if partner_id:
+        # Формируем сообщение в зависимости от типа задачи
+        message_text = ""
+        if task.task_type == TaskType.FOR_PARTNER:
+            message_text = f"🔔 У вас новая задача от партнера!"
+        elif task.task_type == TaskType.FOR_BOTH:
+            message_text = f"🔔 Создана новая общая задача!"
+        else:  # FOR_ME
+            message_text = f"🔔 Партнер добавил(а) задачу для себя!"
+
+        notify.append(notification(
+            partner_id,
+            f"{message_text}"
+            f"📌 Название: {title}"
+            f"📝 Описание: {description or 'Нет описания'}"
+            f"👥 Тип: {get_task_type_text(task_type)}"
+        ))
+
     # Добавляем задачу в базу данных
-    task_id = db.add_task(task)
-    task.id = task_id
-    
+    task_id = await db.add_task(task, notify=notify)
+    task = task.replace(id=task_id)
+
     # Отправляем сообщение об успешном создании задачи
     await callback.message.edit_text(
         f"✅ Задача успешно создана!\n\n"
         f"📌 Название: {title}\n"
         f"📝 Описание: {description or 'Нет описания'}\n"
-        f"👥 Тип: {get_task_type_text(TaskType(task_type))}"
+        f"👥 Тип: {get_task_type_text(task_type)}"
     )
-    
+
     # Очищаем состояние
     await state.clear()
 
-    # Всегда отправляем уведомление партнеру
-    partner_id = db.get_partner_id(callback.from_user.id)
-    if partner_id:
-        try:
-            # Формируем сообщение в зависимости от типа задачи
-            message_text = ""
-            if task.task_type == TaskType.FOR_PARTNER:
-                message_text = f"🔔 У вас новая задача от партнера!"
-            elif task.task_type == TaskType.FOR_BOTH:
-                message_text = f"🔔 Создана новая общая задача!"
-            else:  # FOR_ME
-                message_text = f"🔔 Партнер добавил(а) задачу для себя!"
-
-            # Отправляем уведомление партнеру
-            await callback.bot.send_message(
-                partner_id,
-                f"{message_text}"
-                f"📌 Название: {title}"
-                f"📝 Описание: {description or 'Нет описания'}"
-                f"👥 Тип: {get_task_type_text(TaskType(task_type))}"
-            )
-            await callback.answer("✅ Уведомление партнеру отправлено!")
-        except Exception as e:
-            logging.error(f"Ошибка при отправке уведомления партнеру: {e}")
-            await callback.answer("⚠️ Не удалось отправить уведомление партнеру")
-    
+    if notify:
+        await callback.answer("📨 Уведомление партнеру будет отправлено")
+
     # Отправляем клавиатуру главного меню
     await callback.message.answer(
         "Что бы вы хотели сделать дальше?",
-        reply_markup=get_main_keyboard()
+        reply_markup=await main_keyboard(callback.from_user.id)
     )
 
 # Вспомогательная функция для получения текстового представления типа задачи
@@ -192,66 +209,72 @@ def get_task_type_text(task_type: TaskType) -> str:
         return "Для обоих"
 
 # Обработчик кнопки "Мои задачи"
-@router.message(F.text == "📋 Мои задачи")
-async def show_my_tasks(message: Message):
+@router.message(F.text.startswith("📋 Мои задачи"))
+async def show_my_tasks(message: Message, state: FSMContext):
     user_id = message.from_user.id
     
-    my_tasks = db.get_user_tasks(user_id)
+    my_tasks = await db.get_user_tasks(user_id)
     
     if not my_tasks:
         await message.answer("У вас пока нет задач.")
         return
     
+    # Сохраняем контекст, чтобы листать именно этот список
+    await state.update_data(task_context="my_tasks")
+    
     await message.answer(
         "📋 Ваши задачи:",
         reply_markup=get_tasks_list_keyboard(my_tasks, context="my_tasks")
     )
 
 # Обработчик кнопки "Задачи партнера"
-@router.message(F.text == "🔄 Задачи партнера")
-async def show_partner_tasks(message: Message):
+@router.message(F.text.startswith("🔄 Задачи партнера"))
+async def show_partner_tasks(message: Message, state: FSMContext):
     user_id = message.from_user.id
     
     # Напрямую получаем задачи партнёра:
-    partner_tasks = db.get_partner_tasks(user_id)
+    partner_tasks = await db.get_partner_tasks(user_id)
     
     if not partner_tasks:
         await message.answer("У вашего партнера пока нет задач.")
         return
     
+    await state.update_data(task_context="partner_tasks")
+    
     await message.answer(
         "🔄 Задачи вашего партнера:",
         reply_markup=get_tasks_list_keyboard(partner_tasks, context="partner_tasks")
     )
 
 # Обработчик кнопки "Общие задачи"
-@router.message(F.text == "👫 Общие задачи")
-async def show_common_tasks(message: Message):
+@router.message(F.text.startswith("👫 Общие задачи"))
+async def show_common_tasks(message: Message, state: FSMContext):
     user_id = message.from_user.id
     
     # Напрямую получаем общие задачи:
-    common_tasks = db.get_common_tasks(user_id)
+    common_tasks = await db.get_common_tasks(user_id)
     
     if not common_tasks:
         await message.answer("У вас пока нет общих задач.")
         return
     
+    await state.update_data(task_context="common_tasks")
+    
     await message.answer(
         "👫 Общие задачи:",
         reply_markup=get_tasks_list_keyboard(common_tasks, context="common_tasks")
     )
 
 # Обработчик просмотра задачи
-@router.callback_query(F.data.startswith("view_task:"))
-async def view_task(callback: CallbackQuery, state: FSMContext):
-    parts = callback.data.split(":")
-    task_id = int(parts[1])
-    context = parts[2] if len(parts) > 2 else "my_tasks"
+@router.button(ViewTaskCallback)
+async def view_task(callback: CallbackQuery, callback_data: ViewTaskCallback, state: FSMContext):
+    task_id = callback_data.task_id
+    context = callback_data.context
     
     # Сохраняем контекст в стейт
     await state.update_data(task_context=context)
     
-    task = db.get_task(task_id)
+    task = await db.get_task(task_id)
     
     if not task:
         await callback.answer("Задача не найдена. Возможно, она была удалена.")
@@ -279,45 +302,35 @@ async def view_task(callback: CallbackQuery, state: FSMContext):
     )
 
 # Обработчик изменения статуса задачи
-@router.callback_query(F.data.startswith("task_status:"))
-async def change_task_status(callback: CallbackQuery, state: FSMContext):
-    parts = callback.data.split(":")
-    task_id = int(parts[1])
-    new_status = TaskStatus(parts[2])
+@router.button(TaskStatusCallback)
+async def change_task_status(callback: CallbackQuery, callback_data: TaskStatusCallback, state: FSMContext):
+    task_id = callback_data.task_id
+    new_status = callback_data.status
     
     # Получаем контекст из стейта
     data = await state.get_data()
     context = data.get("task_context", "my_tasks")
     
-    task = db.get_task(task_id)
+    # Уведомление партнеру об изменении статуса пишется в outbox вместе с ним
+    notify = []
+    task = await db.get_task(task_id)
+    partner_id = await db.get_partner_id(callback.from_user.id)
+    if task and partner_id and task.created_by != partner_id:
+        status_text = "выполнена ✅" if new_status == TaskStatus.COMPLETED else "возвращена в активные 🔄"
+        notify.append(notification(
+            partner_id,
+            f"🔔 Обновление статуса задачи!"
+            f"📌 Задача \"{task.title}\" {status_text}"
+        ))
+
+    # Обновляем статус задачи и сразу получаем её новую версию
+    task = await db.update_task_status(task_id, new_status, notify=notify)
     if not task:
         await callback.answer("Задача не найдена. Возможно, она была удалена.")
         return
-    
-    # Обновляем статус задачи
-    task.status = new_status
-    db.update_task(task)
 
-    # Уведомляем партнера об изменении статуса задачи
-    partner_id = db.get_partner_id(callback.from_user.id)
-    if partner_id and task.created_by != partner_id:
-        partner_id = db.get_partner_id(callback.from_user.id)
-        if partner_id:
-            try:
-                status_text = "выполнена ✅" if task.status == TaskStatus.COMPLETED else "возвращена в активные 🔄"
-                await callback.bot.send_message(
-                    partner_id,
-                    f"🔔 Обновление статуса задачи!"
-                    f"📌 Задача \"{task.title}\" {status_text}"
-                )
-            except Exception as e:
-                logging.error(f"Ошибка при отправке уведомления об изменении статуса: {e}")
-    
     await callback.answer(f"Статус задачи изменен на: {new_status.value}")
     
-    # Получаем обновленную задачу и показываем
-    task = db.get_task(task_id)
-    
     # Формируем статус задачи
     status_text = "✅ Выполнена" if task.status == TaskStatus.COMPLETED else "🔄 Активна"
     
@@ -340,15 +353,15 @@ async def change_task_status(callback: CallbackQuery, state: FSMContext):
     )
 
 # Обработчик редактирования задачи
-@router.callback_query(F.data.startswith("edit_task:"))
-async def edit_task(callback: CallbackQuery, state: FSMContext):
-    task_id = int(callback.data.split(":")[1])
+@router.button(EditTaskCallback)
+async def edit_task(callback: CallbackQuery, callback_data: EditTaskCallback, state: FSMContext):
+    task_id = callback_data.task_id
     
     # Получаем контекст из стейта
     data = await state.get_data()
     context = data.get("task_context", "my_tasks")
     
-    task = db.get_task(task_id)
+    task = await db.get_task(task_id)
     
     if not task:
         await callback.answer("Задача не найдена. Возможно, она была удалена.")
@@ -364,14 +377,14 @@ async def edit_task(callback: CallbackQuery, state: FSMContext):
     )
 
 # Обработчик выбора поля для редактирования
-@router.callback_query(F.data.startswith("edit:"))
-async def edit_task_field(callback: CallbackQuery, state: FSMContext):
-    field = callback.data.split(":")[1]
+@router.button(TaskFieldCallback)
+async def edit_task_field(callback: CallbackQuery, callback_data: TaskFieldCallback, state: FSMContext):
+    field = callback_data.field
     
     # Получаем данные о задаче
     data = await state.get_data()
     task_id = data.get("task_id")
-    task = db.get_task(task_id)
+    task = await db.get_task(task_id)
     
     if not task:
         await callback.answer("Задача не найдена. Возможно, она была удалена.")
@@ -409,30 +422,29 @@ async def process_edit_title(message: Message, state: FSMContext):
     # Получаем данные о задаче
     data = await state.get_data()
     task_id = data.get("task_id")
-    task = db.get_task(task_id)
+    task = await db.get_task(task_id)
     
     if not task:
         await message.answer("Задача не найдена. Возможно, она была удалена.")
         await state.clear()
         return
     
-    # Обновляем название задачи
-    task.title = new_title
-    db.update_task(task)
-    
-    await message.answer(f"✅ Название задачи успешно обновлено!")
+    task = task.replace(title=new_title)
 
     # Уведомляем партнера об изменении названия задачи
-    partner_id = db.get_partner_id(message.from_user.id)
+    notify = []
+    partner_id = await db.get_partner_id(message.from_user.id)
     if partner_id and task.created_by != partner_id:  # Уведомляем только если задача создана не партнером
-        try:
-            await message.bot.send_message(
-                partner_id,
-                f"🔔 Обновление задачи!\n"
-                f"📌 Задача изменена: новое название \"{task.title}\""
-            )
-        except Exception as e:
-            logging.error(f"Ошибка при отправке уведомления об изменении названия: {e}")
+        notify.append(notification(
+            partner_id,
+            f"🔔 Обновление задачи!\n"
+            f"📌 Задача изменена: новое название \"{task.title}\""
+        ))
+
+    # Обновляем название задачи
+    await db.update_task(task, notify=notify)
+    
+    await message.answer(f"✅ Название задачи успешно обновлено!")
     
     # Очищаем состояние
     await state.clear()
@@ -456,30 +468,29 @@ async def process_edit_description(message: Message, state: FSMContext):
     # Получаем данные о задаче
     data = await state.get_data()
     task_id = data.get("task_id")
-    task = db.get_task(task_id)
+    task = await db.get_task(task_id)
     
     if not task:
         await message.answer("Задача не найдена. Возможно, она была удалена.")
         await state.clear()
         return
     
-    # Обновляем описание задачи
-    task.description = new_description
-    db.update_task(task)
-    
-    await message.answer(f"✅ Описание задачи успешно обновлено!")
+    task = task.replace(description=new_description)
 
     # Уведомляем партнера об изменении описания задачи
-    partner_id = db.get_partner_id(message.from_user.id)
+    notify = []
+    partner_id = await db.get_partner_id(message.from_user.id)
     if partner_id and task.created_by != partner_id:
-        try:
-            await message.bot.send_message(
-                partner_id,
-                f"🔔 Обновление задачи!\n"
-                f"📌 У задачи \"{task.title}\" изменено описание"
-            )
-        except Exception as e:
-            logging.error(f"Ошибка при отправке уведомления об изменении описания: {e}")
+        notify.append(notification(
+            partner_id,
+            f"🔔 Обновление задачи!\n"
+            f"📌 У задачи \"{task.title}\" изменено описание"
+        ))
+
+    # Обновляем описание задачи
+    await db.update_task(task, notify=notify)
+    
+    await message.answer(f"✅ Описание задачи успешно обновлено!")
     
     # Очищаем состояние
     await state.clear()
@@ -494,37 +505,36 @@ async def process_edit_description(message: Message, state: FSMContext):
     )
 
 # Обработчик выбора нового типа задачи
-@router.callback_query(TaskStates.edit_type, F.data.startswith("task_type:"))
-async def process_edit_type(callback: CallbackQuery, state: FSMContext):
-    new_type = TaskType(callback.data.split(":")[1])
+@router.button(TaskTypeCallback, TaskStates.edit_type)
+async def process_edit_type(callback: CallbackQuery, callback_data: TaskTypeCallback, state: FSMContext):
+    new_type = callback_data.task_type
     
     # Получаем данные о задаче
     data = await state.get_data()
     task_id = data.get("task_id")
-    task = db.get_task(task_id)
+    task = await db.get_task(task_id)
     
     if not task:
         await callback.answer("Задача не найдена. Возможно, она была удалена.")
         await state.clear()
         return
     
-    # Обновляем тип задачи
-    task.task_type = new_type
-    db.update_task(task)
-    
-    await callback.answer(f"✅ Тип задачи успешно обновлен!")
+    task = task.replace(task_type=new_type)
 
     # Уведомляем партнера об изменении типа задачи
-    partner_id = db.get_partner_id(callback.from_user.id)
+    notify = []
+    partner_id = await db.get_partner_id(callback.from_user.id)
     if partner_id and task.created_by != partner_id:
-        try:
-            await callback.bot.send_message(
-                partner_id,
-                f"🔔 Обновление задачи!\n"
-                f"📌 У задачи \"{task.title}\" изменен тип на {get_task_type_text(task.task_type)}"
-            )
-        except Exception as e:
-            logging.error(f"Ошибка при отправке уведомления об изменении типа: {e}")
+        notify.append(notification(
+            partner_id,
+            f"🔔 Обновление задачи!\n"
+            f"📌 У задачи \"{task.title}\" изменен тип на {get_task_type_text(task.task_type)}"
+        ))
+
+    # Обновляем тип задачи
+    await db.update_task(task, notify=notify)
+    
+    await callback.answer(f"✅ Тип задачи успешно обновлен!")
     
     # Очищаем состояние
     await state.clear()
@@ -539,10 +549,10 @@ async def process_edit_type(callback: CallbackQuery, state: FSMContext):
     )
 
 # Обработчик удаления задачи
-@router.callback_query(F.data.startswith("delete_task:"))
-async def confirm_delete_task(callback: CallbackQuery):
-    task_id = int(callback.data.split(":")[1])
-    task = db.get_task(task_id)
+@router.button(DeleteTaskCallback)
+async def confirm_delete_task(callback: CallbackQuery, callback_data: DeleteTaskCallback):
+    task_id = callback_data.task_id
+    task = await db.get_task(task_id)
     
     if not task:
         await callback.answer("Задача не найдена. Возможно, она была удалена.")
@@ -551,70 +561,72 @@ async def confirm_delete_task(callback: CallbackQuery):
     await callback.message.edit_text(
         f"⚠️ Вы уверены, что хотите удалить задачу?\n\n"
         f"📌 Название: {task.title}",
-        reply_markup=get_confirm_keyboard("delete", task_id)
+        reply_markup=get_confirm_keyboard(
+            ConfirmDeleteTaskCallback(task_id=task_id), ViewTaskCallback(task_id=task_id)
+        )
     )
 
 # Обработчик подтверждения удаления задачи
-@router.callback_query(F.data.startswith("confirm_delete:"))
-async def delete_task(callback: CallbackQuery):
-    task_id = int(callback.data.split(":")[1])
+@router.button(ConfirmDeleteTaskCallback)
+async def delete_task(callback: CallbackQuery, callback_data: ConfirmDeleteTaskCallback):
+    task_id = callback_data.task_id
 
     # Получаем задачу перед удалением, чтобы знать детали
-    task = db.get_task(task_id)
-    # Уведомляем партнера об удалении задачи
+    task = await db.get_task(task_id)
+    # Уведомляем партнера об удалении задачи (уйдёт, только если задача удалится)
+    notify = []
     if task:
-        partner_id = db.get_partner_id(callback.from_user.id)
+        partner_id = await db.get_partner_id(callback.from_user.id)
         if partner_id and task.created_by != partner_id:
-            try:
-                await callback.bot.send_message(
-                    partner_id,
-                    f"🔔 Задача удалена!\n"
-                    f"📌 Задача \"{task.title}\" была удалена"
-                )
-            except Exception as e:
-                logging.error(f"Ошибка при отправке уведомления об удалении: {e}")
+            notify.append(notification(
+                partner_id,
+                f"🔔 Задача удалена!\n"
+                f"📌 Задача \"{task.title}\" была удалена"
+            ))
     
     # Удаляем задачу
-    success = db.delete_task(task_id)
+    success = await db.delete_task(task_id, notify=notify)
     
     if success:
         await callback.answer("✅ Задача успешно удалена!")
         await callback.message.edit_text("Задача была удалена.")
         await callback.message.answer(
             "Что бы вы хотели сделать дальше?",
-            reply_markup=get_main_keyboard()
+            reply_markup=await main_keyboard(callback.from_user.id)
         )
     else:
         await callback.answer("❌ Ошибка при удалении задачи.")
 
 # Обработчик переключения страниц в списке задач
-@router.callback_query(F.data.startswith("page:"))
-async def change_page(callback: CallbackQuery, state: FSMContext):
-    parts = callback.data.split(":")
-    page = int(parts[1])
+@router.button(TasksPageCallback)
+async def change_page(callback: CallbackQuery, callback_data: TasksPageCallback, state: FSMContext):
+    # Курсор соседней страницы приходит прямо в callback_data
+    cursor = callback_data.cursor
     
     # Получаем сохраненный контекст
     data = await state.get_data()
     context = data.get("task_context", "my_tasks")
     
-    # Получаем задачи в зависимости от контекста
+    # Получаем страницу задач в зависимости от контекста
     user_id = callback.from_user.id
     
     if context == "my_tasks":
-        filtered_tasks = db.get_user_tasks(user_id)
+        filtered_tasks = await db.get_user_tasks(user_id, cursor)
     elif context == "partner_tasks":
-        filtered_tasks = db.get_partner_tasks(user_id)
+        filtered_tasks = await db.get_partner_tasks(user_id, cursor)
     elif context == "common_tasks":
-        filtered_tasks = db.get_common_tasks(user_id)
+        filtered_tasks = await db.get_common_tasks(user_id, cursor)
+    elif context == "completed_tasks":
+        filtered_tasks = await db.get_completed_tasks(user_id, cursor)
     else:
-        filtered_tasks = db.get_tasks(user_id)
+        filtered_tasks = await db.get_tasks(user_id, cursor)
     
     await callback.message.edit_reply_markup(
-        reply_markup=get_tasks_list_keyboard(filtered_tasks, page, context=context)
+        reply_markup=get_tasks_list_keyboard(filtered_tasks, context=context)
     )
 
 # Обработчик кнопки "Главное меню"
-@router.callback_query(F.data == "main_menu")
+@router.button(MainMenuCallback)
 async def return_to_main_menu(callback: CallbackQuery):
     await callback.message.edit_text(
         "Вы вернулись в главное меню.",
@@ -622,15 +634,13 @@ async def return_to_main_menu(callback: CallbackQuery):
     )
     await callback.message.answer(
         "Что бы вы хотели сделать?",
-        reply_markup=get_main_keyboard()
+        reply_markup=await main_keyboard(callback.from_user.id)
     )
 
 # Обработчик кнопки "Назад к задачам"
-@router.callback_query(F.data.startswith("back_to_tasks"))
-async def back_to_tasks(callback: CallbackQuery, state: FSMContext):
-    # Получаем контекст из колбэка или из стейта
-    parts = callback.data.split(":")
-    context = parts[1] if len(parts) > 1 else "my_tasks"
+@router.button(TasksBackCallback)
+async def back_to_tasks(callback: CallbackQuery, callback_data: TasksBackCallback, state: FSMContext):
+    context = callback_data.context
     
     # На всякий случай обновляем контекст в стейте
     await state.update_data(task_context=context)
@@ -639,16 +649,19 @@ async def back_to_tasks(callback: CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
     
     if context == "my_tasks":
-        filtered_tasks = db.get_user_tasks(user_id)
+        filtered_tasks = await db.get_user_tasks(user_id)
         title = "📋 Ваши задачи:"
     elif context == "partner_tasks":
-        filtered_tasks = db.get_partner_tasks(user_id)
+        filtered_tasks = await db.get_partner_tasks(user_id)
         title = "🔄 Задачи вашего партнера:"
     elif context == "common_tasks":
-        filtered_tasks = db.get_common_tasks(user_id)
+        filtered_tasks = await db.get_common_tasks(user_id)
         title = "👫 Общие задачи:"
+    elif context == "completed_tasks":
+        filtered_tasks = await db.get_completed_tasks(user_id)
+        title = "✅ Выполненные задачи:"
     else:
-        filtered_tasks = db.get_tasks(user_id)
+        filtered_tasks = await db.get_tasks(user_id)
         title = "📋 Все задачи:"
     
     # Показываем отфильтрованный список задач
@@ -658,7 +671,7 @@ async def back_to_tasks(callback: CallbackQuery, state: FSMContext):
     )
 
 # Обработчик кнопки "Отмена"
-@router.callback_query(F.data == "cancel")
+@router.button(CancelCallback)
 async def cancel_action(callback: CallbackQuery, state: FSMContext):
     current_state = await state.get_state()
     if current_state:
@@ -670,7 +683,7 @@ async def cancel_action(callback: CallbackQuery, state: FSMContext):
     )
     await callback.message.answer(
         "Что бы вы хотели сделать?",
-        reply_markup=get_main_keyboard()
+        reply_markup=await main_keyboard(callback.from_user.id)
     )
 
 # Вспомогательная функция для получения текстового представления типа желания
@@ -736,9 +749,9 @@ async def process_wish_image(message: Message, state: FSMContext):
     await state.set_state(WishStates.waiting_for_type)
 
 # Обработчик выбора типа желания
-@router.callback_query(WishStates.waiting_for_type, F.data.startswith("wish_type:"))
-async def process_wish_type(callback: CallbackQuery, state: FSMContext):
-    wish_type = callback.data.split(":")[1]
+@router.button(WishTypeCallback, WishStates.waiting_for_type)
+async def process_wish_type(callback: CallbackQuery, callback_data: WishTypeCallback, state: FSMContext):
+    wish_type = callback_data.wish_type
     
     # Получаем все данные из состояния
     data = await state.get_data()
@@ -751,19 +764,33 @@ async def process_wish_type(callback: CallbackQuery, state: FSMContext):
         title=title,
         description=description,
         image_id=image_id,
-        wish_type=WishType(wish_type),
+        wish_type=wish_type,
         created_by=callback.from_user.id
     )
     
+    # Всегда уведомляем партнера: уведомление пишется в outbox вместе с желанием
+    notify = []
+    partner_id = await db.get_partner_id(callback.from_user.id)
+    if partner_id:
+        # Формируем сообщение в зависимости от типа желания
+        if wish.wish_type == WishType.PARTNER_WISH:
+            notification_text = f"🎁 {callback.from_user.first_name} добавил(а) новое желание для вас!"
+        else:  # MY_WISH
+            notification_text = f"✨ {callback.from_user.first_name} добавил(а) своё новое желание!"
+
+        notification_text += f"📌 Название: {title}"
+        notification_text += f"📝 Описание: {description or 'Нет описания'}"
+        notify.append(notification(partner_id, notification_text, photo=image_id))
+
     # Добавляем желание в базу данных
-    wish_id = db.add_wish(wish)
-    wish.id = wish_id
+    wish_id = await db.add_wish(wish, notify=notify)
+    wish = wish.replace(id=wish_id)
     
     # Отправляем сообщение об успешном создании желания
     success_message = f"✅ Желание успешно создано!\n\n"
     success_message += f"📌 Название: {title}\n"
     success_message += f"📝 Описание: {description or 'Нет описания'}\n"
-    success_message += f"👥 Тип: {get_wish_type_text(WishType(wish_type))}"
+    success_message += f"👥 Тип: {get_wish_type_text(wish_type)}"
     
     if image_id:
         await callback.message.delete()
@@ -777,49 +804,22 @@ async def process_wish_type(callback: CallbackQuery, state: FSMContext):
     # Очищаем состояние
     await state.clear()
     
-    # Всегда отправляем уведомление партнеру
-    partner_id = db.get_partner_id(callback.from_user.id)
-    if partner_id:
-        try:
-            # Формируем сообщение в зависимости от типа желания
-            if wish.wish_type == WishType.PARTNER_WISH:
-                notification = f"🎁 {callback.from_user.first_name} добавил(а) новое желание для вас!"
-            else:  # MY_WISH
-                notification = f"✨ {callback.from_user.first_name} добавил(а) своё новое желание!"
-
-            notification += f"📌 Название: {title}"
-            notification += f"📝 Описание: {description or 'Нет описания'}"
-            
-            if image_id:
-                await callback.bot.send_photo(
-                    partner_id,
-                    photo=image_id,
-                    caption=notification
-                )
-            else:
-                await callback.bot.send_message(
-                    partner_id,
-                    notification
-                )
-            
-            await callback.answer("✅ Уведомление партнеру отправлено!")
-        except Exception as e:
-            logging.error(f"Ошибка при отправке уведомления партнеру: {e}")
-            await callback.answer("⚠️ Не удалось отправить уведомление партнеру")
+    if notify:
+        await callback.answer("📨 Уведомление партнеру будет отправлено")
     
     # Отправляем клавиатуру главного меню
     await callback.message.answer(
         "Что бы вы хотели сделать дальше?",
-        reply_markup=get_main_keyboard()
+        reply_markup=await main_keyboard(callback.from_user.id)
     )
 
 # Обработчик кнопки "Мои желания"
-@router.message(F.text == "✨ Мои желания")
+@router.message(F.text.startswith("✨ Мои желания"))
 async def show_my_wishes(message: Message, state: FSMContext):
     user_id = message.from_user.id
     
     # Получаем желания пользователя
-    my_wishes = db.get_my_wishes(user_id)
+    my_wishes = await db.get_my_wishes(user_id)
     
     if not my_wishes:
         await message.answer("У вас пока нет добавленных желаний.")
@@ -834,12 +834,12 @@ async def show_my_wishes(message: Message, state: FSMContext):
     )
 
 # Обработчик кнопки "Желания партнёра"
-@router.message(F.text == "🎀 Желания партнёра")
+@router.message(F.text.startswith("🎀 Желания партнёра"))
 async def show_partner_wishes(message: Message, state: FSMContext):
     user_id = message.from_user.id
     
     # Получаем желания партнёра
-    partner_wishes = db.get_partner_wishes(user_id)
+    partner_wishes = await db.get_partner_wishes(user_id)
     
     if not partner_wishes:
         await message.answer("У вашего партнёра пока нет добавленных желаний.")
@@ -854,16 +854,15 @@ async def show_partner_wishes(message: Message, state: FSMContext):
     )
 
 # Обработчик просмотра желания
-@router.callback_query(F.data.startswith("view_wish:"))
-async def view_wish(callback: CallbackQuery, state: FSMContext):
-    parts = callback.data.split(":")
-    wish_id = int(parts[1])
-    context = parts[2] if len(parts) > 2 else "my_wishes"
+@router.button(ViewWishCallback)
+async def view_wish(callback: CallbackQuery, callback_data: ViewWishCallback, state: FSMContext):
+    wish_id = callback_data.wish_id
+    context = callback_data.context
     
     # Сохраняем контекст в стейт
     await state.update_data(wish_context=context)
     
-    wish = db.get_wish(wish_id)
+    wish = await db.get_wish(wish_id)
     
     if not wish:
         await callback.answer("Желание не найдено. Возможно, оно было удалено.")
@@ -899,129 +898,82 @@ async def view_wish(callback: CallbackQuery, state: FSMContext):
             reply_markup=get_wish_action_keyboard(wish.id, context)
         )
 
-@router.callback_query(F.data.startswith("edit_wish:"))
-async def edit_wish(callback: CallbackQuery, state: FSMContext):
-    parts = callback.data.split(":")
+@router.button(EditWishCallback)
+async def edit_wish(callback: CallbackQuery, callback_data: EditWishCallback, state: FSMContext):
+    wish_id = callback_data.wish_id
     
-    if len(parts) == 2:
-        # Проверяем, можно ли преобразовать второй элемент в число
-        try:
-            # Если edit_wish:{wish_id}, то показываем меню редактирования
-            wish_id = int(parts[1])
-            
-            # Получаем контекст из стейта
-            data = await state.get_data()
-            context = data.get("wish_context", "my_wishes")
-            
-            wish = db.get_wish(wish_id)
-            
-            if not wish:
-                await callback.answer("Желание не найдено. Возможно, оно было удалено.")
-                return
-            
-            # Сохраняем данные о желании в состоянии
-            await state.update_data(wish_id=wish_id)
-            
-            # Проверяем, есть ли фото в сообщении
-            if callback.message.photo:
-                # Если есть фото, удаляем сообщение и отправляем новое текстовое
-                await callback.message.delete()
-                await callback.message.answer(
-                    "✏️ Что вы хотите изменить?",
-                    reply_markup=get_edit_wish_menu_keyboard(wish_id, context)
-                )
-            else:
-                # Если нет фото, можем просто редактировать текст
-                await callback.message.edit_text(
-                    "✏️ Что вы хотите изменить?",
-                    reply_markup=get_edit_wish_menu_keyboard(wish_id, context)
-                )
-        except ValueError:
-            # Если второй элемент не число, значит это редактирование поля
-            field = parts[1]
-            
-            # Получаем данные о желании
-            data = await state.get_data()
-            wish_id = data.get("wish_id")
-            wish = db.get_wish(wish_id)
-            
-            if not wish:
-                await callback.answer("Желание не найдено. Возможно, оно было удалено.")
-                return
-            
-            if field == "title":
-                await callback.message.edit_text(
-                    f"Текущее название: {wish.title}\n\n"
-                    f"Введите новое название:",
-                    reply_markup=get_cancel_keyboard()
-                )
-                await state.set_state(WishStates.edit_title)
-            
-            elif field == "description":
-                await callback.message.edit_text(
-                    f"Текущее описание: {wish.description or 'Нет описания'}\n\n"
-                    f"Введите новое описание (или отправьте '-' для удаления):",
-                    reply_markup=get_cancel_keyboard()
-                )
-                await state.set_state(WishStates.edit_description)
-            
-            elif field == "image":
-                await callback.message.edit_text(
-                    f"Отправьте новое изображение (или отправьте '-' для удаления текущего):",
-                    reply_markup=get_cancel_keyboard()
-                )
-                await state.set_state(WishStates.edit_image)
-            
-            elif field == "type":
-                await callback.message.edit_text(
-                    f"Текущий тип: {get_wish_type_text(wish.wish_type)}\n\n"
-                    f"Выберите новый тип желания:",
-                    reply_markup=get_wish_type_keyboard()
-                )
-                await state.set_state(WishStates.edit_type)
+    # Получаем контекст из стейта
+    data = await state.get_data()
+    context = data.get("wish_context", "my_wishes")
+    
+    wish = await db.get_wish(wish_id)
+    
+    if not wish:
+        await callback.answer("Желание не найдено. Возможно, оно было удалено.")
+        return
+    
+    # Сохраняем данные о желании в состоянии
+    await state.update_data(wish_id=wish_id)
+    
+    # Проверяем, есть ли фото в сообщении
+    if callback.message.photo:
+        # Если есть фото, удаляем сообщение и отправляем новое текстовое
+        await callback.message.delete()
+        await callback.message.answer(
+            "✏️ Что вы хотите изменить?",
+            reply_markup=get_edit_wish_menu_keyboard(wish_id, context)
+        )
     else:
-        # Если edit_wish:{field}, то начинаем редактирование поля
-        field = parts[1]
-        
-        # Получаем данные о желании
-        data = await state.get_data()
-        wish_id = data.get("wish_id")
-        wish = db.get_wish(wish_id)
-        
-        if not wish:
-            await callback.answer("Желание не найдено. Возможно, оно было удалено.")
-            return
-        
-        if field == "title":
-            await callback.message.edit_text(
-                f"Текущее название: {wish.title}\n\n"
-                f"Введите новое название:",
-                reply_markup=get_cancel_keyboard()
-            )
-            await state.set_state(WishStates.edit_title)
-        
-        elif field == "description":
-            await callback.message.edit_text(
-                f"Текущее описание: {wish.description or 'Нет описания'}\n\n"
-                f"Введите новое описание (или отправьте '-' для удаления):",
-                reply_markup=get_cancel_keyboard()
-            )
-            await state.set_state(WishStates.edit_description)
-        
-        elif field == "image":
-            await callback.message.edit_text(
-                f"Отправьте новое изображение (или отправьте '-' для удаления текущего):",
-                reply_markup=get_cancel_keyboard()
-            )
-            await state.set_state(WishStates.edit_image)
-        
-        elif field == "type":
-            await callback.message.edit_text(
-                f"Текущий тип: {get_wish_type_text(wish.wish_type)}\n\n"
-                f"Выберите новый тип желания:",
-                reply_markup=get_wish_type_keyboard()
-            )
-            await state.set_state(WishStates.edit_type)
+        # Если нет фото, можем просто редактировать текст
+        await callback.message.edit_text(
+            "✏️ Что вы хотите изменить?",
+            reply_markup=get_edit_wish_menu_keyboard(wish_id, context)
+        )
+
+# Обработчик выбора поля желания для редактирования
+@router.button(WishFieldCallback)
+async def edit_wish_field(callback: CallbackQuery, callback_data: WishFieldCallback, state: FSMContext):
+    field = callback_data.field
+    
+    # Получаем данные о желании
+    data = await state.get_data()
+    wish_id = data.get("wish_id")
+    wish = await db.get_wish(wish_id)
+    
+    if not wish:
+        await callback.answer("Желание не найдено. Возможно, оно было удалено.")
+        return
+    
+    if field == "title":
+        await callback.message.edit_text(
+            f"Текущее название: {wish.title}\n\n"
+            f"Введите новое название:",
+            reply_markup=get_cancel_keyboard()
+        )
+        await state.set_state(WishStates.edit_title)
+    
+    elif field == "description":
+        await callback.message.edit_text(
+            f"Текущее описание: {wish.description or 'Нет описания'}\n\n"
+            f"Введите новое описание (или отправьте '-' для удаления):",
+            reply_markup=get_cancel_keyboard()
+        )
+        await state.set_state(WishStates.edit_description)
+    
+    elif field == "image":
+        await callback.message.edit_text(
+            f"Отправьте новое изображение (или отправьте '-' для удаления текущего):",
+            reply_markup=get_cancel_keyboard()
+        )
+        await state.set_state(WishStates.edit_image)
+    
+    elif field == "type":
+        await callback.message.edit_text(
+            f"Текущий тип: {get_wish_type_text(wish.wish_type)}\n\n"
+            f"Выберите новый тип желания:",
+            reply_markup=get_wish_type_keyboard()
+        )
+        await state.set_state(WishStates.edit_type)
 
 # Обработчик ввода нового названия желания
 @router.message(WishStates.edit_title)
@@ -1031,30 +983,29 @@ async def process_edit_wish_title(message: Message, state: FSMContext):
     # Получаем данные о желании
     data = await state.get_data()
     wish_id = data.get("wish_id")
-    wish = db.get_wish(wish_id)
+    wish = await db.get_wish(wish_id)
     
     if not wish:
         await message.answer("Желание не найдено. Возможно, оно было удалено.")
         await state.clear()
         return
     
-    # Обновляем название желания
-    wish.title = new_title
-    db.update_wish(wish)
-    
-    await message.answer(f"✅ Название желания успешно обновлено!")
+    wish = wish.replace(title=new_title)
 
     # Уведомляем партнера об изменении названия желания
-    partner_id = db.get_partner_id(message.from_user.id)
+    notify = []
+    partner_id = await db.get_partner_id(message.from_user.id)
     if partner_id and wish.created_by != partner_id:
-        try:
-            await message.bot.send_message(
-                partner_id,
-                f"🎁 Обновление желания!\n"
-                f"📌 Желание изменено: новое название \"{wish.title}\""
-            )
-        except Exception as e:
-            logging.error(f"Ошибка при отправке уведомления об изменении названия желания: {e}")
+        notify.append(notification(
+            partner_id,
+            f"🎁 Обновление желания!\n"
+            f"📌 Желание изменено: новое название \"{wish.title}\""
+        ))
+
+    # Обновляем название желания
+    await db.update_wish(wish, notify=notify)
+    
+    await message.answer(f"✅ Название желания успешно обновлено!")
     
     # Очищаем состояние редактирования
     await state.set_data({})
@@ -1089,30 +1040,29 @@ async def process_edit_wish_description(message: Message, state: FSMContext):
     # Получаем данные о желании
     data = await state.get_data()
     wish_id = data.get("wish_id")
-    wish = db.get_wish(wish_id)
+    wish = await db.get_wish(wish_id)
     
     if not wish:
         await message.answer("Желание не найдено. Возможно, оно было удалено.")
         await state.clear()
         return
     
-    # Обновляем описание желания
-    wish.description = new_description
-    db.update_wish(wish)
-    
-    await message.answer(f"✅ Описание желания успешно обновлено!")
+    wish = wish.replace(description=new_description)
 
     # Уведомляем партнера об изменении описания желания
-    partner_id = db.get_partner_id(message.from_user.id)
+    notify = []
+    partner_id = await db.get_partner_id(message.from_user.id)
     if partner_id and wish.created_by != partner_id:
-        try:
-            await message.bot.send_message(
-                partner_id,
-                f"🎁 Обновление желания!\n"
-                f"📌 У желания \"{wish.title}\" изменено описание"
-            )
-        except Exception as e:
-            logging.error(f"Ошибка при отправке уведомления об изменении описания желания: {e}")
+        notify.append(notification(
+            partner_id,
+            f"🎁 Обновление желания!\n"
+            f"📌 У желания \"{wish.title}\" изменено описание"
+        ))
+
+    # Обновляем описание желания
+    await db.update_wish(wish, notify=notify)
+    
+    await message.answer(f"✅ Описание желания успешно обновлено!")
     
     # Очищаем состояние редактирования
     await state.set_data({})
@@ -1143,7 +1093,7 @@ async def process_edit_wish_image(message: Message, state: FSMContext):
     # Получаем данные о желании
     data = await state.get_data()
     wish_id = data.get("wish_id")
-    wish = db.get_wish(wish_id)
+    wish = await db.get_wish(wish_id)
     
     if not wish:
         await message.answer("Желание не найдено. Возможно, оно было удалено.")
@@ -1152,34 +1102,26 @@ async def process_edit_wish_image(message: Message, state: FSMContext):
     
     if message.text == "-":
         # Если пользователь отправил "-", удаляем изображение
-        wish.image_id = None
+        wish = wish.replace(image_id=None)
     else:
         # Иначе обновляем изображение
-        wish.image_id = message.photo[-1].file_id
-    
-    db.update_wish(wish)
+        wish = wish.replace(image_id=message.photo[-1].file_id)
     
-    await message.answer(f"✅ Изображение желания успешно обновлено!")
-
     # Уведомляем партнера об изменении изображения желания
-    partner_id = db.get_partner_id(message.from_user.id)
+    notify = []
+    partner_id = await db.get_partner_id(message.from_user.id)
     if partner_id and wish.created_by != partner_id:
-        try:
-            if wish.image_id:
-                await message.bot.send_photo(
-                    partner_id,
-                    photo=wish.image_id,
-                    caption=f"🎁 Обновление желания!\n"
-                    f"📌 У желания \"{wish.title}\" обновлено изображение"
-                )
-            else:
-                await message.bot.send_message(
-                    partner_id,
-                    f"🎁 Обновление желания!\n"
-                    f"📌 У желания \"{wish.title}\" удалено изображение"
-                )
-        except Exception as e:
-            logging.error(f"Ошибка при отправке уведомления об изменении изображения: {e}")
+        change_text = "обновлено" if wish.image_id else "удалено"
+        notify.append(notification(
+            partner_id,
+            f"🎁 Обновление желания!\n"
+            f"📌 У желания \"{wish.title}\" {change_text} изображение",
+            photo=wish.image_id
+        ))
+
+    await db.update_wish(wish, notify=notify)
+    
+    await message.answer(f"✅ Изображение желания успешно обновлено!")
     
     # Очищаем состояние редактирования
     await state.set_data({})
@@ -1205,45 +1147,33 @@ async def process_edit_wish_image(message: Message, state: FSMContext):
         )
 
 # Обработчик выбора нового типа желания
-@router.callback_query(WishStates.edit_type, F.data.startswith("wish_type:"))
-async def process_edit_wish_type(callback: CallbackQuery, state: FSMContext):
-    new_type = WishType(callback.data.split(":")[1])
+@router.button(WishTypeCallback, WishStates.edit_type)
+async def process_edit_wish_type(callback: CallbackQuery, callback_data: WishTypeCallback, state: FSMContext):
+    new_type = callback_data.wish_type
     
     # Получаем данные о желании
     data = await state.get_data()
     wish_id = data.get("wish_id")
-    wish = db.get_wish(wish_id)
+    wish = await db.get_wish(wish_id)
     
     if not wish:
         await callback.answer("Желание не найдено. Возможно, оно было удалено.")
         await state.clear()
         return
     
-    # Обновляем тип желания
-    wish.wish_type = new_type
-    db.update_wish(wish)
-    
-    await callback.answer(f"✅ Тип желания успешно обновлен!")
+    wish = wish.replace(wish_type=new_type)
 
     # Уведомляем партнера об изменении типа желания
-    partner_id = db.get_partner_id(callback.from_user.id)
+    notify = []
+    partner_id = await db.get_partner_id(callback.from_user.id)
     if partner_id and wish.created_by != partner_id:
-        try:
-            msg = f"🎁 Обновление желания!\n📌 У желания \"{wish.title}\" изменен тип на {get_wish_type_text(wish.wish_type)}"
-            
-            if wish.image_id:
-                await callback.bot.send_photo(
-                    partner_id,
-                    photo=wish.image_id,
-                    caption=msg
-                )
-            else:
-                await callback.bot.send_message(
-                    partner_id,
-                    msg
-                )
-        except Exception as e:
-            logging.error(f"Ошибка при отправке уведомления об изменении типа желания: {e}")
+        msg = f"🎁 Обновление желания!\n📌 У желания \"{wish.title}\" изменен тип на {get_wish_type_text(wish.wish_type)}"
+        notify.append(notification(partner_id, msg, photo=wish.image_id))
+
+    # Обновляем тип желания
+    await db.update_wish(wish, notify=notify)
+    
+    await callback.answer(f"✅ Тип желания успешно обновлен!")
     
     # Очищаем состояние
     await state.clear()
@@ -1271,10 +1201,10 @@ async def process_edit_wish_type(callback: CallbackQuery, state: FSMContext):
         )
 
 # Обработчик удаления желания
-@router.callback_query(F.data.startswith("delete_wish:"))
-async def confirm_delete_wish(callback: CallbackQuery):
-    wish_id = int(callback.data.split(":")[1])
-    wish = db.get_wish(wish_id)
+@router.button(DeleteWishCallback)
+async def confirm_delete_wish(callback: CallbackQuery, callback_data: DeleteWishCallback):
+    wish_id = callback_data.wish_id
+    wish = await db.get_wish(wish_id)
     
     if not wish:
         await callback.answer("Желание не найдено. Возможно, оно было удалено.")
@@ -1288,45 +1218,40 @@ async def confirm_delete_wish(callback: CallbackQuery):
         await callback.message.delete()
         await callback.message.answer(
             confirmation_text,
-            reply_markup=get_confirm_keyboard("delete_wish", wish_id)
+            reply_markup=get_confirm_keyboard(
+                ConfirmDeleteWishCallback(wish_id=wish_id), ViewWishCallback(wish_id=wish_id)
+            )
         )
     else:
         # Если сообщение текстовое, просто редактируем текст
         await callback.message.edit_text(
             confirmation_text,
-            reply_markup=get_confirm_keyboard("delete_wish", wish_id)
+            reply_markup=get_confirm_keyboard(
+                ConfirmDeleteWishCallback(wish_id=wish_id), ViewWishCallback(wish_id=wish_id)
+            )
         )
 
 # Обработчик подтверждения удаления желания
-@router.callback_query(F.data.startswith("confirm_delete_wish:"))
-async def delete_wish(callback: CallbackQuery):
-    wish_id = int(callback.data.split(":")[1])
+@router.button(ConfirmDeleteWishCallback)
+async def delete_wish(callback: CallbackQuery, callback_data: ConfirmDeleteWishCallback):
+    wish_id = callback_data.wish_id
 
     # Получаем желание перед удалением, чтобы знать детали
-    wish = db.get_wish(wish_id)
-    # Уведомляем партнера об удалении желания
+    wish = await db.get_wish(wish_id)
+    # Уведомляем партнера об удалении желания (уйдёт, только если оно удалится)
+    notify = []
     if wish:
-        partner_id = db.get_partner_id(callback.from_user.id)
+        partner_id = await db.get_partner_id(callback.from_user.id)
         if partner_id and wish.created_by != partner_id:
-            try:
-                if wish.image_id:
-                    await callback.bot.send_photo(
-                        partner_id,
-                        photo=wish.image_id,
-                        caption=f"🎁 Желание удалено!\n"
-                        f"📌 Желание \"{wish.title}\" было удалено"
-                    )
-                else:
-                    await callback.bot.send_message(
-                        partner_id,
-                        f"🎁 Желание удалено!\n"
-                        f"📌 Желание \"{wish.title}\" было удалено"
-                    )
-            except Exception as e:
-                logging.error(f"Ошибка при отправке уведомления об удалении желания: {e}")
+            notify.append(notification(
+                partner_id,
+                f"🎁 Желание удалено!\n"
+                f"📌 Желание \"{wish.title}\" было удалено",
+                photo=wish.image_id
+            ))
     
     # Удаляем желание
-    success = db.delete_wish(wish_id)
+    success = await db.delete_wish(wish_id, notify=notify)
     
     if success:
         await callback.answer("✅ Желание успешно удалено!")
@@ -1336,35 +1261,33 @@ async def delete_wish(callback: CallbackQuery):
         await callback.message.edit_text("Желание было удалено.")
         await callback.message.answer(
             "Что бы вы хотели сделать дальше?",
-            reply_markup=get_main_keyboard()
+            reply_markup=await main_keyboard(callback.from_user.id)
         )
     else:
         await callback.answer("❌ Ошибка при удалении желания.")
 
 # Обработчик переключения страниц в списке желаний
-@router.callback_query(F.data.startswith("wish_page:"))
-async def handle_wish_page(callback: CallbackQuery, state: FSMContext):
-    page = int(callback.data.split(":")[1])
+@router.button(WishesPageCallback)
+async def handle_wish_page(callback: CallbackQuery, callback_data: WishesPageCallback, state: FSMContext):
+    cursor = callback_data.cursor
     
     # Получаем контекст из состояния
     data = await state.get_data()
     context = data.get("wish_context", "my_wishes")
     
-    filtered_wishes = db.get_my_wishes(callback.from_user.id) if context == "my_wishes" else db.get_partner_wishes(callback.from_user.id)
+    filtered_wishes = await db.get_my_wishes(callback.from_user.id, cursor) if context == "my_wishes" else await db.get_partner_wishes(callback.from_user.id, cursor)
     
     title = "✨ Ваши желания:" if context == "my_wishes" else "🎀 Желания вашего партнёра:"
     
     await callback.message.edit_text(
         title,
-        reply_markup=get_wishes_list_keyboard(filtered_wishes, page=page, context=context)
+        reply_markup=get_wishes_list_keyboard(filtered_wishes, context=context)
     )
 
 # Обработчик кнопки "Назад к желаниям"
-@router.callback_query(F.data.startswith("back_to_wishes"))
-async def back_to_wishes(callback: CallbackQuery, state: FSMContext):
-    # Получаем контекст из колбэка или из стейта
-    parts = callback.data.split(":")
-    context = parts[1] if len(parts) > 1 else "my_wishes"
+@router.button(WishesBackCallback)
+async def back_to_wishes(callback: CallbackQuery, callback_data: WishesBackCallback, state: FSMContext):
+    context = callback_data.context
     
     # На всякий случай обновляем контекст в стейте
     await state.update_data(wish_context=context)
@@ -1373,13 +1296,13 @@ async def back_to_wishes(callback: CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
     
     if context == "my_wishes":
-        filtered_wishes = db.get_my_wishes(user_id)
+        filtered_wishes = await db.get_my_wishes(user_id)
         title = "✨ Ваши желания:"
     elif context == "partner_wishes":
-        filtered_wishes = db.get_partner_wishes(user_id)
+        filtered_wishes = await db.get_partner_wishes(user_id)
         title = "🎀 Желания вашего партнёра:"
     else:
-        filtered_wishes = db.get_wishes(user_id)
+        filtered_wishes = await db.get_wishes(user_id)
         title = "🎁 Все желания:"
     
     # Проверяем, содержит ли сообщение фото
@@ -1414,19 +1337,80 @@ async def cmd_help(message: Message):
         "• Просмотр своих желаний и желаний партнера\n\n"
         "<b>Команды:</b>\n"
         "/start - Запустить бота\n"
-        "/help - Показать эту справку\n\n"
+        "/help - Показать эту справку\n"
+        "/search - Поиск по задачам, желаниям и фильмам\n"
+        "/rebuild_stats - Пересчитать статистику фильмов\n\n"
         "Для начала работы, нажмите на кнопки в меню внизу экрана."
     )
     
-    await message.answer(help_text, parse_mode="HTML", reply_markup=get_main_keyboard())
+    await message.answer(help_text, parse_mode="HTML", reply_markup=await main_keyboard(message.from_user.id))
+
+# Поиск
+SEARCH_KIND_EMOJI = {"task": "📋", "wish": "🎁", "movie": "🎬"}
+
+def render_search_results(query: str, page) -> str:
+    """Текст страницы поиска (HTML): названия и фрагменты с подсветкой"""
+    text = f"🔎 Результаты поиска «{html.escape(query)}»:\n\n"
+    for hit in page.items:
+        snippet = html.escape(hit.snippet).replace(SNIPPET_START, "<b>").replace(SNIPPET_END, "</b>")
+        text += f"{SEARCH_KIND_EMOJI[hit.kind]} {html.escape(hit.title)}\n{snippet}\n\n"
+    return text
+
+async def show_search_results(message: Message, user_id: int, query: str, cursor: str = None, edit: bool = False):
+    page = await db.get_search_results(user_id, query, cursor)
+    if not page.items:
+        text, markup = f"По запросу «{html.escape(query)}» ничего не найдено.", None
+    else:
+        text, markup = render_search_results(query, page), get_search_results_keyboard(page, user_id)
+    
+    if edit:
+        await message.edit_text(text, parse_mode="HTML", reply_markup=markup)
+    else:
+        await message.answer(text, parse_mode="HTML", reply_markup=markup)
+
+@router.message(Command("search"))
+async def cmd_search(message: Message, command: CommandObject, state: FSMContext):
+    if command.args:
+        await state.update_data(search_query=command.args)
+        await show_search_results(message, message.from_user.id, command.args)
+        return
+    
+    await message.answer("Что ищем? Отправьте слово или фразу:", reply_markup=get_cancel_keyboard())
+    await state.set_state(SearchStates.waiting_for_query)
+
+@router.message(SearchStates.waiting_for_query)
+async def process_search_query(message: Message, state: FSMContext):
+    await state.set_state(None)
+    await state.update_data(search_query=message.text)
+    await show_search_results(message, message.from_user.id, message.text or "")
+
+@router.button(SearchPageCallback)
+async def handle_search_page(callback: CallbackQuery, callback_data: SearchPageCallback, state: FSMContext):
+    cursor = callback_data.cursor
+    query = (await state.get_data()).get("search_query")
+    if not query:
+        await callback.answer("Поиск устарел, повторите /search")
+        return
+    
+    await show_search_results(callback.message, callback.from_user.id, query, cursor, edit=True)
+    await callback.answer()
+
+# Обработчик команды /rebuild_stats
+@router.message(Command("rebuild_stats"))
+async def cmd_rebuild_stats(message: Message):
+    if message.from_user.id not in ADMIN_IDS:
+        return
+    
+    await db.rebuild_movie_stats()
+    await message.answer("📊 Статистика фильмов пересчитана.")
 
 # Обработчик кнопки "Выполненные задачи"
-@router.message(F.text == "✅ Выполненные задачи")
+@router.message(F.text.startswith("✅ Выполненные задачи"))
 async def show_completed_tasks(message: Message, state: FSMContext):
     user_id = message.from_user.id
     
     # Получаем выполненные задачи
-    completed_tasks = db.get_completed_tasks(user_id)
+    completed_tasks = await db.get_completed_tasks(user_id)
     
     if not completed_tasks:
         await message.answer("У вас пока нет выполненных задач.")
@@ -1440,19 +1424,19 @@ async def show_completed_tasks(message: Message, state: FSMContext):
     )
 
 # Movie handlers
-@router.message(F.text == "🎬 Фильмы")
+@router.message(F.text.startswith("🎬 Фильмы"))
 async def show_movies_menu(message: Message, state: FSMContext):
     await message.answer(
         "Выберите действие:",
         reply_markup=get_movies_menu_keyboard()
     )
 
-@router.callback_query(F.data.startswith("movies:"))
-async def handle_movies_menu(callback: CallbackQuery, state: FSMContext):
-    action = callback.data.split(":")[1]
+@router.button(MoviesMenuCallback)
+async def handle_movies_menu(callback: CallbackQuery, callback_data: MoviesMenuCallback, state: FSMContext):
+    action = callback_data.action
     
     if action == "my":
-        movies = db.get_my_movies(callback.from_user.id)
+        movies = await db.get_my_movies(callback.from_user.id)
         if not movies:
             await callback.message.edit_text(
                 "У вас пока нет фильмов в списке.",
@@ -1460,13 +1444,14 @@ async def handle_movies_menu(callback: CallbackQuery, state: FSMContext):
             )
             return
             
+        await state.update_data(movie_context="my_movies")
         await callback.message.edit_text(
             "Ваши фильмы:",
             reply_markup=get_movies_list_keyboard(movies, context="my_movies")
         )
         
     elif action == "partner":
-        movies = db.get_partner_movies(callback.from_user.id)
+        movies = await db.get_partner_movies(callback.from_user.id)
         if not movies:
             await callback.message.edit_text(
                 "У партнёра пока нет фильмов в списке.",
@@ -1474,6 +1459,7 @@ async def handle_movies_menu(callback: CallbackQuery, state: FSMContext):
             )
             return
             
+        await state.update_data(movie_context="partner_movies")
         await callback.message.edit_text(
             "Фильмы партнёра:",
             reply_markup=get_movies_list_keyboard(movies, context="partner_movies")
@@ -1486,12 +1472,15 @@ async def handle_movies_menu(callback: CallbackQuery, state: FSMContext):
         )
         
     elif action == "stats":
-        stats = db.get_movie_stats(callback.from_user.id)
+        stats = await db.get_movie_stats(callback.from_user.id)
         text = "📊 Статистика фильмов:\n\n"
         text += f"Всего фильмов: {stats['total_movies']}\n"
         text += f"Просмотрено: {stats['watched_movies']}\n"
         if stats['avg_rating']:
-            text += f"Средняя оценка: {'⭐' * round(stats['avg_rating'])}"
+            text += f"Средняя оценка: {'⭐' * round(stats['avg_rating'])}\n\n"
+            for rating, count in sorted(stats['ratings'].items(), reverse=True):
+                if count:
+                    text += f"{'⭐' * rating}: {count}\n"
         
         await callback.message.edit_text(
             text,
@@ -1499,7 +1488,7 @@ async def handle_movies_menu(callback: CallbackQuery, state: FSMContext):
         )
         
     elif action == "recommendations":
-        recommendations = db.get_movie_recommendations(callback.from_user.id)
+        recommendations = await db.get_movie_recommendations(callback.from_user.id)
         if not recommendations:
             await callback.message.edit_text(
                 "К сожалению, сейчас нет рекомендаций для вас.",
@@ -1509,22 +1498,24 @@ async def handle_movies_menu(callback: CallbackQuery, state: FSMContext):
             
         text = "🎯 Рекомендуемые фильмы:\n\n"
         for movie in recommendations:
-            text += f"🎬 {movie['title']}\n"
-            if movie['description'] and movie['description'] != "-":
-                text += f"📝 {movie['description']}\n"
-            text += f"⭐ Оценка партнёра: {'⭐' * movie['rating']}\n\n"
+            text += f"🎬 {movie.title}\n"
+            if movie.description and movie.description != "-":
+                text += f"📝 {movie.description}\n"
+            if movie.rating:
+                text += f"⭐ Оценка партнёра: {'⭐' * movie.rating}\n"
+            text += "\n"
         
         await callback.message.edit_text(
             text,
             reply_markup=get_movies_menu_keyboard()
         )
 
-@router.callback_query(F.data.startswith("view_movie:"))
-async def handle_view_movie(callback: CallbackQuery, state: FSMContext):
-    movie_id = int(callback.data.split(":")[1])
-    context = callback.data.split(":")[2]
+@router.button(ViewMovieCallback)
+async def handle_view_movie(callback: CallbackQuery, callback_data: ViewMovieCallback, state: FSMContext):
+    movie_id = callback_data.movie_id
+    context = callback_data.context
     
-    movie = db.get_movie(movie_id)
+    movie = await db.get_movie(movie_id)
     if not movie:
         await callback.message.edit_text(
             "Фильм не найден.",
@@ -1532,27 +1523,27 @@ async def handle_view_movie(callback: CallbackQuery, state: FSMContext):
         )
         return
     
-    text = f"🎬 {movie['title']}\n\n"
-    if movie['description'] and movie['description'] != "-":
-        text += f"📝 {movie['description']}\n\n"
-    text += f"📅 Добавлен: {movie['created_at'].strftime('%d.%m.%Y %H:%M')}\n"
+    text = f"🎬 {movie.title}\n\n"
+    if movie.description and movie.description != "-":
+        text += f"📝 {movie.description}\n\n"
+    text += f"📅 Добавлен: {movie.created_at.strftime('%d.%m.%Y %H:%M')}\n"
     
-    if movie.get('watched', False):
-        text += f"✅ Просмотрен: {movie['watch_date'].strftime('%d.%m.%Y')}\n"
-        if movie.get('review'):
-            text += f"\n📝 Отзыв:\n{movie['review']}\n"
+    if movie.watched:
+        text += f"✅ Просмотрен: {movie.watch_date.strftime('%d.%m.%Y')}\n"
+        if movie.review:
+            text += f"\n📝 Отзыв:\n{movie.review}\n"
     
-    if movie.get('rating'):
-        text += f"\n⭐ Оценка: {'⭐' * movie['rating']}"
+    if movie.rating:
+        text += f"\n⭐ Оценка: {'⭐' * movie.rating}"
     
     await callback.message.edit_text(
         text,
-        reply_markup=get_movie_action_keyboard(movie_id, context, movie.get('watched', False))
+        reply_markup=get_movie_action_keyboard(movie_id, context, movie.watched)
     )
 
-@router.callback_query(F.data.startswith("mark_watched:"))
-async def handle_mark_watched(callback: CallbackQuery, state: FSMContext):
-    movie_id = int(callback.data.split(":")[1])
+@router.button(MarkWatchedCallback)
+async def handle_mark_watched(callback: CallbackQuery, callback_data: MarkWatchedCallback, state: FSMContext):
+    movie_id = callback_data.movie_id
     await state.update_data(marking_movie_id=movie_id)
     
     await callback.message.edit_text(
@@ -1567,20 +1558,18 @@ async def handle_movie_review(message: Message, state: FSMContext):
     movie_id = data["marking_movie_id"]
     review = "-" if message.text == "-" else message.text
     
-    movie = db.get_movie(movie_id)
-    if db.update_movie_watch_status(movie_id, True, datetime.now(), review):
-        # Уведомляем партнера о просмотре фильма
-        if movie:
-            partner_id = db.get_partner_id(message.from_user.id)
-            if partner_id:
-                try:
-                    notification = f"🎬 Фильм просмотрен!\n📌 {message.from_user.first_name} посмотрел(а) фильм \"{movie['title']}\""
-                    if review != "-":
-                        notification += f"\n\n📝 Отзыв:\n{review}"
-                    await message.bot.send_message(partner_id, notification)
-                except Exception as e:
-                    logging.error(f"Ошибка при отправке уведомления о просмотре фильма: {e}")
-        
+    movie = await db.get_movie(movie_id)
+    # Уведомляем партнера о просмотре фильма
+    notify = []
+    if movie:
+        partner_id = await db.get_partner_id(message.from_user.id)
+        if partner_id:
+            notification_text = f"🎬 Фильм просмотрен!\n📌 {message.from_user.first_name} посмотрел(а) фильм \"{movie.title}\""
+            if review != "-":
+                notification_text += f"\n\n📝 Отзыв:\n{review}"
+            notify.append(notification(partner_id, notification_text))
+
+    if await db.update_movie_watch_status(movie_id, True, datetime.now(), review, notify=notify):
         await message.answer(
             "Фильм отмечен как просмотренный!",
             reply_markup=get_movies_menu_keyboard()
@@ -1592,9 +1581,9 @@ async def handle_movie_review(message: Message, state: FSMContext):
         )
     await state.clear()
 
-@router.callback_query(F.data.startswith("add_review:"))
-async def handle_add_review(callback: CallbackQuery, state: FSMContext):
-    movie_id = int(callback.data.split(":")[1])
+@router.button(AddReviewCallback)
+async def handle_add_review(callback: CallbackQuery, callback_data: AddReviewCallback, state: FSMContext):
+    movie_id = callback_data.movie_id
     await state.update_data(reviewing_movie_id=movie_id)
     
     await callback.message.edit_text(
@@ -1608,7 +1597,7 @@ async def handle_movie_review_edit(message: Message, state: FSMContext):
     data = await state.get_data()
     movie_id = data["reviewing_movie_id"]
     
-    movie = db.get_movie(movie_id)
+    movie = await db.get_movie(movie_id)
     if not movie:
         await message.answer(
             "Фильм не найден.",
@@ -1617,20 +1606,18 @@ async def handle_movie_review_edit(message: Message, state: FSMContext):
         await state.clear()
         return
     
-    if db.update_movie_watch_status(movie_id, movie['watched'], movie['watch_date'], message.text):
-        # Уведомляем партнера о новом отзыве
-        partner_id = db.get_partner_id(message.from_user.id)
-        if partner_id:
-            try:
-                await message.bot.send_message(
-                    partner_id,
-                    f"🎬 Новый отзыв!\n"
-                    f"📌 {message.from_user.first_name} оставил(а) отзыв о фильме \"{movie['title']}\":\n\n"
-                    f"{message.text}"
-                )
-            except Exception as e:
-                logging.error(f"Ошибка при отправке уведомления о новом отзыве: {e}")
-        
+    # Уведомляем партнера о новом отзыве
+    notify = []
+    partner_id = await db.get_partner_id(message.from_user.id)
+    if partner_id:
+        notify.append(notification(
+            partner_id,
+            f"🎬 Новый отзыв!\n"
+            f"📌 {message.from_user.first_name} оставил(а) отзыв о фильме \"{movie.title}\":\n\n"
+            f"{message.text}"
+        ))
+
+    if await db.update_movie_watch_status(movie_id, movie.watched, movie.watch_date, message.text, notify=notify):
         await message.answer(
             "Отзыв успешно добавлен!",
             reply_markup=get_movies_menu_keyboard()
@@ -1642,10 +1629,9 @@ async def handle_movie_review_edit(message: Message, state: FSMContext):
         )
     await state.clear()
 
-@router.callback_query(F.data.startswith("movie_type:"))
-async def handle_movie_type(callback: CallbackQuery, state: FSMContext):
-    movie_type = callback.data.split(":")[1]
-    await state.update_data(movie_type=movie_type)
+@router.button(MovieTypeCallback)
+async def handle_movie_type(callback: CallbackQuery, callback_data: MovieTypeCallback, state: FSMContext):
+    await state.update_data(movie_type=callback_data.movie_type.value)
     
     await callback.message.edit_text(
         "Введите название фильма:",
@@ -1668,25 +1654,23 @@ async def handle_movie_description(message: Message, state: FSMContext):
     data = await state.get_data()
     description = "-" if message.text == "-" else message.text
     
-    movie_id = db.add_movie(
+    # Уведомляем партнера о новом фильме
+    notify = []
+    partner_id = await db.get_partner_id(message.from_user.id)
+    if partner_id:
+        movie_type_text = "свой список" if data["movie_type"] == "my_movies" else "ваш список"
+        notify.append(notification(
+            partner_id,
+            f"🎬 Новый фильм!\n"
+            f"📌 {message.from_user.first_name} добавил(а) фильм \"{data['movie_title']}\" в {movie_type_text}"
+        ))
+
+    movie_id = await db.add_movie(Movie(
         title=data["movie_title"],
         description=description,
-        movie_type=data["movie_type"],
+        movie_type=MovieType(data["movie_type"]),
         created_by=message.from_user.id
-    )
-    
-    # Уведомляем партнера о новом фильме
-    partner_id = db.get_partner_id(message.from_user.id)
-    if partner_id:
-        try:
-            movie_type_text = "свой список" if data["movie_type"] == "my_movies" else "ваш список"
-            await message.bot.send_message(
-                partner_id,
-                f"🎬 Новый фильм!\n"
-                f"📌 {message.from_user.first_name} добавил(а) фильм \"{data['movie_title']}\" в {movie_type_text}"
-            )
-        except Exception as e:
-            logging.error(f"Ошибка при отправке уведомления о новом фильме: {e}")
+    ), notify=notify)
     
     await message.answer(
         "Фильм успешно добавлен!",
@@ -1694,38 +1678,37 @@ async def handle_movie_description(message: Message, state: FSMContext):
     )
     await state.clear()
 
-@router.callback_query(F.data.startswith("edit_movie:"))
-async def handle_edit_movie(callback: CallbackQuery, state: FSMContext):
-    action = callback.data.split(":")[1]
-    
-    if action == "title":
+@router.button(EditMovieCallback)
+async def handle_edit_movie(callback: CallbackQuery, callback_data: EditMovieCallback, state: FSMContext):
+    movie_id = callback_data.movie_id
+    await state.update_data(editing_movie_id=movie_id)
+    await callback.message.edit_text(
+        "Выберите, что хотите изменить:",
+        reply_markup=get_edit_movie_menu_keyboard(movie_id)
+    )
+
+@router.button(MovieFieldCallback)
+async def handle_edit_movie_field(callback: CallbackQuery, callback_data: MovieFieldCallback, state: FSMContext):
+    if callback_data.field == "title":
         await callback.message.edit_text(
             "Введите новое название фильма:",
             reply_markup=get_cancel_keyboard()
         )
         await state.set_state("waiting_for_movie_title_edit")
         
-    elif action == "description":
+    elif callback_data.field == "description":
         await callback.message.edit_text(
             "Введите новое описание фильма (или отправьте '-' если описание не нужно):",
             reply_markup=get_cancel_keyboard()
         )
         await state.set_state("waiting_for_movie_description_edit")
-        
-    else:
-        movie_id = int(action)
-        await state.update_data(editing_movie_id=movie_id)
-        await callback.message.edit_text(
-            "Выберите, что хотите изменить:",
-            reply_markup=get_edit_movie_menu_keyboard(movie_id)
-        )
 
 @router.message(StateFilter("waiting_for_movie_title_edit"))
 async def handle_movie_title_edit(message: Message, state: FSMContext):
     data = await state.get_data()
     movie_id = data["editing_movie_id"]
     
-    movie = db.get_movie(movie_id)
+    movie = await db.get_movie(movie_id)
     if not movie:
         await message.answer(
             "Фильм не найден.",
@@ -1734,19 +1717,17 @@ async def handle_movie_title_edit(message: Message, state: FSMContext):
         await state.clear()
         return
     
-    if db.update_movie(movie_id, message.text, movie["description"]):
-        # Уведомляем партнера об изменении названия фильма
-        partner_id = db.get_partner_id(message.from_user.id)
-        if partner_id:
-            try:
-                await message.bot.send_message(
-                    partner_id,
-                    f"🎬 Обновление фильма!\n"
-                    f"📌 {message.from_user.first_name} изменил(а) название фильма на \"{message.text}\""
-                )
-            except Exception as e:
-                logging.error(f"Ошибка при отправке уведомления об изменении названия фильма: {e}")
-        
+    # Уведомляем партнера об изменении названия фильма
+    notify = []
+    partner_id = await db.get_partner_id(message.from_user.id)
+    if partner_id:
+        notify.append(notification(
+            partner_id,
+            f"🎬 Обновление фильма!\n"
+            f"📌 {message.from_user.first_name} изменил(а) название фильма на \"{message.text}\""
+        ))
+
+    if await db.update_movie(movie_id, message.text, movie.description, notify=notify):
         await message.answer(
             "Название фильма успешно обновлено!",
             reply_markup=get_movies_menu_keyboard()
@@ -1763,7 +1744,7 @@ async def handle_movie_description_edit(message: Message, state: FSMContext):
     data = await state.get_data()
     movie_id = data["editing_movie_id"]
     
-    movie = db.get_movie(movie_id)
+    movie = await db.get_movie(movie_id)
     if not movie:
         await message.answer(
             "Фильм не найден.",
@@ -1773,7 +1754,7 @@ async def handle_movie_description_edit(message: Message, state: FSMContext):
         return
     
     description = "-" if message.text == "-" else message.text
-    if db.update_movie(movie_id, movie["title"], description):
+    if await db.update_movie(movie_id, movie.title, description):
         await message.answer(
             "Описание фильма успешно обновлено!",
             reply_markup=get_movies_menu_keyboard()
@@ -1785,20 +1766,23 @@ async def handle_movie_description_edit(message: Message, state: FSMContext):
         )
     await state.clear()
 
-@router.callback_query(F.data.startswith("delete_movie:"))
-async def handle_delete_movie(callback: CallbackQuery, state: FSMContext):
-    movie_id = int(callback.data.split(":")[1])
+@router.button(DeleteMovieCallback)
+async def handle_delete_movie(callback: CallbackQuery, callback_data: DeleteMovieCallback, state: FSMContext):
+    movie_id = callback_data.movie_id
     
     await callback.message.edit_text(
         "Вы уверены, что хотите удалить этот фильм?",
-        reply_markup=get_confirm_keyboard("delete_movie", movie_id)
+        reply_markup=get_confirm_keyboard(
+            ConfirmDeleteMovieCallback(movie_id=movie_id), ViewMovieCallback(movie_id=movie_id)
+        )
     )
 
-@router.callback_query(F.data.startswith("confirm_delete_movie:"))
-async def handle_confirm_delete_movie(callback: CallbackQuery, state: FSMContext):
-    movie_id = int(callback.data.split(":")[1])
+@router.button(ConfirmDeleteMovieCallback)
+async def handle_confirm_delete_movie(callback: CallbackQuery, callback_data: ConfirmDeleteMovieCallback,
+                                      state: FSMContext):
+    movie_id = callback_data.movie_id
     
-    if db.delete_movie(movie_id):
+    if await db.delete_movie(movie_id):
         await callback.message.edit_text(
             "Фильм успешно удалён!",
             reply_markup=get_movies_menu_keyboard()
@@ -1809,12 +1793,13 @@ async def handle_confirm_delete_movie(callback: CallbackQuery, state: FSMContext
             reply_markup=get_movies_menu_keyboard()
         )
 
-@router.callback_query(F.data.startswith("back_to_movies:"))
-async def handle_back_to_movies(callback: CallbackQuery, state: FSMContext):
-    context = callback.data.split(":")[1]
+@router.button(MoviesBackCallback)
+async def handle_back_to_movies(callback: CallbackQuery, callback_data: MoviesBackCallback, state: FSMContext):
+    context = callback_data.context
+    await state.update_data(movie_context=context)
     
     if context == "my_movies":
-        movies = db.get_my_movies(callback.from_user.id)
+        movies = await db.get_my_movies(callback.from_user.id)
         if not movies:
             await callback.message.edit_text(
                 "У вас пока нет фильмов в списке.",
@@ -1827,7 +1812,7 @@ async def handle_back_to_movies(callback: CallbackQuery, state: FSMContext):
             reply_markup=get_movies_list_keyboard(movies, context="my_movies")
         )
     else:
-        movies = db.get_partner_movies(callback.from_user.id)
+        movies = await db.get_partner_movies(callback.from_user.id)
         if not movies:
             await callback.message.edit_text(
                 "У партнёра пока нет фильмов в списке.",
@@ -1840,54 +1825,64 @@ async def handle_back_to_movies(callback: CallbackQuery, state: FSMContext):
             reply_markup=get_movies_list_keyboard(movies, context="partner_movies")
         )
 
-@router.callback_query(F.data.startswith("movie_page:"))
-async def handle_movie_page(callback: CallbackQuery, state: FSMContext):
-    page = int(callback.data.split(":")[1])
-    context = "my_movies" if "my_movies" in callback.message.text else "partner_movies"
+@router.button(MoviesPageCallback)
+async def handle_movie_page(callback: CallbackQuery, callback_data: MoviesPageCallback, state: FSMContext):
+    cursor = callback_data.cursor
     
-    movies = db.get_my_movies(callback.from_user.id) if context == "my_movies" else db.get_partner_movies(callback.from_user.id)
+    # Получаем контекст из состояния
+    data = await state.get_data()
+    context = data.get("movie_context", "my_movies")
+    
+    movies = await db.get_my_movies(callback.from_user.id, cursor) if context == "my_movies" else await db.get_partner_movies(callback.from_user.id, cursor)
     
     await callback.message.edit_text(
         callback.message.text,
-        reply_markup=get_movies_list_keyboard(movies, page=page, context=context)
+        reply_markup=get_movies_list_keyboard(movies, context=context)
     )
 
-@router.callback_query(lambda c: c.data.startswith('rate_movie:'))
-async def process_rate_movie(callback_query: types.CallbackQuery, state: FSMContext):
-    movie_id = int(callback_query.data.split(':')[1])
+@router.button(RateMovieCallback)
+async def process_rate_movie(callback_query: types.CallbackQuery, callback_data: RateMovieCallback, state: FSMContext):
+    movie_id = callback_data.movie_id
     await callback_query.message.edit_text(
         "Выберите, насколько вы хотите посмотреть этот фильм:",
         reply_markup=get_movie_rating_keyboard(movie_id)
     )
 
-@router.callback_query(lambda c: c.data.startswith('set_rating:'))
-async def process_set_rating(callback_query: types.CallbackQuery, state: FSMContext):
-    _, movie_id, rating = callback_query.data.split(':')
-    movie_id = int(movie_id)
-    rating = int(rating)
-    
-    if db.update_movie_rating(movie_id, rating):
-        movie = db.get_movie(movie_id)
-        # Отправляем уведомление партнеру
-        partner_id = db.get_partner_id(callback_query.from_user.id)
-        if partner_id:
-            try:
-                await callback_query.bot.send_message(
-                    partner_id,
-                    f"⭐ Оценка фильма!\n"
-                    f"📌 {callback_query.from_user.first_name} оценил(а) фильм \"{movie['title']}\" на {rating} звезд"
-                )
-            except Exception as e:
-                logging.error(f"Ошибка при отправке уведомления об оценке фильма: {e}")
-        
+@router.button(SetRatingCallback)
+async def process_set_rating(callback_query: types.CallbackQuery, callback_data: SetRatingCallback, state: FSMContext):
+    movie_id = callback_data.movie_id
+    rating = callback_data.rating
+    
+    # Уведомление партнеру пишется в outbox вместе с оценкой
+    notify = []
+    movie = await db.get_movie(movie_id)
+    partner_id = await db.get_partner_id(callback_query.from_user.id)
+    if movie and partner_id:
+        notify.append(notification(
+            partner_id,
+            f"⭐ Оценка фильма!\n"
+            f"📌 {callback_query.from_user.first_name} оценил(а) фильм \"{movie.title}\" на {rating} звезд"
+        ))
+
+    # Мутатор сразу возвращает обновлённый фильм
+    movie = await db.update_movie_rating(movie_id, rating, notify=notify)
+    if movie:
         await callback_query.message.edit_text(
-            f"Фильм: {movie['title']}\n"
-            f"Описание: {movie['description']}\n"
+            f"Фильм: {movie.title}\n"
+            f"Описание: {movie.description}\n"
             f"Ваша оценка: {'⭐' * rating}",
-            reply_markup=get_movie_action_keyboard(movie_id, "partner_movies", movie.get('watched', False))
+            reply_markup=get_movie_action_keyboard(movie_id, "partner_movies", movie.watched)
         )
     else:
         await callback_query.message.edit_text(
             "Произошла ошибка при сохранении оценки. Попробуйте позже.",
-            reply_markup=get_movie_action_keyboard(movie_id, "partner_movies", movie.get('watched', False))
-        )
\ No newline at end of file
+            reply_markup=get_movie_action_keyboard(movie_id, "partner_movies")
+        )
+# Регистрируется последним: сюда попадают кнопки, которые не разобрал ни один
+# обработчик и не удалось перевести из старого формата (LEGACY_CALLBACKS)
+@router.callback_query()
+async def process_outdated_button(callback_query: types.CallbackQuery):
+    await callback_query.answer(
+        "Эта кнопка устарела. Откройте нужный раздел через главное меню.",
+        show_alert=True
+    )
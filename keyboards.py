@@ -1,15 +1,32 @@
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
+from aiogram.filters.callback_data import CallbackData
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from models import TaskType, TaskStatus, WishType
+from models import TaskType, TaskStatus, WishType, MovieType
+from callbacks import (
+    MainMenuCallback, CancelCallback, TaskTypeCallback, ViewTaskCallback, TaskStatusCallback, EditTaskCallback,
+    TaskFieldCallback, DeleteTaskCallback, TasksPageCallback, TasksBackCallback, WishTypeCallback,
+    ViewWishCallback, EditWishCallback, WishFieldCallback, DeleteWishCallback, WishesPageCallback,
+    WishesBackCallback, SearchPageCallback, MoviesMenuCallback, MovieTypeCallback, ViewMovieCallback,
+    MarkWatchedCallback, AddReviewCallback, EditMovieCallback, MovieFieldCallback, DeleteMovieCallback,
+    MoviesBackCallback, MoviesPageCallback, RateMovieCallback, SetRatingCallback
+)
 
-def get_main_keyboard() -> ReplyKeyboardMarkup:
-    # Создаем основную клавиатуру для главного меню
+def with_badge(text: str, count: int = 0) -> str:
+    # Добавляет к надписи кнопки счётчик, если он не нулевой
+    return f"{text} ({count})" if count else text
+
+def get_main_keyboard(counts: dict = None) -> ReplyKeyboardMarkup:
+    # Создаем основную клавиатуру для главного меню, counts - из get_dashboard_counts
+    counts = counts or {}
     keyboard = [
         [KeyboardButton(text="🆕 Добавить задачу"), KeyboardButton(text="🎁 Добавить желание")],
-        [KeyboardButton(text="📋 Мои задачи"), KeyboardButton(text="🔄 Задачи партнера")],
-        [KeyboardButton(text="👫 Общие задачи"), KeyboardButton(text="✅ Выполненные задачи")],
-        [KeyboardButton(text="✨ Мои желания"), KeyboardButton(text="🎀 Желания партнёра")],
-        [KeyboardButton(text="🎬 Фильмы")]
+        [KeyboardButton(text=with_badge("📋 Мои задачи", counts.get('my_tasks'))),
+         KeyboardButton(text=with_badge("🔄 Задачи партнера", counts.get('partner_tasks')))],
+        [KeyboardButton(text=with_badge("👫 Общие задачи", counts.get('common_tasks'))),
+         KeyboardButton(text=with_badge("✅ Выполненные задачи", counts.get('completed_tasks')))],
+        [KeyboardButton(text=with_badge("✨ Мои желания", counts.get('my_wishes'))),
+         KeyboardButton(text=with_badge("🎀 Желания партнёра", counts.get('partner_wishes')))],
+        [KeyboardButton(text=with_badge("🎬 Фильмы", counts.get('unwatched_movies')))]
     ]
     return ReplyKeyboardMarkup(keyboard=keyboard, resize_keyboard=True)
 
@@ -18,9 +35,9 @@ def get_task_type_keyboard() -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     
     # Добавляем кнопки в билдер
-    builder.button(text="🙋‍♂️ Для себя", callback_data=f"task_type:{TaskType.FOR_ME.value}")
-    builder.button(text="👩‍❤️‍👨 Для партнера", callback_data=f"task_type:{TaskType.FOR_PARTNER.value}")
-    builder.button(text="👫 Для обоих", callback_data=f"task_type:{TaskType.FOR_BOTH.value}")
+    builder.button(text="🙋‍♂️ Для себя", callback_data=TaskTypeCallback(task_type=TaskType.FOR_ME))
+    builder.button(text="👩‍❤️‍👨 Для партнера", callback_data=TaskTypeCallback(task_type=TaskType.FOR_PARTNER))
+    builder.button(text="👫 Для обоих", callback_data=TaskTypeCallback(task_type=TaskType.FOR_BOTH))
     
     # Размещаем кнопки в один столбец
     builder.adjust(1)
@@ -33,35 +50,31 @@ def get_task_action_keyboard(task_id: int, task_status: TaskStatus, context: str
     
     # Кнопка для изменения статуса
     status_text = "✅ Отметить выполненным" if task_status == TaskStatus.ACTIVE else "🔄 Вернуть в активные"
-    status_value = TaskStatus.COMPLETED.value if task_status == TaskStatus.ACTIVE else TaskStatus.ACTIVE.value
+    new_status = TaskStatus.COMPLETED if task_status == TaskStatus.ACTIVE else TaskStatus.ACTIVE
     
     # Добавляем кнопки в билдер
-    builder.button(text=status_text, callback_data=f"task_status:{task_id}:{status_value}")
-    builder.button(text="✏️ Редактировать", callback_data=f"edit_task:{task_id}")
-    builder.button(text="🗑️ Удалить", callback_data=f"delete_task:{task_id}")
-    builder.button(text="⬅️ Назад", callback_data=f"back_to_tasks:{context}")
+    builder.button(text=status_text, callback_data=TaskStatusCallback(task_id=task_id, status=new_status))
+    builder.button(text="✏️ Редактировать", callback_data=EditTaskCallback(task_id=task_id))
+    builder.button(text="🗑️ Удалить", callback_data=DeleteTaskCallback(task_id=task_id))
+    builder.button(text="⬅️ Назад", callback_data=TasksBackCallback(context=context))
     
     # Размещаем кнопки в один столбец
     builder.adjust(1)
     
     return builder.as_markup()
 
-def get_tasks_list_keyboard(tasks, page=0, page_size=5, context="my_tasks") -> InlineKeyboardMarkup:
-    # Пагинация для списка задач
+def get_tasks_list_keyboard(page, context="my_tasks") -> InlineKeyboardMarkup:
+    # Одна страница списка задач, листание по курсорам страницы
     builder = InlineKeyboardBuilder()
     
-    start = page * page_size
-    end = min(start + page_size, len(tasks))
-    
     # Добавляем кнопки для каждой задачи на текущей странице
-    for i in range(start, end):
-        task = tasks[i]
+    for task in page.items:
         status_emoji = "✅" if task.status == TaskStatus.COMPLETED else "🔄"
         # Обрезаем длинные названия задач
         title_display = task.title[:30] + "..." if len(task.title) > 30 else task.title
         builder.button(
             text=f"{status_emoji} {title_display}", 
-            callback_data=f"view_task:{task.id}:{context}"
+            callback_data=ViewTaskCallback(task_id=task.id, context=context)
         )
     
     # Размещаем кнопки задач в один столбец
@@ -70,19 +83,19 @@ def get_tasks_list_keyboard(tasks, page=0, page_size=5, context="my_tasks") -> I
     # Добавляем кнопки пагинации, если они нужны
     pagination_buttons = []
     
-    if page > 0:
-        builder.button(text="⬅️ Назад", callback_data=f"page:{page-1}")
+    if page.has_prev:
+        builder.button(text="⬅️ Назад", callback_data=TasksPageCallback(cursor=page.prev_cursor))
     
-    if end < len(tasks):
-        builder.button(text="➡️ Вперед", callback_data=f"page:{page+1}")
+    if page.has_next:
+        builder.button(text="➡️ Вперед", callback_data=TasksPageCallback(cursor=page.next_cursor))
     
     # Если есть кнопки пагинации, размещаем их в одну строку
-    if page > 0 or end < len(tasks):
+    if page.has_prev or page.has_next:
         # Здесь количество кнопок в последней добавленной строке - количество кнопок пагинации (1 или 2)
         builder.adjust(1, 2)  
     
     # Кнопка возврата в главное меню
-    builder.button(text="🏠 Главное меню", callback_data="main_menu")
+    builder.button(text="🏠 Главное меню", callback_data=MainMenuCallback())
     builder.adjust(1)  # Кнопка меню в отдельной строке
     
     return builder.as_markup()
@@ -90,14 +103,14 @@ def get_tasks_list_keyboard(tasks, page=0, page_size=5, context="my_tasks") -> I
 def get_cancel_keyboard() -> InlineKeyboardMarkup:
     # Клавиатура для отмены текущего действия
     builder = InlineKeyboardBuilder()
-    builder.button(text="❌ Отмена", callback_data="cancel")
+    builder.button(text="❌ Отмена", callback_data=CancelCallback())
     return builder.as_markup()
 
-def get_confirm_keyboard(action: str, task_id: int) -> InlineKeyboardMarkup:
-    # Клавиатура для подтверждения действия
+def get_confirm_keyboard(confirm: CallbackData, back: CallbackData) -> InlineKeyboardMarkup:
+    # Клавиатура для подтверждения действия: "Да" - confirm, "Нет" - back
     builder = InlineKeyboardBuilder()
-    builder.button(text="✅ Да", callback_data=f"confirm_{action}:{task_id}")
-    builder.button(text="❌ Нет", callback_data=f"view_task:{task_id}")
+    builder.button(text="✅ Да", callback_data=confirm)
+    builder.button(text="❌ Нет", callback_data=back)
     
     # Размещаем кнопки в одну строку (2 кнопки)
     builder.adjust(2)
@@ -107,10 +120,10 @@ def get_confirm_keyboard(action: str, task_id: int) -> InlineKeyboardMarkup:
 def get_edit_menu_keyboard(task_id: int, context: str = "my_tasks") -> InlineKeyboardMarkup:
     # Клавиатура для меню редактирования задачи
     builder = InlineKeyboardBuilder()
-    builder.button(text="📌 Название", callback_data="edit:title")
-    builder.button(text="📝 Описание", callback_data="edit:description")
-    builder.button(text="👥 Тип задачи", callback_data="edit:type")
-    builder.button(text="🔙 Назад", callback_data=f"view_task:{task_id}:{context}")
+    builder.button(text="📌 Название", callback_data=TaskFieldCallback(field="title"))
+    builder.button(text="📝 Описание", callback_data=TaskFieldCallback(field="description"))
+    builder.button(text="👥 Тип задачи", callback_data=TaskFieldCallback(field="type"))
+    builder.button(text="🔙 Назад", callback_data=ViewTaskCallback(task_id=task_id, context=context))
     
     # Размещаем кнопки в один столбец
     builder.adjust(1)
@@ -121,8 +134,8 @@ def get_wish_type_keyboard() -> InlineKeyboardMarkup:
     # Клавиатура для выбора типа желания при создании
     builder = InlineKeyboardBuilder()
     
-    builder.button(text="🎁 Моё желание", callback_data=f"wish_type:{WishType.MY_WISH.value}")
-    builder.button(text="💝 Желание партнёра", callback_data=f"wish_type:{WishType.PARTNER_WISH.value}")
+    builder.button(text="🎁 Моё желание", callback_data=WishTypeCallback(wish_type=WishType.MY_WISH))
+    builder.button(text="💝 Желание партнёра", callback_data=WishTypeCallback(wish_type=WishType.PARTNER_WISH))
     
     builder.adjust(1)
     
@@ -132,41 +145,37 @@ def get_wish_action_keyboard(wish_id: int, context: str = "my_wishes") -> Inline
     # Клавиатура для действий с желанием
     builder = InlineKeyboardBuilder()
     
-    builder.button(text="✏️ Редактировать", callback_data=f"edit_wish:{wish_id}")
-    builder.button(text="🗑️ Удалить", callback_data=f"delete_wish:{wish_id}")
-    builder.button(text="⬅️ Назад", callback_data=f"back_to_wishes:{context}")
+    builder.button(text="✏️ Редактировать", callback_data=EditWishCallback(wish_id=wish_id))
+    builder.button(text="🗑️ Удалить", callback_data=DeleteWishCallback(wish_id=wish_id))
+    builder.button(text="⬅️ Назад", callback_data=WishesBackCallback(context=context))
     
     builder.adjust(1)
     
     return builder.as_markup()
 
-def get_wishes_list_keyboard(wishes, page=0, page_size=5, context="my_wishes") -> InlineKeyboardMarkup:
-    # Пагинация для списка желаний
+def get_wishes_list_keyboard(page, context="my_wishes") -> InlineKeyboardMarkup:
+    # Одна страница списка желаний, листание по курсорам страницы
     builder = InlineKeyboardBuilder()
     
-    start = page * page_size
-    end = min(start + page_size, len(wishes))
-    
-    for i in range(start, end):
-        wish = wishes[i]
+    for wish in page.items:
         title_display = wish.title[:30] + "..." if len(wish.title) > 30 else wish.title
         builder.button(
             text=f"🎁 {title_display}", 
-            callback_data=f"view_wish:{wish.id}:{context}"
+            callback_data=ViewWishCallback(wish_id=wish.id, context=context)
         )
     
     builder.adjust(1)
     
-    if page > 0:
-        builder.button(text="⬅️ Назад", callback_data=f"wish_page:{page-1}")
+    if page.has_prev:
+        builder.button(text="⬅️ Назад", callback_data=WishesPageCallback(cursor=page.prev_cursor))
     
-    if end < len(wishes):
-        builder.button(text="➡️ Вперед", callback_data=f"wish_page:{page+1}")
+    if page.has_next:
+        builder.button(text="➡️ Вперед", callback_data=WishesPageCallback(cursor=page.next_cursor))
     
-    if page > 0 or end < len(wishes):
+    if page.has_prev or page.has_next:
         builder.adjust(1, 2)
     
-    builder.button(text="🏠 Главное меню", callback_data="main_menu")
+    builder.button(text="🏠 Главное меню", callback_data=MainMenuCallback())
     builder.adjust(1)
     
     return builder.as_markup()
@@ -174,11 +183,11 @@ def get_wishes_list_keyboard(wishes, page=0, page_size=5, context="my_wishes") -
 def get_edit_wish_menu_keyboard(wish_id: int, context: str = "my_wishes") -> InlineKeyboardMarkup:
     # Клавиатура для меню редактирования желания
     builder = InlineKeyboardBuilder()
-    builder.button(text="📌 Название", callback_data="edit_wish:title")
-    builder.button(text="📝 Описание", callback_data="edit_wish:description")
-    builder.button(text="🖼️ Изображение", callback_data="edit_wish:image")
-    builder.button(text="👥 Тип желания", callback_data="edit_wish:type")
-    builder.button(text="🔙 Назад", callback_data=f"view_wish:{wish_id}:{context}")
+    builder.button(text="📌 Название", callback_data=WishFieldCallback(field="title"))
+    builder.button(text="📝 Описание", callback_data=WishFieldCallback(field="description"))
+    builder.button(text="🖼️ Изображение", callback_data=WishFieldCallback(field="image"))
+    builder.button(text="👥 Тип желания", callback_data=WishFieldCallback(field="type"))
+    builder.button(text="🔙 Назад", callback_data=ViewWishCallback(wish_id=wish_id, context=context))
     
     builder.adjust(1)
     
@@ -188,12 +197,12 @@ def get_movies_menu_keyboard() -> InlineKeyboardMarkup:
     # Клавиатура для меню фильмов
     builder = InlineKeyboardBuilder()
     
-    builder.button(text="🎥 Мои фильмы", callback_data="movies:my")
-    builder.button(text="🎬 Фильмы партнёра", callback_data="movies:partner")
-    builder.button(text="➕ Добавить фильм", callback_data="movies:add")
-    builder.button(text="📊 Статистика", callback_data="movies:stats")
-    builder.button(text="🎯 Рекомендации", callback_data="movies:recommendations")
-    builder.button(text="🏠 Главное меню", callback_data="main_menu")
+    builder.button(text="🎥 Мои фильмы", callback_data=MoviesMenuCallback(action="my"))
+    builder.button(text="🎬 Фильмы партнёра", callback_data=MoviesMenuCallback(action="partner"))
+    builder.button(text="➕ Добавить фильм", callback_data=MoviesMenuCallback(action="add"))
+    builder.button(text="📊 Статистика", callback_data=MoviesMenuCallback(action="stats"))
+    builder.button(text="🎯 Рекомендации", callback_data=MoviesMenuCallback(action="recommendations"))
+    builder.button(text="🏠 Главное меню", callback_data=MainMenuCallback())
     
     builder.adjust(1)
     return builder.as_markup()
@@ -202,8 +211,8 @@ def get_movie_type_keyboard() -> InlineKeyboardMarkup:
     # Клавиатура для выбора типа фильма при создании
     builder = InlineKeyboardBuilder()
     
-    builder.button(text="🎥 Мои фильмы", callback_data="movie_type:my_movies")
-    builder.button(text="🎬 Фильмы партнёра", callback_data="movie_type:partner_movies")
+    builder.button(text="🎥 Мои фильмы", callback_data=MovieTypeCallback(movie_type=MovieType.MY_MOVIES))
+    builder.button(text="🎬 Фильмы партнёра", callback_data=MovieTypeCallback(movie_type=MovieType.PARTNER_MOVIES))
     
     builder.adjust(1)
     return builder.as_markup()
@@ -214,17 +223,17 @@ def get_movie_action_keyboard(movie_id: int, context: str = "my_movies", watched
     
     if context == "partner_movies":
         if not watched:
-            builder.button(text="⭐ Оценить", callback_data=f"rate_movie:{movie_id}")
-            builder.button(text="✅ Отметить как просмотренный", callback_data=f"mark_watched:{movie_id}")
+            builder.button(text="⭐ Оценить", callback_data=RateMovieCallback(movie_id=movie_id))
+            builder.button(text="✅ Отметить как просмотренный", callback_data=MarkWatchedCallback(movie_id=movie_id))
         else:
-            builder.button(text="📝 Оставить отзыв", callback_data=f"add_review:{movie_id}")
+            builder.button(text="📝 Оставить отзыв", callback_data=AddReviewCallback(movie_id=movie_id))
     else:
         if not watched:
-            builder.button(text="✅ Отметить как просмотренный", callback_data=f"mark_watched:{movie_id}")
-        builder.button(text="✏️ Редактировать", callback_data=f"edit_movie:{movie_id}")
-        builder.button(text="🗑️ Удалить", callback_data=f"delete_movie:{movie_id}")
+            builder.button(text="✅ Отметить как просмотренный", callback_data=MarkWatchedCallback(movie_id=movie_id))
+        builder.button(text="✏️ Редактировать", callback_data=EditMovieCallback(movie_id=movie_id))
+        builder.button(text="🗑️ Удалить", callback_data=DeleteMovieCallback(movie_id=movie_id))
     
-    builder.button(text="⬅️ Назад", callback_data=f"back_to_movies:{context}")
+    builder.button(text="⬅️ Назад", callback_data=MoviesBackCallback(context=context))
     
     builder.adjust(1)
     return builder.as_markup()
@@ -234,41 +243,37 @@ def get_movie_rating_keyboard(movie_id: int) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     
     for i in range(1, 6):
-        builder.button(text=f"{'⭐' * i}", callback_data=f"set_rating:{movie_id}:{i}")
+        builder.button(text=f"{'⭐' * i}", callback_data=SetRatingCallback(movie_id=movie_id, rating=i))
     
-    builder.button(text="⬅️ Назад", callback_data=f"view_movie:{movie_id}:partner_movies")
+    builder.button(text="⬅️ Назад", callback_data=ViewMovieCallback(movie_id=movie_id, context="partner_movies"))
     
     builder.adjust(5, 1)
     return builder.as_markup()
 
-def get_movies_list_keyboard(movies, page=0, page_size=5, context="my_movies") -> InlineKeyboardMarkup:
-    # Пагинация для списка фильмов
+def get_movies_list_keyboard(page, context="my_movies") -> InlineKeyboardMarkup:
+    # Одна страница списка фильмов, листание по курсорам страницы
     builder = InlineKeyboardBuilder()
     
-    start = page * page_size
-    end = min(start + page_size, len(movies))
-    
-    for i in range(start, end):
-        movie = movies[i]
-        title_display = movie['title'][:30] + "..." if len(movie['title']) > 30 else movie['title']
-        watched_status = "✅ " if movie.get('watched', False) else ""
+    for movie in page.items:
+        title_display = movie.title[:30] + "..." if len(movie.title) > 30 else movie.title
+        watched_status = "✅ " if movie.watched else ""
         builder.button(
             text=f"{watched_status}🎬 {title_display}", 
-            callback_data=f"view_movie:{movie['id']}:{context}"
+            callback_data=ViewMovieCallback(movie_id=movie.id, context=context)
         )
     
     builder.adjust(1)
     
-    if page > 0:
-        builder.button(text="⬅️ Назад", callback_data=f"movie_page:{page-1}")
+    if page.has_prev:
+        builder.button(text="⬅️ Назад", callback_data=MoviesPageCallback(cursor=page.prev_cursor))
     
-    if end < len(movies):
-        builder.button(text="➡️ Вперед", callback_data=f"movie_page:{page+1}")
+    if page.has_next:
+        builder.button(text="➡️ Вперед", callback_data=MoviesPageCallback(cursor=page.next_cursor))
     
-    if page > 0 or end < len(movies):
+    if page.has_prev or page.has_next:
         builder.adjust(1, 2)
     
-    builder.button(text="🏠 Главное меню", callback_data="main_menu")
+    builder.button(text="🏠 Главное меню", callback_data=MainMenuCallback())
     builder.adjust(1)
     
     return builder.as_markup()
@@ -276,9 +281,39 @@ def get_movies_list_keyboard(movies, page=0, page_size=5, context="my_movies") -
 def get_edit_movie_menu_keyboard(movie_id: int, context: str = "my_movies") -> InlineKeyboardMarkup:
     # Клавиатура для меню редактирования фильма
     builder = InlineKeyboardBuilder()
-    builder.button(text="📌 Название", callback_data="edit_movie:title")
-    builder.button(text="📝 Описание", callback_data="edit_movie:description")
-    builder.button(text="🔙 Назад", callback_data=f"view_movie:{movie_id}:{context}")
+    builder.button(text="📌 Название", callback_data=MovieFieldCallback(field="title"))
+    builder.button(text="📝 Описание", callback_data=MovieFieldCallback(field="description"))
+    builder.button(text="🔙 Назад", callback_data=ViewMovieCallback(movie_id=movie_id, context=context))
+    
+    builder.adjust(1)
+    return builder.as_markup()
+def get_search_results_keyboard(page, user_id: int) -> InlineKeyboardMarkup:
+    # Найденные записи открываются в своих обычных карточках
+    builder = InlineKeyboardBuilder()
+    
+    for hit in page.items:
+        title_display = hit.title[:30] + "..." if len(hit.title) > 30 else hit.title
+        owner = "my" if hit.created_by == user_id else "partner"
+        if hit.kind == "task":
+            text, callback_data = f"📋 {title_display}", ViewTaskCallback(task_id=hit.id)
+        elif hit.kind == "wish":
+            text, callback_data = f"🎁 {title_display}", ViewWishCallback(wish_id=hit.id, context=f"{owner}_wishes")
+        else:
+            text, callback_data = f"🎬 {title_display}", ViewMovieCallback(movie_id=hit.id, context=f"{owner}_movies")
+        builder.button(text=text, callback_data=callback_data)
     
     builder.adjust(1)
-    return builder.as_markup()
\ No newline at end of file
+    
+    if page.has_prev:
+        builder.button(text="⬅️ Назад", callback_data=SearchPageCallback(cursor=page.prev_cursor))
+    
+    if page.has_next:
+        builder.button(text="➡️ Вперед", callback_data=SearchPageCallback(cursor=page.next_cursor))
+    
+    if page.has_prev or page.has_next:
+        builder.adjust(1, 2)
+    
+    builder.button(text="🏠 Главное меню", callback_data=MainMenuCallback())
+    builder.adjust(1)
+    
+    return builder.as_markup()
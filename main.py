@@ -1,10 +1,20 @@
 import asyncio
 import logging
+from datetime import datetime, timedelta
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.types import BotCommand
-from config import BOT_TOKEN
-from handlers import router
+from config import (
+    BOT_TOKEN, TASK_ARCHIVE_DAYS, FSM_STATE_TTL_HOURS, BOT_MODE, TELEGRAM_API_URL,
+    WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_WORKERS,
+    UPDATE_WORKERS
+)
+from handlers import router, db, notifier
+from storage import SQLiteStorage
+from notifications import OutboxRelay
+from webhook import run_webhook, check_webhook_config
+from updates import UpdateJournal, UpdateScheduler, CallbackDeduplicator, replay_backlog, run_polling
 from models import Task, TaskType, TaskStatus, Wish, WishType
 
 # Настройка логирования
@@ -15,25 +25,90 @@ async def set_commands(bot: Bot):
     commands = [
         BotCommand(command="start", description="🚀 Запустить бота"),
         BotCommand(command="help", description="❓ Помощь"),
+        BotCommand(command="search", description="🔎 Поиск"),
     ]
     await bot.set_my_commands(commands)
 
+# Как часто искать задачи для архива и пауза между пачками, чтобы перенос
+# не занимал очередь записи надолго
+ARCHIVE_INTERVAL = 3600
+ARCHIVE_BATCH_PAUSE = 0.5
+
+async def archive_tasks_periodically():
+    """Фоновый перенос давно выполненных задач в архив небольшими пачками"""
+    while True:
+        older_than = datetime.now() - timedelta(days=TASK_ARCHIVE_DAYS)
+        try:
+            archived = 0
+            while moved := await db.archive_completed_tasks(older_than):
+                archived += moved
+                await asyncio.sleep(ARCHIVE_BATCH_PAUSE)
+            if archived:
+                logging.info(f"В архив перенесено задач: {archived}")
+        except Exception as e:
+            logging.error(f"Ошибка при архивации задач: {e}")
+        await asyncio.sleep(ARCHIVE_INTERVAL)
+
 # Основная функция запуска бота
 async def main():
+    # Без адреса и секрета вебхук не запускаем: любой, кто узнает URL,
+    # смог бы слать обновления от имени пользователей
+    if BOT_MODE == "webhook":
+        check_webhook_config(WEBHOOK_BASE_URL, WEBHOOK_SECRET)
+
     # Инициализация бота и диспетчера
-    bot = Bot(token=BOT_TOKEN)
-    storage = MemoryStorage()
+    session = AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+    bot = Bot(token=BOT_TOKEN, session=session)
+    # Состояния диалогов хранятся в базе бота и переживают перезапуск
+    storage = SQLiteStorage(db, ttl=FSM_STATE_TTL_HOURS * 3600)
     dp = Dispatcher(storage=storage)
     
     # Регистрация обработчиков
     dp.include_router(router)
+
+    # Журнал обработанных обновлений: повторы после перезапуска пропускаются
+    journal = UpdateJournal(db)
+    await journal.load()
+    dp.update.outer_middleware(journal)
+    # Двойное нажатие кнопки не вызывает обработчик второй раз. Стоит до
+    # очереди пользователя, чтобы повтор получал ответ сразу
+    deduplicator = CallbackDeduplicator()
+    dp.update.outer_middleware(deduplicator)
+    # Обновления одного пользователя - по очереди, разных - параллельно
+    scheduler = UpdateScheduler(UPDATE_WORKERS)
+    dp.update.outer_middleware(scheduler)
     
     # Установка команд бота
     await set_commands(bot)
     
-    # Удаление вебхука и запуск поллинга
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    notifier.start(bot)
+    # Уведомления из outbox, в том числе оставшиеся с прошлого запуска
+    relay = OutboxRelay(db, notifier)
+    await relay.start()
+    archiver = asyncio.create_task(archive_tasks_periodically())
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(
+                dp, bot, WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET,
+                WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_WORKERS, stats=lambda: {**scheduler.stats(), **deduplicator.stats()}
+            )
+        else:
+            # Удаляем вебхук, но не накопившиеся обновления: сначала
+            # разбираем их с сохранённого offset, затем запускаем поллинг,
+            # который подтверждает Telegram только записанное в журнал
+            await bot.delete_webhook(drop_pending_updates=False)
+            await replay_backlog(dp, bot, journal)
+            await run_polling(dp, bot, journal)
+    finally:
+        archiver.cancel()
+        await journal.close()
+        # Досылаем уведомления, пока бот ещё может отправлять сообщения
+        await relay.close()
+        await notifier.close()
+        await storage.close()
+        # Дожидаемся завершения запросов и закрываем базу
+        await db.close()
+        await bot.session.close()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
@@ -0,0 +1,413 @@
+import logging
+import sqlite3
+from datetime import datetime
+from models import to_epoch
+
+# Сколько строк переводит за одну транзакцию пакетная миграция
+MIGRATION_BATCH_SIZE = 500
+
+# Вторичные индексы. Новый набор индексов - это новый шаг миграции
+INDEXES = {
+    "idx_tasks_owner_type_status": "tasks (created_by, task_type, status, created_at)",
+    "idx_wishes_owner_type": "wishes (created_by, wish_type, created_at)",
+    "idx_wishes_owner": "wishes (created_by, created_at)",
+    "idx_movies_owner_type": "movies (created_by, movie_type, created_at)",
+    "idx_movies_owner": "movies (created_by, created_at)",
+    "idx_movies_recommendations": "movies (created_by, movie_type, watched, rating, created_at)",
+}
+
+# Индексы из INDEXES, которые больше не нужны. Индексы, созданные другими
+# шагами, шаг вторичных индексов не трогает
+RETIRED_INDEXES = ()
+
+# Колонки с метками времени. Они хранятся целым числом микросекунд от
+# эпохи, а в старых базах - ISO-строкой
+TIMESTAMP_COLUMNS = {
+    "tasks": ("created_at",),
+    "wishes": ("created_at",),
+    "movies": ("created_at", "watch_date"),
+}
+
+def create_tables(conn: sqlite3.Connection, batch_size: int):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        partner_id INTEGER
+    )
+    """)
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS tasks (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        description TEXT,
+        task_type TEXT NOT NULL,
+        status TEXT NOT NULL,
+        created_by INTEGER NOT NULL,
+        created_at INTEGER NOT NULL
+    )
+    """)
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS wishes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        description TEXT,
+        image_id TEXT,
+        wish_type TEXT NOT NULL,
+        created_by INTEGER NOT NULL,
+        created_at INTEGER NOT NULL
+    )
+    """)
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS movies (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        description TEXT,
+        movie_type TEXT NOT NULL,
+        created_by INTEGER NOT NULL,
+        rating INTEGER,
+        created_at INTEGER NOT NULL,
+        watched BOOLEAN DEFAULT 0,
+        watch_date INTEGER,
+        review TEXT,
+        FOREIGN KEY (created_by) REFERENCES users(id)
+    )
+    """)
+
+def create_indexes(conn: sqlite3.Connection, batch_size: int):
+    """Создаёт вторичные индексы INDEXES и удаляет RETIRED_INDEXES"""
+    for name in RETIRED_INDEXES:
+        conn.execute(f"DROP INDEX IF EXISTS {name}")
+    for name, definition in INDEXES.items():
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {definition}")
+
+def convert_timestamps(conn: sqlite3.Connection, batch_size: int):
+    """Переводит метки времени, записанные текстом, в целые эпохи.
+
+    Строки обходятся по id пачками по batch_size, каждая пачка коммитится
+    отдельно, так что блокировка записи не держится всю миграцию. После
+    сбоя шаг просто выполняется заново: переведённые строки под условие
+    typeof = 'text' больше не попадают.
+    """
+    for table, columns in TIMESTAMP_COLUMNS.items():
+        condition = " OR ".join(f"typeof({column}) = 'text'" for column in columns)
+        assignments = ", ".join(f"{column} = ?" for column in columns)
+        last_id = 0
+        while True:
+            rows = conn.execute(f"""
+            SELECT id, {", ".join(columns)} FROM {table}
+            WHERE id > ? AND ({condition})
+            ORDER BY id
+            LIMIT ?
+            """, (last_id, batch_size)).fetchall()
+            if not rows:
+                break
+
+            updates = []
+            for row in rows:
+                try:
+                    updates.append((*(to_epoch(value) for value in row[1:]), row[0]))
+                except ValueError:
+                    logging.warning(f"Не удалось перевести метку времени в {table}, id={row[0]}: {row[1:]}")
+            conn.executemany(f"UPDATE {table} SET {assignments} WHERE id = ?", updates)
+            conn.commit()
+            last_id = rows[-1][0]
+
+# Оценки фильмов - от 1 до 5 звёзд, под каждую своя колонка гистограммы
+MOVIE_RATINGS = range(1, 6)
+
+def _movie_stats_delta(row: str, sign: str) -> str:
+    """UPDATE movie_stats, который добавляет (sign="+") или вычитает (sign="-")
+    фильм row (NEW или OLD) из статистики его владельца"""
+    histogram = "".join(
+        f", rating_{rating} = rating_{rating} {sign} ({row}.rating IS {rating})"
+        for rating in MOVIE_RATINGS
+    )
+    return f"""
+        UPDATE movie_stats SET
+            total_movies = total_movies {sign} 1,
+            watched_movies = watched_movies {sign} ({row}.watched IS 1),
+            rated_movies = rated_movies {sign} ({row}.rating IS NOT NULL),
+            rating_sum = rating_sum {sign} COALESCE({row}.rating, 0){histogram}
+        WHERE user_id = {row}.created_by;"""
+
+def rebuild_movie_stats(conn: sqlite3.Connection):
+    """Пересчитывает movie_stats по таблице movies с нуля (без commit)"""
+    histogram = "".join(f", SUM(rating IS {rating})" for rating in MOVIE_RATINGS)
+    conn.execute("DELETE FROM movie_stats")
+    conn.execute(f"""
+    INSERT INTO movie_stats
+    SELECT created_by, COUNT(*), SUM(watched IS 1), COUNT(rating), COALESCE(SUM(rating), 0){histogram}
+    FROM movies
+    GROUP BY created_by
+    """)
+
+def create_movie_stats(conn: sqlite3.Connection, batch_size: int):
+    """Таблица статистики фильмов по пользователям и триггеры, которые
+    обновляют её в той же транзакции, что и сам фильм"""
+    histogram = "".join(f", rating_{rating} INTEGER NOT NULL DEFAULT 0" for rating in MOVIE_RATINGS)
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS movie_stats (
+        user_id INTEGER PRIMARY KEY,
+        total_movies INTEGER NOT NULL DEFAULT 0,
+        watched_movies INTEGER NOT NULL DEFAULT 0,
+        rated_movies INTEGER NOT NULL DEFAULT 0,
+        rating_sum INTEGER NOT NULL DEFAULT 0{histogram}
+    )
+    """)
+
+    ensure_row = "INSERT INTO movie_stats (user_id) VALUES (NEW.created_by) ON CONFLICT DO NOTHING;"
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS movie_stats_insert AFTER INSERT ON movies
+    BEGIN
+        {ensure_row}{_movie_stats_delta("NEW", "+")}
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS movie_stats_delete AFTER DELETE ON movies
+    BEGIN{_movie_stats_delta("OLD", "-")}
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS movie_stats_update AFTER UPDATE OF created_by, watched, rating ON movies
+    BEGIN{_movie_stats_delta("OLD", "-")}
+        {ensure_row}{_movie_stats_delta("NEW", "+")}
+    END
+    """)
+    rebuild_movie_stats(conn)
+
+# Полнотекстовые индексы FTS5: таблица -> колонки, по которым ищем
+SEARCH_COLUMNS = {
+    "tasks": ("title", "description"),
+    "wishes": ("title", "description"),
+    "movies": ("title", "description", "review"),
+}
+
+def _create_fts(conn: sqlite3.Connection, table: str, columns: tuple):
+    """FTS5-таблица {table}_fts с внешним содержимым поверх table.
+
+    Текст хранится только в основной таблице, а триггеры поддерживают
+    индекс в той же транзакции, что и запись.
+    """
+    fts = f"{table}_fts"
+    names = ", ".join(columns)
+    new_values = ", ".join(f"NEW.{column}" for column in columns)
+    old_values = ", ".join(f"OLD.{column}" for column in columns)
+    delete_old = f"INSERT INTO {fts} ({fts}, rowid, {names}) VALUES ('delete', OLD.id, {old_values});"
+    insert_new = f"INSERT INTO {fts} (rowid, {names}) VALUES (NEW.id, {new_values});"
+
+    conn.execute(f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+        {names}, content='{table}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table}
+    BEGIN {insert_new} END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table}
+    BEGIN {delete_old} END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE OF {names} ON {table}
+    BEGIN {delete_old} {insert_new} END
+    """)
+    conn.execute(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+
+def create_search_index(conn: sqlite3.Connection, batch_size: int):
+    """Полнотекстовый поиск по задачам, желаниям и фильмам"""
+    for table, columns in SEARCH_COLUMNS.items():
+        _create_fts(conn, table, columns)
+
+def create_task_archive(conn: sqlite3.Connection, batch_size: int):
+    """Архив выполненных задач и представление all_tasks поверх обеих таблиц.
+
+    В tasks появляется completed_at - время выполнения, по которому фоновая
+    задача решает, что пора в архив. У задач, выполненных до этого шага,
+    его нет, для них берётся created_at.
+    """
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(tasks)")}
+    if "completed_at" not in columns:
+        conn.execute("ALTER TABLE tasks ADD COLUMN completed_at INTEGER")
+
+    # AUTOINCREMENT в tasks гарантирует, что id из архива не выдадут заново
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS tasks_archive (
+        id INTEGER PRIMARY KEY,
+        title TEXT NOT NULL,
+        description TEXT,
+        task_type TEXT NOT NULL,
+        status TEXT NOT NULL,
+        created_by INTEGER NOT NULL,
+        created_at INTEGER NOT NULL,
+        completed_at INTEGER
+    )
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tasks_archive_owner_type_status "
+        "ON tasks_archive (created_by, task_type, status, created_at)"
+    )
+    conn.execute("""
+    CREATE VIEW IF NOT EXISTS all_tasks AS
+    SELECT id, title, description, task_type, status, created_by, created_at, completed_at FROM tasks
+    UNION ALL
+    SELECT id, title, description, task_type, status, created_by, created_at, completed_at FROM tasks_archive
+    """)
+    _create_fts(conn, "tasks_archive", SEARCH_COLUMNS["tasks"])
+
+def create_fsm_states(conn: sqlite3.Connection, batch_size: int):
+    """Состояния FSM, чтобы незаконченные диалоги переживали перезапуск"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS fsm_states (
+        key TEXT PRIMARY KEY,
+        state TEXT,
+        data TEXT NOT NULL,
+        updated_at INTEGER NOT NULL
+    ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_fsm_states_updated_at ON fsm_states (updated_at)")
+
+def create_outbox(conn: sqlite3.Connection, batch_size: int):
+    """Очередь уведомлений, которые пишутся в одной транзакции с изменением.
+
+    next_attempt_at - когда пробовать отправить. У доставленных и
+    окончательно не доставленных он NULL, поэтому частичный индекс
+    содержит только то, что ещё нужно отправить.
+    """
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        chat_id INTEGER NOT NULL,
+        method TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        created_at INTEGER NOT NULL,
+        next_attempt_at INTEGER,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        delivered_at INTEGER,
+        last_error TEXT
+    )
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox (next_attempt_at) "
+        "WHERE next_attempt_at IS NOT NULL"
+    )
+
+def create_update_journal(conn: sqlite3.Connection, batch_size: int):
+    """Журнал обработанных обновлений Telegram и сохранённый offset.
+
+    processed_updates защищает от повторной обработки, а bot_state хранит
+    значения вроде update_offset, которые должны пережить перезапуск.
+    """
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS processed_updates (
+        update_id INTEGER PRIMARY KEY,
+        processed_at INTEGER NOT NULL
+    )
+    """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_processed_updates_processed_at "
+        "ON processed_updates (processed_at)"
+    )
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS bot_state (
+        key TEXT PRIMARY KEY,
+        value INTEGER
+    ) WITHOUT ROWID
+    """)
+
+def index_completed_tasks(conn: sqlite3.Connection, batch_size: int):
+    """Индекс, по которому фоновая архивация находит давно выполненные задачи.
+
+    Задачам, выполненным до шага 6, completed_at проставляется из created_at
+    (пачками, как в convert_timestamps), чтобы условие архивации шло по
+    индексу без COALESCE.
+    """
+    for table in ("tasks", "tasks_archive"):
+        while True:
+            cur = conn.execute(f"""
+            UPDATE {table} SET completed_at = created_at
+            WHERE id IN (
+                SELECT id FROM {table}
+                WHERE status = 'completed' AND completed_at IS NULL
+                LIMIT ?
+            )
+            """, (batch_size,))
+            conn.commit()
+            if cur.rowcount < batch_size:
+                break
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_tasks_status_completed_at ON tasks (status, completed_at)"
+    )
+
+def create_received_updates(conn: sqlite3.Connection, batch_size: int):
+    """Полученные, но ещё не обработанные обновления Telegram.
+
+    Поллинг подтверждает обновление Telegram следующим же getUpdates, не
+    дожидаясь обработчика, поэтому тело обновления сначала пишется сюда.
+    После падения необработанные обновления разбираются отсюда.
+    """
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS received_updates (
+        update_id INTEGER PRIMARY KEY,
+        payload TEXT NOT NULL,
+        received_at INTEGER NOT NULL
+    )
+    """)
+
+# Шаги миграции по порядку: (версия, описание, функция). Каждый шаг должен
+# быть идемпотентным, ведь при сбое до записи версии он выполнится ещё раз.
+# Уже выпущенные шаги не меняем - только добавляем новые в конец
+MIGRATIONS = [
+    (1, "базовые таблицы", create_tables),
+    (2, "вторичные индексы", create_indexes),
+    (3, "метки времени в эпохах", convert_timestamps),
+    (4, "статистика фильмов", create_movie_stats),
+    (5, "полнотекстовый поиск", create_search_index),
+    (6, "архив выполненных задач", create_task_archive),
+    (7, "состояния FSM", create_fsm_states),
+    (8, "outbox уведомлений", create_outbox),
+    (9, "журнал обновлений", create_update_journal),
+    (10, "индекс выполненных задач", index_completed_tasks),
+    (11, "принятые обновления", create_received_updates),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    try:
+        return conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        # Таблицы ещё нет: новая база или база до появления миграций
+        return 0
+
+def migrate(conn: sqlite3.Connection, batch_size: int = MIGRATION_BATCH_SIZE) -> int:
+    """Применяет недостающие шаги миграции и возвращает версию схемы.
+
+    Если схема уже актуальна, выполняется один SELECT и никакого DDL.
+    """
+    version = get_schema_version(conn)
+    if version >= SCHEMA_VERSION:
+        return version
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT NOT NULL,
+        applied_at INTEGER NOT NULL
+    )
+    """)
+    for step_version, description, step in MIGRATIONS:
+        if step_version <= version:
+            continue
+        logging.info(f"Миграция схемы до версии {step_version}: {description}")
+        step(conn, batch_size)
+        conn.execute(
+            "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+            (step_version, description, to_epoch(datetime.now()))
+        )
+        conn.commit()
+        version = step_version
+    return version
@@ -1,5 +1,5 @@
 from enum import Enum
-from datetime import datetime
+from datetime import datetime, timezone
 
 class TaskStatus(Enum):
     ACTIVE = "active"
@@ -12,14 +12,92 @@ class TaskType(Enum):
 
 class WishType(Enum):
     MY_WISH = "my_wish"
-    PARTNER_WISH = "partner_wish" 
+    PARTNER_WISH = "partner_wish"
 
 class MovieType(Enum):
     MY_MOVIES = "my_movies"
     PARTNER_MOVIES = "partner_movies"
 
-class Movie:
-    def __init__(self, 
+# Готовые таблицы "значение из базы -> член перечисления", чтобы не вызывать
+# TaskType(...) и т.п. на каждую прочитанную строку
+TASK_STATUSES = {status.value: status for status in TaskStatus}
+TASK_TYPES = {task_type.value: task_type for task_type in TaskType}
+WISH_TYPES = {wish_type.value: wish_type for wish_type in WishType}
+MOVIE_TYPES = {movie_type.value: movie_type for movie_type in MovieType}
+
+# Метки времени хранятся в базе целым числом микросекунд от начала эпохи
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MICROSECOND = 1_000_000
+
+def to_epoch(value) -> int:
+    """Переводит datetime (или старую ISO-строку) в микросекунды от эпохи"""
+    if value is None or isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    delta = value.astimezone(timezone.utc) - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * _MICROSECOND + delta.microseconds
+
+def parse_timestamp(value):
+    """Переводит метку времени из базы в локальный datetime"""
+    if value is None or isinstance(value, datetime):
+        return value
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    seconds, microseconds = divmod(value, _MICROSECOND)
+    return datetime.fromtimestamp(seconds).replace(microsecond=microseconds)
+
+class _Record:
+    """Базовый класс неизменяемых моделей со слотами.
+
+    Поля меняются через replace(), который возвращает новую копию. Метки
+    времени хранятся в том виде, в каком пришли из базы, и разбираются в
+    datetime только при обращении к ним.
+    """
+    __slots__ = ()
+    _fields = ()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} нельзя изменить, используйте replace()")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} нельзя изменить, используйте replace()")
+
+    def replace(self, **changes):
+        """Возвращает копию записи с изменёнными полями"""
+        fields = {name: getattr(self, name) for name in self._fields}
+        fields.update(changes)
+        return type(self)(**fields)
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self._fields)
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, name) for name in self._fields))
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self._fields)
+        return f"{type(self).__name__}({fields})"
+
+def _setters(cls, *slots):
+    """Дескрипторы слотов: запись через них обходит запрет __setattr__"""
+    return [getattr(cls, slot).__set__ for slot in slots]
+
+class Movie(_Record):
+    __slots__ = ("id", "title", "description", "movie_type", "created_by", "rating",
+                 "_created_at", "watched", "_watch_date", "review")
+    _fields = ("id", "title", "description", "movie_type", "created_by", "rating",
+               "created_at", "watched", "watch_date", "review")
+
+    def __init__(self,
                  id: int = None,
                  title: str = "",
                  description: str = "",
@@ -30,19 +108,51 @@ class Movie:
                  watched: bool = False,
                  watch_date: datetime = None,
                  review: str = None):
-        self.id = id
-        self.title = title
-        self.description = description
-        self.movie_type = movie_type
-        self.created_by = created_by
-        self.rating = rating
-        self.created_at = created_at or datetime.now()
-        self.watched = watched
-        self.watch_date = watch_date
-        self.review = review
-
-class Wish:
-    def __init__(self, 
+        for setter, value in zip(_MOVIE_SETTERS, (
+            id, title, description, movie_type, created_by, rating,
+            created_at or datetime.now(), watched, watch_date, review
+        )):
+            setter(self, value)
+
+    @property
+    def created_at(self) -> datetime:
+        return parse_timestamp(self._created_at)
+
+    @property
+    def watch_date(self) -> datetime:
+        return parse_timestamp(self._watch_date)
+
+    @property
+    def created_at_epoch(self) -> int:
+        """Метка создания в микросекундах от эпохи, без разбора в datetime"""
+        return to_epoch(self._created_at)
+
+    @classmethod
+    def from_row(cls, row) -> "Movie":
+        """Создаёт фильм из строки (id, title, description, movie_type, created_by,
+        rating, created_at, watched, watch_date, review)"""
+        movie = object.__new__(cls)
+        set_id, set_title, set_description, set_type, set_created_by, set_rating, \
+            set_created_at, set_watched, set_watch_date, set_review = _MOVIE_SETTERS
+        set_id(movie, row[0])
+        set_title(movie, row[1])
+        set_description(movie, row[2])
+        set_type(movie, MOVIE_TYPES[row[3]])
+        set_created_by(movie, row[4])
+        set_rating(movie, row[5])
+        set_created_at(movie, row[6])
+        set_watched(movie, bool(row[7]))
+        set_watch_date(movie, row[8])
+        set_review(movie, row[9])
+        return movie
+
+_MOVIE_SETTERS = _setters(Movie, *Movie.__slots__)
+
+class Wish(_Record):
+    __slots__ = ("id", "title", "description", "image_id", "wish_type", "created_by", "_created_at")
+    _fields = ("id", "title", "description", "image_id", "wish_type", "created_by", "created_at")
+
+    def __init__(self,
                  id: int = None,
                  title: str = "",
                  description: str = "",
@@ -50,16 +160,38 @@ class Wish:
                  wish_type: WishType = WishType.MY_WISH,
                  created_by: int = None,
                  created_at: datetime = None):
-        self.id = id
-        self.title = title
-        self.description = description
-        self.image_id = image_id
-        self.wish_type = wish_type
-        self.created_by = created_by
-        self.created_at = created_at or datetime.now()
-
-class Task:
-    def __init__(self, 
+        for setter, value in zip(_WISH_SETTERS, (
+            id, title, description, image_id, wish_type, created_by, created_at or datetime.now()
+        )):
+            setter(self, value)
+
+    @property
+    def created_at(self) -> datetime:
+        return parse_timestamp(self._created_at)
+
+    @classmethod
+    def from_row(cls, row) -> "Wish":
+        """Создаёт желание из строки (id, title, description, image_id, wish_type,
+        created_by, created_at)"""
+        wish = object.__new__(cls)
+        set_id, set_title, set_description, set_image_id, set_type, set_created_by, \
+            set_created_at = _WISH_SETTERS
+        set_id(wish, row[0])
+        set_title(wish, row[1])
+        set_description(wish, row[2])
+        set_image_id(wish, row[3])
+        set_type(wish, WISH_TYPES[row[4]])
+        set_created_by(wish, row[5])
+        set_created_at(wish, row[6])
+        return wish
+
+_WISH_SETTERS = _setters(Wish, *Wish.__slots__)
+
+class Task(_Record):
+    __slots__ = ("id", "title", "description", "task_type", "status", "created_by", "_created_at")
+    _fields = ("id", "title", "description", "task_type", "status", "created_by", "created_at")
+
+    def __init__(self,
                  id: int = None,
                  title: str = "",
                  description: str = "",
@@ -67,10 +199,29 @@ class Task:
                  status: TaskStatus = TaskStatus.ACTIVE,
                  created_by: int = None,
                  created_at: datetime = None):
-        self.id = id
-        self.title = title
-        self.description = description
-        self.task_type = task_type
-        self.status = status
-        self.created_by = created_by
-        self.created_at = created_at or datetime.now()
\ No newline at end of file
+        for setter, value in zip(_TASK_SETTERS, (
+            id, title, description, task_type, status, created_by, created_at or datetime.now()
+        )):
+            setter(self, value)
+
+    @property
+    def created_at(self) -> datetime:
+        return parse_timestamp(self._created_at)
+
+    @classmethod
+    def from_row(cls, row) -> "Task":
+        """Создаёт задачу из строки (id, title, description, task_type, status,
+        created_by, created_at)"""
+        task = object.__new__(cls)
+        set_id, set_title, set_description, set_type, set_status, set_created_by, \
+            set_created_at = _TASK_SETTERS
+        set_id(task, row[0])
+        set_title(task, row[1])
+        set_description(task, row[2])
+        set_type(task, TASK_TYPES[row[3]])
+        set_status(task, TASK_STATUSES[row[4]])
+        set_created_by(task, row[5])
+        set_created_at(task, row[6])
+        return task
+
+_TASK_SETTERS = _setters(Task, *Task.__slots__)
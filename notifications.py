@@ -0,0 +1,252 @@
+import asyncio
+import functools
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramRetryAfter, TelegramNetworkError, TelegramServerError, TelegramForbiddenError, TelegramBadRequest
+)
+from database import OUTBOX_BATCH_SIZE
+
+# Лимиты Telegram: около 30 сообщений в секунду на бота и не чаще раза в
+# секунду в один чат (короткие всплески допускаются)
+GLOBAL_RATE = 30
+GLOBAL_BURST = 30
+CHAT_RATE = 1
+CHAT_BURST = 3
+
+NOTIFY_WORKERS = 4
+NOTIFY_QUEUE_SIZE = 1000
+
+# Повторы при сетевых ошибках и ошибках сервера: задержка удваивается
+MAX_RETRIES = 5
+RETRY_BASE_DELAY = 1.0
+
+# Outbox: как часто проверять его без сигнала о новых строках и сколько
+# хранить доставленные уведомления
+OUTBOX_POLL_INTERVAL = 30
+OUTBOX_KEEP_DELIVERED = timedelta(days=1)
+OUTBOX_PURGE_INTERVAL = 3600
+
+# Сколько чатов помнить. Вытесняются только чаты без отправки в процессе
+MAX_TRACKED_CHATS = 4096
+
+def notification(chat_id: int, text: str, photo: Optional[str] = None) -> tuple:
+    """Уведомление для параметра notify мутаторов базы: с картинкой или без"""
+    if photo:
+        return (chat_id, "send_photo", {"photo": photo, "caption": text})
+    return (chat_id, "send_message", {"text": text})
+
+class TokenBucket:
+    """Ведро жетонов: rate жетонов в секунду, не больше capacity про запас.
+
+    Жетон берётся сразу, даже если его ещё нет - тогда ведро уходит в минус,
+    а take() возвращает, сколько ждать. Так очередь ожидающих не нужна.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self) -> float:
+        """Берёт жетон и возвращает задержку в секундах до отправки"""
+        self._refill()
+        self.tokens -= 1
+        return 0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def pause(self, seconds: float):
+        """Следующий жетон - не раньше чем через seconds секунд (ответ 429)"""
+        self._refill()
+        self.tokens = min(self.tokens, 1) - seconds * self.rate
+
+class _Chat:
+    __slots__ = ("bucket", "lock")
+
+    def __init__(self):
+        self.bucket = TokenBucket(CHAT_RATE, CHAT_BURST)
+        # Уведомления в один чат уходят по очереди и в том же порядке
+        self.lock = asyncio.Lock()
+
+class Notifier:
+    """Отправка уведомлений партнёру с учётом лимитов Telegram.
+
+    Уведомления приходят только из outbox (через OutboxRelay), а отправкой
+    занимаются воркеры. На 429 отправка во все чаты ждёт retry_after, на
+    сетевые ошибки и 5xx - повторяется с растущей задержкой. Остальные ошибки
+    (бот заблокирован и т.п.) возвращаются вызывающему. close() дожидается
+    отправки того, что уже в очереди.
+    """
+
+    def __init__(self, workers: int = NOTIFY_WORKERS, queue_size: int = NOTIFY_QUEUE_SIZE):
+        self._workers_count = workers
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._bucket = TokenBucket(GLOBAL_RATE, GLOBAL_BURST)
+        self._chats = OrderedDict()
+        self._workers = []
+        self._bot: Optional[Bot] = None
+        self.sent = 0
+        self.failed = 0
+
+    def start(self, bot: Bot):
+        self._bot = bot
+        self._workers = [
+            asyncio.create_task(self._worker(), name=f"notifier-{number}")
+            for number in range(self._workers_count)
+        ]
+
+    async def deliver(self, method: str, chat_id: int, kwargs: dict):
+        """Отправляет уведомление через общую очередь и ждёт результата.
+        Ошибка отправки пробрасывается вызывающему"""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((method, chat_id, kwargs, future))
+        await future
+
+    def _chat(self, chat_id: int) -> _Chat:
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            if len(self._chats) >= MAX_TRACKED_CHATS:
+                idle = [key for key, old in self._chats.items() if not old.lock.locked()]
+                for old_id in idle[:len(self._chats) - MAX_TRACKED_CHATS + 1]:
+                    del self._chats[old_id]
+            chat = self._chats[chat_id] = _Chat()
+        self._chats.move_to_end(chat_id)
+        return chat
+
+    async def _worker(self):
+        while True:
+            method, chat_id, kwargs, future = await self._queue.get()
+            try:
+                await self._deliver(method, chat_id, kwargs)
+                if not future.done():
+                    future.set_result(None)
+            except Exception as e:
+                self.failed += 1
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, method: str, chat_id: int, kwargs: dict):
+        chat = self._chat(chat_id)
+        async with chat.lock:
+            for attempt in range(MAX_RETRIES + 1):
+                await asyncio.sleep(chat.bucket.take())
+                await asyncio.sleep(self._bucket.take())
+                try:
+                    await getattr(self._bot, method)(chat_id, **kwargs)
+                    self.sent += 1
+                    return
+                except TelegramRetryAfter as e:
+                    logging.warning(f"Telegram просит подождать {e.retry_after} с перед отправкой в {chat_id}")
+                    # 429 бывает и из-за общего лимита бота, поэтому
+                    # притормаживаем не только этот чат, но и все остальные
+                    chat.bucket.pause(e.retry_after)
+                    self._bucket.pause(e.retry_after)
+                except (TelegramNetworkError, TelegramServerError) as e:
+                    if attempt == MAX_RETRIES:
+                        raise
+                    delay = RETRY_BASE_DELAY * 2 ** attempt
+                    logging.warning(f"Не удалось отправить уведомление в {chat_id} ({e}), повтор через {delay} с")
+                    await asyncio.sleep(delay)
+            raise RuntimeError(f"превышено число попыток ({MAX_RETRIES + 1})")
+
+    async def close(self, timeout: float = 10):
+        """Ждёт отправки очереди не дольше timeout и останавливает воркеров"""
+        if self._workers:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                logging.warning(f"Не отправлено уведомлений при остановке: {self._queue.qsize()}")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+class OutboxRelay:
+    """Доставляет уведомления из таблицы outbox через Notifier.
+
+    Строки outbox пишутся мутаторами базы в одной транзакции с изменением,
+    поэтому уведомление не теряется, даже если процесс упал сразу после
+    commit: оно уйдёт после перезапуска. Строки берутся пачками, и каждая
+    отмечается доставленной сразу после отправки. Доставка - хотя бы один
+    раз: если процесс упадёт между отправкой и этой отметкой, уведомление
+    уйдёт повторно. Временные ошибки повторяются с растущей задержкой, а
+    окончательный отказ Telegram (бот заблокирован, неверный запрос) снимает
+    уведомление с отправки сразу.
+    """
+
+    def __init__(self, db, notifier: Notifier, batch_size: int = OUTBOX_BATCH_SIZE,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL):
+        self._db = db
+        self._notifier = notifier
+        self._batch_size = batch_size
+        self._poll_interval = poll_interval
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._closing = False
+        self._purged_at = None
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        # База зовёт слушателя из своего потока после commit
+        await self._db.set_outbox_listener(functools.partial(loop.call_soon_threadsafe, self._wakeup.set))
+        self._task = asyncio.create_task(self._run(), name="outbox-relay")
+
+    async def _run(self):
+        while not self._closing:
+            self._wakeup.clear()
+            try:
+                full = await self._deliver_batch()
+                await self._purge()
+            except Exception as e:
+                logging.error(f"Ошибка при доставке уведомлений из outbox: {e}")
+                full = False
+            # Полная пачка - возможно, есть ещё, берём следующую сразу
+            if not full and not self._closing:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self._poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _deliver_batch(self) -> bool:
+        rows = await self._db.get_outbox_batch(self._batch_size)
+        await asyncio.gather(*(self._deliver(*row) for row in rows))
+        return len(rows) == self._batch_size
+
+    async def _deliver(self, outbox_id: int, chat_id: int, method: str, payload: str):
+        try:
+            await self._notifier.deliver(method, chat_id, json.loads(payload))
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            logging.warning(f"Уведомление {outbox_id} для {chat_id} отклонено Telegram: {e}")
+            await self._db.mark_outbox_rejected(outbox_id, str(e))
+            return
+        except Exception as e:
+            logging.error(f"Уведомление {outbox_id} для {chat_id} не доставлено: {e}")
+            await self._db.mark_outbox_failed(outbox_id, str(e))
+            return
+        await self._db.mark_outbox_delivered(outbox_id)
+
+    async def _purge(self):
+        now = datetime.now()
+        if self._purged_at is None or now - self._purged_at > timedelta(seconds=OUTBOX_PURGE_INTERVAL):
+            self._purged_at = now
+            await self._db.purge_outbox(now - OUTBOX_KEEP_DELIVERED)
+
+    async def close(self):
+        """Дожидается текущей пачки. Недоставленное останется в outbox до запуска"""
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -0,0 +1,100 @@
+import re
+from itertools import chain
+from collections import Counter
+from datetime import datetime
+from typing import List, Optional
+import numpy as np
+from models import Movie, MovieType, to_epoch
+
+# Сколько самых частых слов берём в словарь TF-IDF. Больше - точнее, но
+# матрица признаков растёт как число фильмов * MAX_FEATURES
+MAX_FEATURES = 512
+
+# Оценка, начиная с которой просмотренный фильм считается понравившимся
+LIKED_RATING = 4
+
+# Веса составляющих итогового балла
+SIMILARITY_WEIGHT = 0.6
+RATING_WEIGHT = 0.3
+AGE_WEIGHT = 0.1
+
+# За сколько дней в очереди фильм набирает примерно 2/3 бонуса за возраст
+AGE_SCALE_DAYS = 30
+MICROSECONDS_PER_DAY = 86400 * 1_000_000
+
+TOKEN_RE = re.compile(r"\w{2,}")
+
+def tokenize(movie: Movie) -> list:
+    """Слова из названия, описания и отзыва ("-" означает пустое поле)"""
+    text = " ".join(
+        part for part in (movie.title, movie.description, movie.review)
+        if part and part != "-"
+    )
+    return TOKEN_RE.findall(text.lower())
+
+class MovieFeatures:
+    """Признаки фильмов пары: нормированная матрица TF-IDF и числовые колонки.
+
+    Строится один раз на набор фильмов, а рекомендации считаются по ней
+    векторно, без прохода по фильмам в Python.
+    """
+
+    def __init__(self, movies: List[Movie]):
+        self.movies = movies
+        documents = [tokenize(movie) for movie in movies]
+
+        frequencies = Counter(token for tokens in documents for token in set(tokens))
+        vocabulary = sorted(frequencies, key=lambda token: (-frequencies[token], token))[:MAX_FEATURES]
+        index = {token: column for column, token in enumerate(vocabulary)}
+
+        # Частоты слов: номера ячеек (строка, колонка) собираем в плоский
+        # массив и считаем повторы через np.unique вместо цикла по ячейкам
+        columns = [[index[token] for token in tokens if token in index] for tokens in documents]
+        lengths = np.fromiter(map(len, columns), dtype=np.intp, count=len(columns))
+        cells = np.repeat(np.arange(len(movies), dtype=np.intp), lengths) * len(vocabulary)
+        cells += np.fromiter(chain.from_iterable(columns), dtype=np.intp, count=int(lengths.sum()))
+        cells, counts = np.unique(cells, return_counts=True)
+        vectors = np.zeros((len(movies), len(vocabulary)), dtype=np.float32)
+        vectors.flat[cells] = counts
+
+        document_frequency = np.array([frequencies[token] for token in vocabulary], dtype=np.float32)
+        vectors *= np.log((1 + len(movies)) / (1 + document_frequency)) + 1
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.vectors = vectors / np.where(norms == 0, 1, norms)
+
+        self.ratings = np.array([movie.rating or 0 for movie in movies], dtype=np.float32)
+        self.watched = np.array([movie.watched for movie in movies], dtype=bool)
+        self.created_by = np.array([movie.created_by for movie in movies], dtype=np.int64)
+        self.for_partner = np.array([movie.movie_type is MovieType.PARTNER_MOVIES for movie in movies], dtype=bool)
+        self.created_at = np.array([movie.created_at_epoch for movie in movies], dtype=np.int64)
+
+    def recommend(self, partner_id: Optional[int], limit: int = 5, now: datetime = None) -> List[Movie]:
+        """Непросмотренные фильмы, которые партнёр добавил в наш список,
+        по убыванию балла.
+
+        Балл складывается из похожести на понравившиеся просмотренные фильмы
+        пары, оценки партнёра и того, как долго фильм ждёт в очереди.
+        """
+        candidates = np.flatnonzero(~self.watched & self.for_partner & (self.created_by == partner_id))
+        if not len(candidates):
+            return []
+
+        liked = self.watched & (self.ratings >= LIKED_RATING)
+        if not liked.any():
+            liked = self.watched & (self.ratings > 0)
+        profile = (self.vectors[liked] * self.ratings[liked, None]).sum(axis=0)
+        norm = np.linalg.norm(profile)
+        similarity = self.vectors[candidates] @ (profile / norm) if norm else 0
+
+        age_days = (to_epoch(now or datetime.now()) - self.created_at[candidates]) / MICROSECONDS_PER_DAY
+        age = 1 - np.exp(-np.maximum(age_days, 0) / AGE_SCALE_DAYS)
+
+        scores = (SIMILARITY_WEIGHT * similarity
+                  + RATING_WEIGHT * self.ratings[candidates] / 5
+                  + AGE_WEIGHT * age)
+        if len(candidates) > limit:
+            top = np.argpartition(-scores, limit)[:limit]
+        else:
+            top = np.arange(len(candidates))
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [self.movies[candidates[position]] for position in top]
@@ -0,0 +1,165 @@
+import asyncio
+import copy
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Mapping, Optional
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StorageKey, StateType
+from models import to_epoch
+
+# Сколько состояний держать в памяти. Остальные читаются из базы по запросу
+FSM_CACHE_SIZE = 1024
+
+# Раз в сколько секунд изменённые состояния пишутся в базу одной транзакцией,
+# и при каком числе изменений писать, не дожидаясь таймера
+FSM_FLUSH_INTERVAL = 1.0
+FSM_FLUSH_MAX_BATCH = 256
+
+# Раз в сколько секунд удалять из базы брошенные состояния
+FSM_PURGE_INTERVAL = 3600
+
+MICROSECONDS_PER_SECOND = 1_000_000
+
+class _Record:
+    """Состояние FSM и данные одного ключа с временем последней записи"""
+    __slots__ = ("state", "data", "updated_at")
+
+    def __init__(self, state: Optional[str], data: dict, updated_at: int):
+        self.state = state
+        self.data = data
+        self.updated_at = updated_at
+
+    @property
+    def empty(self) -> bool:
+        return self.state is None and not self.data
+
+_EMPTY = _Record(None, {}, 0)
+
+class SQLiteStorage(BaseStorage):
+    """Хранилище FSM в базе бота (таблица fsm_states).
+
+    Чтение идёт из LRU-кэша в памяти, в базу обращаемся только при промахе,
+    например после перезапуска. Запись попадает в кэш сразу, а в базу -
+    пачкой раз в FSM_FLUSH_INTERVAL, поэтому при падении процесса теряются
+    изменения максимум за этот интервал. close() дописывает всё, что накопилось.
+
+    Состояния, которые не менялись дольше ttl секунд, считаются брошенными:
+    они читаются как пустые и периодически удаляются из базы.
+    """
+
+    def __init__(self, db, ttl: float, cache_size: int = FSM_CACHE_SIZE,
+                 flush_interval: float = FSM_FLUSH_INTERVAL,
+                 key_builder: Optional[KeyBuilder] = None):
+        self._db = db
+        self._ttl = int(ttl * MICROSECONDS_PER_SECOND)
+        self._cache_size = cache_size
+        self._flush_interval = flush_interval
+        self._key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._cache = OrderedDict()
+        # Изменения, которые ещё не отправлены в базу, и те, что пишутся прямо
+        # сейчас. Из кэша запись может вытесниться раньше, чем попадёт в базу,
+        # поэтому при чтении сначала смотрим сюда
+        self._dirty: Dict[str, _Record] = {}
+        self._flushing: Dict[str, _Record] = {}
+        self._flush_handle = None
+        self._flushes = set()
+        self._flush_lock = asyncio.Lock()
+        self._purged_at = 0
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        name = self._key_builder.build(key)
+        record = await self._load(name)
+        self._put(name, state.state if isinstance(state, State) else state, record.data)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = await self._load(self._key_builder.build(key))
+        return record.state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        name = self._key_builder.build(key)
+        record = await self._load(name)
+        self._put(name, record.state, copy.deepcopy(dict(data)))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = await self._load(self._key_builder.build(key))
+        return copy.deepcopy(record.data)
+
+    async def _load(self, name: str) -> _Record:
+        record = self._dirty.get(name) or self._flushing.get(name) or self._cache.get(name)
+        if record is None:
+            row = await self._db.get_fsm_record(name)
+            # Пока читали, ключ могли записать - тогда свежее то, что в памяти
+            record = self._dirty.get(name) or self._flushing.get(name) or self._cache.get(name)
+            if record is None:
+                record = _Record(row[0], json.loads(row[1]), row[2]) if row else _EMPTY
+                self._remember(name, record)
+        elif name in self._cache:
+            self._cache.move_to_end(name)
+
+        if not record.empty and to_epoch(datetime.now()) - record.updated_at > self._ttl:
+            return _EMPTY
+        return record
+
+    def _remember(self, name: str, record: _Record):
+        self._cache[name] = record
+        self._cache.move_to_end(name)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def _put(self, name: str, state: Optional[str], data: dict):
+        record = _Record(state, data, to_epoch(datetime.now()))
+        self._remember(name, record)
+        self._dirty[name] = record
+        if len(self._dirty) == FSM_FLUSH_MAX_BATCH:
+            self._start_flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self._flush_interval, self._start_flush)
+
+    def _start_flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        flush = asyncio.create_task(self._flush())
+        self._flushes.add(flush)
+        flush.add_done_callback(self._flushes.discard)
+
+    async def _flush(self):
+        """Пишет накопленные изменения в базу одной транзакцией"""
+        # Пачки пишутся по очереди, чтобы более старая не затёрла новую
+        async with self._flush_lock:
+            self._flushing, self._dirty = self._dirty, {}
+            try:
+                if self._flushing:
+                    await self._db.save_fsm_records([
+                        (name, record.state, json.dumps(record.data, ensure_ascii=False), record.updated_at)
+                        for name, record in self._flushing.items()
+                    ])
+                now = to_epoch(datetime.now())
+                if now - self._purged_at > FSM_PURGE_INTERVAL * MICROSECONDS_PER_SECOND:
+                    self._purged_at = now
+                    await self._db.purge_fsm_records(now - self._ttl)
+            except Exception as e:
+                logging.error(f"Ошибка при сохранении состояний FSM: {e}")
+                # Возвращаем пачку в очередь, если ключи не успели перезаписать
+                for name, record in self._flushing.items():
+                    self._dirty.setdefault(name, record)
+                if self._dirty and self._flush_handle is None:
+                    self._flush_handle = asyncio.get_running_loop().call_later(
+                        self._flush_interval, self._start_flush
+                    )
+            finally:
+                self._flushing = {}
+
+    async def close(self) -> None:
+        # Досылаем всё, что накопилось, и ждём записи
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+        await self._flush()
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
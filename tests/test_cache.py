@@ -0,0 +1,95 @@
+"""Кэши списков и записей: после записи следующее чтение видит новые данные
+и у владельца, и у партнёра"""
+import pytest
+
+from database import Database
+from models import Task, TaskType, TaskStatus, Wish, WishType, Movie, MovieType
+
+OWNER_ID = 1
+PARTNER_ID = 2
+
+@pytest.fixture
+def db():
+    db = Database(":memory:")
+    db.add_user(OWNER_ID, PARTNER_ID)
+    db.add_user(PARTNER_ID, OWNER_ID)
+    yield db
+    db.close()
+
+def ids(page) -> list:
+    return [item.id for item in page]
+
+def test_add_task_refreshes_both_views(db):
+    # Прогреваем кэш пустыми списками
+    assert ids(db.get_user_tasks(OWNER_ID)) == []
+    assert ids(db.get_partner_tasks(PARTNER_ID)) == []
+    assert db.get_dashboard_counts(PARTNER_ID)["partner_tasks"] == 0
+
+    task_id = db.add_task(Task(title="купить хлеб", task_type=TaskType.FOR_ME, created_by=OWNER_ID))
+
+    assert ids(db.get_user_tasks(OWNER_ID)) == [task_id]
+    assert ids(db.get_partner_tasks(PARTNER_ID)) == [task_id]
+    assert db.get_dashboard_counts(PARTNER_ID)["partner_tasks"] == 1
+
+def test_update_task_status_refreshes_lists_and_entity(db):
+    task_id = db.add_task(Task(title="помыть окна", task_type=TaskType.FOR_BOTH, created_by=OWNER_ID))
+    assert db.get_task(task_id).status == TaskStatus.ACTIVE
+    assert ids(db.get_common_tasks(OWNER_ID)) == [task_id]
+    assert ids(db.get_common_tasks(PARTNER_ID)) == [task_id]
+    assert ids(db.get_completed_tasks(PARTNER_ID)) == []
+
+    db.update_task_status(task_id, TaskStatus.COMPLETED)
+
+    assert db.get_task(task_id).status == TaskStatus.COMPLETED
+    assert ids(db.get_common_tasks(OWNER_ID)) == []
+    assert ids(db.get_common_tasks(PARTNER_ID)) == []
+    assert ids(db.get_completed_tasks(OWNER_ID)) == [task_id]
+    assert ids(db.get_completed_tasks(PARTNER_ID)) == [task_id]
+
+def test_delete_task_refreshes_both_views(db):
+    task_id = db.add_task(Task(title="позвонить маме", task_type=TaskType.FOR_PARTNER, created_by=OWNER_ID))
+    assert db.get_task(task_id) is not None
+    assert ids(db.get_partner_tasks(OWNER_ID)) == [task_id]
+    assert ids(db.get_user_tasks(PARTNER_ID)) == [task_id]
+
+    assert db.delete_task(task_id)
+
+    assert db.get_task(task_id) is None
+    assert ids(db.get_partner_tasks(OWNER_ID)) == []
+    assert ids(db.get_user_tasks(PARTNER_ID)) == []
+
+def test_delete_wish_refreshes_both_views(db):
+    wish_id = db.add_wish(Wish(title="велосипед", wish_type=WishType.MY_WISH, created_by=OWNER_ID))
+    assert db.get_wish(wish_id) is not None
+    assert ids(db.get_my_wishes(OWNER_ID)) == [wish_id]
+    assert ids(db.get_partner_wishes(PARTNER_ID)) == [wish_id]
+
+    assert db.delete_wish(wish_id)
+
+    assert db.get_wish(wish_id) is None
+    assert ids(db.get_my_wishes(OWNER_ID)) == []
+    assert ids(db.get_partner_wishes(PARTNER_ID)) == []
+
+def test_delete_movie_refreshes_both_views(db):
+    movie_id = db.add_movie(Movie(title="Солярис", movie_type=MovieType.MY_MOVIES, created_by=OWNER_ID))
+    assert db.get_movie(movie_id) is not None
+    assert ids(db.get_my_movies(OWNER_ID)) == [movie_id]
+    assert ids(db.get_partner_movies(PARTNER_ID)) == [movie_id]
+
+    assert db.delete_movie(movie_id)
+    assert not db.delete_movie(movie_id)
+
+    assert db.get_movie(movie_id) is None
+    assert ids(db.get_my_movies(OWNER_ID)) == []
+    assert ids(db.get_partner_movies(PARTNER_ID)) == []
+
+def test_other_couples_keep_their_cache(db):
+    db.add_user(3, 4)
+    db.add_user(4, 3)
+    assert ids(db.get_user_tasks(3)) == []
+    hits = db.list_cache.stats()["hits"]
+
+    db.add_task(Task(title="чужая задача", created_by=OWNER_ID))
+
+    assert ids(db.get_user_tasks(3)) == []
+    assert db.list_cache.stats()["hits"] == hits + 1
@@ -0,0 +1,77 @@
+"""CallbackRouter: поиск обработчика по префиксу и кнопки старого формата"""
+import asyncio
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+
+from callbacks import (
+    CallbackRouter, EditWishCallback, TaskFieldCallback, ViewTaskCallback, ViewWishCallback, WishFieldCallback,
+    upgrade_legacy_data,
+)
+
+def callback_update(bot: Bot, update_id: int, data: str) -> Update:
+    return Update.model_validate({"update_id": update_id, "callback_query": {
+        "id": str(update_id), "chat_instance": "test", "data": data,
+        "from": {"id": 1, "is_bot": False, "first_name": "test"},
+        "message": {"message_id": 10, "date": 0, "chat": {"id": 1, "type": "private"}},
+    }}, context={"bot": bot})
+
+def make_router(handled: list) -> CallbackRouter:
+    """Роутер, обработчики которого записывают схему и callback_data нажатия"""
+    router = CallbackRouter()
+
+    for callback_type in (ViewTaskCallback, ViewWishCallback, EditWishCallback, TaskFieldCallback, WishFieldCallback):
+        @router.button(callback_type)
+        async def button(callback, callback_data):
+            handled.append((callback_data, callback.data))
+
+    @router.callback_query()
+    async def outdated(callback):
+        handled.append(("outdated", callback.data))
+
+    return router
+
+def press(*data: str) -> list:
+    async def run():
+        bot = Bot("1:test")
+        handled = []
+        dispatcher = Dispatcher()
+        dispatcher.include_router(make_router(handled))
+        for update_id, value in enumerate(data):
+            await dispatcher.feed_update(bot, callback_update(bot, update_id, value))
+        await bot.session.close()
+        return handled
+
+    return asyncio.run(run())
+
+def test_current_format():
+    assert press("view_task:5:partner_tasks", "edit_wish:3") == [
+        (ViewTaskCallback(task_id=5, context="partner_tasks"), "view_task:5:partner_tasks"),
+        (EditWishCallback(wish_id=3), "edit_wish:3"),
+    ]
+
+def test_legacy_view_uses_default_context():
+    assert press("view_task:5", "view_wish:7") == [
+        (ViewTaskCallback(task_id=5), "view_task:5:my_tasks"),
+        (ViewWishCallback(wish_id=7), "view_wish:7:my_wishes"),
+    ]
+
+def test_legacy_edit_goes_to_field_handlers():
+    assert press("edit:title", "edit_wish:image") == [
+        (TaskFieldCallback(field="title"), "task_field:title"),
+        (WishFieldCallback(field="image"), "wish_field:image"),
+    ]
+
+def test_unknown_button_is_outdated():
+    assert press("unknown:1", "view_task:abc", "edit:") == [
+        ("outdated", "unknown:1"),
+        ("outdated", "view_task:abc"),
+        ("outdated", "edit:"),
+    ]
+
+def test_upgrade_legacy_data():
+    assert upgrade_legacy_data("view_movie:2") == "view_movie:2:my_movies"
+    assert upgrade_legacy_data("edit_movie:description") == "movie_field:description"
+    # Новый формат не переводится
+    assert upgrade_legacy_data("edit_movie:7") is None
+    assert upgrade_legacy_data("view_task:5:my_tasks") is None
@@ -0,0 +1,74 @@
+"""Group commit в AsyncDatabase: одна транзакция на пачку записей и
+откат только упавшей записи"""
+import asyncio
+import sqlite3
+
+import pytest
+
+from database import AsyncDatabase
+from models import Task
+
+USER_ID = 1
+PARTNER_ID = 2
+
+def notify(text: str) -> list:
+    return [(PARTNER_ID, "send_message", {"text": text})]
+
+async def open_db(window: float = 0.05) -> tuple:
+    """База с group commit и список COMMIT, выполненных пишущим соединением"""
+    db = AsyncDatabase(":memory:", group_commit_window=window)
+    await db.add_user(USER_ID, PARTNER_ID)
+    commits = []
+    db._db.conn.set_trace_callback(
+        lambda sql: commits.append(sql) if sql.strip().upper() == "COMMIT" else None
+    )
+    return db, commits
+
+def test_concurrent_writes_share_one_commit():
+    async def run():
+        db, commits = await open_db()
+        task_ids = await asyncio.gather(*(
+            db.add_task(Task(title=f"задача {i}", created_by=USER_ID)) for i in range(10)
+        ))
+        page = await db.get_user_tasks(USER_ID, page_size=None)
+        await db.close()
+        return task_ids, commits, page
+
+    task_ids, commits, page = asyncio.run(run())
+    assert len(set(task_ids)) == 10
+    assert len(commits) == 1
+    assert sorted(task.id for task in page) == sorted(task_ids)
+
+def test_failed_write_rolls_back_only_itself():
+    async def run():
+        db, commits = await open_db()
+        results = await asyncio.gather(
+            db.add_task(Task(title="первая", created_by=USER_ID), notify=notify("первая")),
+            # title NOT NULL: запись упадёт внутри пачки
+            db.add_task(Task(title=None, created_by=USER_ID), notify=notify("упавшая")),
+            db.add_task(Task(title="третья", created_by=USER_ID), notify=notify("третья")),
+            return_exceptions=True,
+        )
+        page = await db.get_user_tasks(USER_ID, page_size=None)
+        outbox = db._db.conn.execute("SELECT payload FROM outbox ORDER BY id").fetchall()
+        await db.close()
+        return results, commits, page, outbox
+
+    results, commits, page, outbox = asyncio.run(run())
+    first, failed, third = results
+    assert isinstance(failed, sqlite3.IntegrityError)
+    assert len(commits) == 1
+    assert sorted(task.title for task in page) == ["первая", "третья"]
+    # Уведомление упавшей записи откатилось вместе с ней
+    assert [payload for payload, in outbox] == [
+        '{"text": "первая"}', '{"text": "третья"}'
+    ]
+
+def test_without_window_every_write_commits():
+    async def run():
+        db, commits = await open_db(window=0)
+        await asyncio.gather(*(db.add_task(Task(title=f"задача {i}", created_by=USER_ID)) for i in range(3)))
+        await db.close()
+        return commits
+
+    assert len(asyncio.run(run())) == 3
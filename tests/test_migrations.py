@@ -0,0 +1,20 @@
+"""Шаги миграций схемы"""
+import sqlite3
+
+from migrations import MIGRATIONS, SCHEMA_VERSION, create_indexes, get_schema_version, migrate
+
+def index_names(conn: sqlite3.Connection) -> set:
+    return {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+
+def test_migrate_to_latest_version():
+    conn = sqlite3.connect(":memory:")
+    migrate(conn)
+    assert get_schema_version(conn) == SCHEMA_VERSION == MIGRATIONS[-1][0]
+
+def test_rerun_keeps_indexes_of_later_steps():
+    conn = sqlite3.connect(":memory:")
+    migrate(conn)
+    before = index_names(conn)
+    assert "idx_outbox_pending" in before
+    create_indexes(conn, batch_size=10)
+    assert index_names(conn) == before
@@ -0,0 +1,126 @@
+"""Notifier и OutboxRelay с ботом-заглушкой: лимиты, 429 и отказы Telegram"""
+import asyncio
+import time
+
+import pytest
+from aiogram.exceptions import TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+import notifications
+from database import AsyncDatabase
+from models import Task
+from notifications import Notifier, OutboxRelay, TokenBucket, notification
+
+USER_ID = 1
+PARTNER_ID = 2
+
+class FakeBot:
+    """Запоминает отправки, а для заданных чатов бросает ошибки по очереди"""
+
+    def __init__(self, errors: dict = None):
+        self.errors = {chat_id: list(chat_errors) for chat_id, chat_errors in (errors or {}).items()}
+        self.calls = []
+        self.sent = []
+
+    async def send_message(self, chat_id: int, text: str):
+        now = time.monotonic()
+        self.calls.append((chat_id, now))
+        chat_errors = self.errors.get(chat_id)
+        if chat_errors:
+            raise chat_errors.pop(0)(SendMessage(chat_id=chat_id, text=text))
+        self.sent.append((chat_id, text, now))
+
+def retry_after(seconds: int):
+    return lambda method: TelegramRetryAfter(method, "Flood control exceeded", seconds)
+
+def forbidden(method):
+    return TelegramForbiddenError(method, "bot was blocked by the user")
+
+def network_error(method):
+    return TelegramNetworkError(method, "connection reset")
+
+def test_token_bucket_burst_then_rate():
+    bucket = TokenBucket(rate=10, capacity=3)
+    delays = [bucket.take() for _ in range(5)]
+    assert delays[:3] == [0, 0, 0]
+    assert delays[3] == pytest.approx(0.1, abs=0.01)
+    assert delays[4] == pytest.approx(0.2, abs=0.01)
+
+def test_token_bucket_pause_delays_next_token():
+    bucket = TokenBucket(rate=10, capacity=3)
+    bucket.pause(2)
+    # Запас ведра не помогает обойти паузу
+    assert bucket.take() == pytest.approx(2, abs=0.01)
+
+def test_retry_after_pauses_all_chats():
+    async def run():
+        bot = FakeBot({1: [retry_after(1)]})
+        notifier = Notifier(workers=2)
+        notifier.start(bot)
+        started = time.monotonic()
+        first = asyncio.create_task(notifier.deliver("send_message", 1, {"text": "первое"}))
+        # Второй чат встаёт в очередь, когда первый уже получил 429
+        while not bot.calls:
+            await asyncio.sleep(0.01)
+        await notifier.deliver("send_message", 2, {"text": "второе"})
+        await first
+        await notifier.close()
+        return bot, notifier, started
+
+    bot, notifier, started = asyncio.run(run())
+    assert [chat_id for chat_id, _ in bot.calls] == [1, 2, 1]
+    assert {chat_id for chat_id, _, _ in bot.sent} == {1, 2}
+    # После 429 ни один чат не получает сообщений раньше retry_after
+    assert all(sent_at - started >= 0.95 for _, _, sent_at in bot.sent)
+    assert notifier.sent == 2
+    assert notifier.failed == 0
+
+def test_permanent_error_is_not_retried():
+    async def run():
+        bot = FakeBot({1: [forbidden]})
+        notifier = Notifier(workers=1)
+        notifier.start(bot)
+        with pytest.raises(TelegramForbiddenError):
+            await notifier.deliver("send_message", 1, {"text": "привет"})
+        await notifier.close()
+        return bot, notifier
+
+    bot, notifier = asyncio.run(run())
+    assert len(bot.calls) == 1
+    assert notifier.failed == 1
+
+def test_relay_marks_delivered_rejected_and_failed(monkeypatch):
+    monkeypatch.setattr(notifications, "MAX_RETRIES", 0)
+
+    async def run():
+        db = AsyncDatabase(":memory:")
+        await db.add_user(USER_ID, PARTNER_ID)
+        for chat_id in (2, 3, 4):
+            await db.add_task(
+                Task(title=f"задача {chat_id}", created_by=USER_ID),
+                notify=[notification(chat_id, f"для {chat_id}")],
+            )
+        bot = FakeBot({3: [forbidden], 4: [network_error]})
+        notifier = Notifier()
+        notifier.start(bot)
+        relay = OutboxRelay(db, notifier)
+        await relay.start()
+        while len(bot.calls) < 3:
+            await asyncio.sleep(0.01)
+        await relay.close()
+        await notifier.close()
+        rows = db._db.conn.execute("""
+        SELECT chat_id, attempts, delivered_at IS NOT NULL, next_attempt_at IS NOT NULL
+        FROM outbox ORDER BY chat_id
+        """).fetchall()
+        await db.close()
+        return rows
+
+    assert asyncio.run(run()) == [
+        # Доставлено
+        (2, 0, 1, 0),
+        # Бот заблокирован: снято с отправки без повторов
+        (3, 1, 0, 0),
+        # Сетевая ошибка: повтор позже
+        (4, 1, 0, 1),
+    ]
@@ -0,0 +1,119 @@
+"""Планы запросов списков, записей, главного меню, поиска, outbox, архива,
+журнала обновлений и состояний FSM.
+
+Каждый запрос должен идти по индексу: без SCAN таблицы и без временного
+B-дерева для сортировки или группировки.
+"""
+import re
+from datetime import datetime, timedelta
+
+import pytest
+
+from database import Database
+from models import Task, TaskType, TaskStatus, Wish, WishType, Movie, MovieType
+
+USER_ID = 1
+PARTNER_ID = 2
+
+# Таблицы, которые растут вместе с пользователями. FTS-таблицы и
+# представления (SCAN all_tasks - это обход сопрограммы UNION ALL, а не
+# таблицы) сюда не входят
+TABLES = ("tasks", "tasks_archive", "wishes", "movies", "outbox", "movie_stats",
+          "processed_updates", "fsm_states")
+TABLE_SCAN_RE = re.compile(rf"\bSCAN ({'|'.join(TABLES)})\b(?!_)")
+
+@pytest.fixture
+def db():
+    db = Database(":memory:")
+    db.add_user(USER_ID, PARTNER_ID)
+    db.add_user(PARTNER_ID, USER_ID)
+    now = datetime.now()
+    for created_by in (USER_ID, PARTNER_ID):
+        for task_type in TaskType:
+            for status in TaskStatus:
+                db.add_task(Task(title=f"купить молоко {task_type.value}", description="в магазине",
+                                 task_type=task_type, status=status, created_by=created_by,
+                                 created_at=now - timedelta(days=60)))
+        for wish_type in WishType:
+            db.add_wish(Wish(title="новая книга", description="любая", wish_type=wish_type,
+                             created_by=created_by, created_at=now))
+        for movie_type in MovieType:
+            db.add_movie(Movie(title="Молоко", description="драма", movie_type=movie_type,
+                               created_by=created_by, created_at=now))
+    db.archive_completed_tasks(now - timedelta(days=30), batch_size=1)
+    yield db
+    db.close()
+
+def query_plans(db: Database, call) -> list:
+    """Выполняет call и возвращает планы всех SELECT, которые он отправил в базу"""
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    try:
+        call()
+    finally:
+        db.conn.set_trace_callback(None)
+
+    plans = []
+    for sql in statements:
+        if not sql.lstrip().upper().startswith("SELECT"):
+            continue
+        rows = db.conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+        plans.append((sql, [row[3] for row in rows]))
+    assert plans, "вызов не отправил в базу ни одного SELECT"
+    return plans
+
+def assert_indexed(plans: list, ordered_scan: str = None):
+    """ordered_scan - таблица, которую запрос может обходить по первичному
+    ключу: без сортировки и с LIMIT это чтение только нужных строк"""
+    for sql, details in plans:
+        for detail in details:
+            if detail == f"SCAN {ordered_scan}":
+                assert "LIMIT" in sql, sql
+                continue
+            assert not TABLE_SCAN_RE.search(detail), f"{detail}\n{sql}"
+            assert "USE TEMP B-TREE" not in detail, f"{detail}\n{sql}"
+
+@pytest.mark.parametrize("method", [
+    "get_tasks", "get_user_tasks", "get_partner_tasks", "get_common_tasks",
+    "get_completed_tasks", "get_wishes", "get_my_wishes", "get_partner_wishes",
+    "get_my_movies", "get_partner_movies",
+])
+def test_list_pages(db, method):
+    first = getattr(db, method)(USER_ID)
+    assert_indexed(query_plans(db, lambda: getattr(db, method)(USER_ID, cursor="x")))
+    assert_indexed(query_plans(db, lambda: getattr(db, method)(USER_ID, cursor=first.next_cursor)))
+    assert_indexed(query_plans(db, lambda: getattr(db, method)(USER_ID, cursor=first.prev_cursor)))
+
+def test_dashboard(db):
+    assert_indexed(query_plans(db, lambda: db.get_dashboard_counts(USER_ID)))
+
+def test_search(db):
+    plans = query_plans(db, lambda: db.get_search_results(USER_ID, "молоко"))
+    assert_indexed(plans)
+
+def test_outbox(db):
+    db.add_task(Task(title="позвонить", task_type=TaskType.FOR_PARTNER, created_by=USER_ID),
+                notify=[(PARTNER_ID, "send_message", {"text": "новая задача"})])
+    assert_indexed(query_plans(db, db.get_outbox_batch))
+
+def test_archive(db):
+    assert_indexed(query_plans(db, lambda: db.archive_completed_tasks(datetime.now())))
+
+def test_entities(db):
+    # get_task читает all_tasks, берём задачу, которая уже в архиве
+    archived_id = db.conn.execute("SELECT id FROM tasks_archive LIMIT 1").fetchone()[0]
+    assert_indexed(query_plans(db, lambda: db.get_task(archived_id)))
+    assert_indexed(query_plans(db, lambda: db.get_wish(1)))
+    assert_indexed(query_plans(db, lambda: db.get_movie(1)))
+
+def test_movie_stats_and_features(db):
+    assert_indexed(query_plans(db, lambda: db.get_movie_stats(USER_ID)))
+    assert_indexed(query_plans(db, lambda: db._movie_features(USER_ID)))
+
+def test_update_journal(db):
+    db.mark_updates_processed([100, 101, 103], 102)
+    assert_indexed(query_plans(db, lambda: db.get_update_processed(101)))
+    assert_indexed(query_plans(db, lambda: db.get_recent_updates(10)), ordered_scan="processed_updates")
+
+def test_fsm_record(db):
+    assert_indexed(query_plans(db, lambda: db.get_fsm_record("1:1:1")))
@@ -0,0 +1,105 @@
+"""SQLiteStorage: отложенная запись состояний FSM в базу"""
+import asyncio
+
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+
+from database import AsyncDatabase
+from storage import SQLiteStorage
+
+TTL = 3600
+BOT_ID = 42
+
+class Form(StatesGroup):
+    title = State()
+    description = State()
+
+def key(user_id: int) -> StorageKey:
+    return StorageKey(bot_id=BOT_ID, chat_id=user_id, user_id=user_id)
+
+def record_name(storage: SQLiteStorage, user_id: int) -> str:
+    return storage._key_builder.build(key(user_id))
+
+def test_writes_reach_database_after_flush_interval(tmp_path):
+    async def run():
+        db = AsyncDatabase(str(tmp_path / "bot.db"))
+        storage = SQLiteStorage(db, ttl=TTL, flush_interval=0.05)
+        await storage.set_state(key(1), Form.title)
+        await storage.set_data(key(1), {"title": "Купить хлеб"})
+        name = record_name(storage, 1)
+        # До сброса состояние видно только из памяти
+        before = await db.get_fsm_record(name)
+        state = await storage.get_state(key(1))
+        await asyncio.sleep(0.2)
+        after = await db.get_fsm_record(name)
+        await storage.close()
+        await db.close()
+        return before, state, after
+
+    before, state, after = asyncio.run(run())
+    assert before is None
+    assert state == Form.title.state
+    assert after[0] == Form.title.state
+    assert after[1] == '{"title": "Купить хлеб"}'
+
+def test_close_flushes_pending_writes(tmp_path):
+    async def run():
+        db = AsyncDatabase(str(tmp_path / "bot.db"))
+        storage = SQLiteStorage(db, ttl=TTL, flush_interval=60)
+        await storage.set_state(key(1), Form.description)
+        await storage.set_data(key(2), {"page": 3})
+        before = await db.get_fsm_record(record_name(storage, 1))
+        await storage.close()
+        after = [await db.get_fsm_record(record_name(storage, user_id)) for user_id in (1, 2)]
+        await db.close()
+        return before, after
+
+    before, (first, second) = asyncio.run(run())
+    assert before is None
+    assert first[:2] == (Form.description.state, "{}")
+    assert second[:2] == (None, '{"page": 3}')
+
+def test_state_and_data_survive_reopen(tmp_path):
+    path = str(tmp_path / "bot.db")
+
+    async def write():
+        db = AsyncDatabase(path)
+        storage = SQLiteStorage(db, ttl=TTL, flush_interval=60)
+        await storage.set_state(key(1), Form.description)
+        await storage.set_data(key(1), {"title": "Кино", "tags": ["вечер", "дома"]})
+        await storage.set_state(key(2), Form.title)
+        await storage.set_state(key(2), None)
+        await storage.close()
+        await db.close()
+
+    async def read():
+        db = AsyncDatabase(path)
+        storage = SQLiteStorage(db, ttl=TTL)
+        result = [
+            (await storage.get_state(key(user_id)), await storage.get_data(key(user_id)))
+            for user_id in (1, 2, 3)
+        ]
+        await storage.close()
+        await db.close()
+        return result
+
+    asyncio.run(write())
+    assert asyncio.run(read()) == [
+        (Form.description.state, {"title": "Кино", "tags": ["вечер", "дома"]}),
+        (None, {}),
+        (None, {}),
+    ]
+
+def test_evicted_record_is_read_from_pending_writes(tmp_path):
+    async def run():
+        db = AsyncDatabase(str(tmp_path / "bot.db"))
+        storage = SQLiteStorage(db, ttl=TTL, cache_size=1, flush_interval=60)
+        await storage.set_data(key(1), {"step": 1})
+        # Вытесняет первую запись из кэша, но не из очереди на запись
+        await storage.set_data(key(2), {"step": 2})
+        data = await storage.get_data(key(1))
+        await storage.close()
+        await db.close()
+        return data
+
+    assert asyncio.run(run()) == {"step": 1}
@@ -0,0 +1,139 @@
+"""Мидлвари обработки обновлений: порядок и защита от двойных нажатий"""
+import asyncio
+import time
+from unittest import mock
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.methods import AnswerCallbackQuery
+from aiogram.types import Update
+
+from updates import CallbackDeduplicator, UpdateScheduler
+
+def callback_update(bot: Bot, update_id: int, data: str, user_id: int = 1, message_id: int = 10) -> Update:
+    return Update.model_validate({"update_id": update_id, "callback_query": {
+        "id": str(update_id), "chat_instance": "test", "data": data,
+        "from": {"id": user_id, "is_bot": False, "first_name": "test"},
+        "message": {"message_id": message_id, "date": 0, "chat": {"id": user_id, "type": "private"}},
+    }}, context={"bot": bot})
+
+def make_bot() -> tuple:
+    """Бот без сети: запросы к Bot API записываются в answers со временем"""
+    bot = Bot("1:test")
+    answers = []
+
+    async def make_request(bot, method, timeout=None):
+        answers.append((type(method), time.monotonic()))
+        return True
+
+    bot.session.make_request = mock.AsyncMock(side_effect=make_request)
+    return bot, answers
+
+def make_dispatcher(handler, window: float) -> tuple:
+    dispatcher = Dispatcher()
+    router = Router()
+    router.callback_query()(handler)
+    dispatcher.include_router(router)
+    deduplicator = CallbackDeduplicator(window=window)
+    dispatcher.update.outer_middleware(deduplicator)
+    dispatcher.update.outer_middleware(UpdateScheduler())
+    return dispatcher, deduplicator
+
+def test_double_tap_answered_without_waiting_for_first():
+    async def run():
+        bot, answers = make_bot()
+        handled = []
+
+        async def handler(callback_query):
+            handled.append(callback_query.data)
+            await asyncio.sleep(0.3)
+
+        dispatcher, deduplicator = make_dispatcher(handler, window=1.0)
+        first = asyncio.create_task(dispatcher.feed_update(bot, callback_update(bot, 1, "confirm_delete:5")))
+        await asyncio.sleep(0.05)
+        tapped_at = time.monotonic()
+        await dispatcher.feed_update(bot, callback_update(bot, 2, "confirm_delete:5"))
+        answered_at = time.monotonic()
+        await first
+        await bot.session.close()
+        return handled, answers, answered_at - tapped_at, deduplicator.stats()
+
+    handled, answers, delay, stats = asyncio.run(run())
+    assert handled == ["confirm_delete:5"]
+    assert [method for method, _ in answers] == [AnswerCallbackQuery]
+    # Повтор не встал в очередь пользователя за первым нажатием
+    assert delay < 0.1
+    assert stats == {"suppressed_callbacks": 1}
+
+def test_window_starts_at_first_tap():
+    async def run():
+        bot, _ = make_bot()
+        handled = []
+
+        async def handler(callback_query):
+            handled.append(callback_query.data)
+            await asyncio.sleep(0.2)
+
+        dispatcher, _ = make_dispatcher(handler, window=0.3)
+        # Обработка первого нажатия кончается к 0.2 с, окно - к 0.3 с от
+        # нажатия, и повтор в 0.35 с уже не двойное нажатие
+        await dispatcher.feed_update(bot, callback_update(bot, 1, "view_task:5:my_tasks"))
+        await asyncio.sleep(0.15)
+        await dispatcher.feed_update(bot, callback_update(bot, 2, "view_task:5:my_tasks"))
+        await bot.session.close()
+        return handled
+
+    assert asyncio.run(run()) == ["view_task:5:my_tasks"] * 2
+
+def test_failed_tap_can_be_repeated():
+    async def run():
+        bot, _ = make_bot()
+        handled = []
+
+        async def handler(callback_query):
+            handled.append(callback_query.data)
+            if len(handled) == 1:
+                raise RuntimeError("сбой")
+
+        dispatcher, _ = make_dispatcher(handler, window=1.0)
+        try:
+            await dispatcher.feed_update(bot, callback_update(bot, 1, "task_status:5:completed"))
+        except RuntimeError:
+            pass
+        await dispatcher.feed_update(bot, callback_update(bot, 2, "task_status:5:completed"))
+        await bot.session.close()
+        return handled
+
+    assert asyncio.run(run()) == ["task_status:5:completed"] * 2
+
+def test_user_updates_in_order_users_in_parallel():
+    async def run():
+        bot, _ = make_bot()
+        events = []
+
+        async def handler(callback_query):
+            events.append(("start", callback_query.data))
+            # Первое нажатие самое долгое: без очереди следующие обогнали бы его
+            await asyncio.sleep(0.3 if callback_query.data.endswith(":1") else 0.05)
+            events.append(("end", callback_query.data))
+
+        dispatcher, _ = make_dispatcher(handler, window=1.0)
+        started = time.monotonic()
+        await asyncio.gather(
+            *(dispatcher.feed_update(bot, callback_update(bot, step, f"view_task:{step}", user_id=1))
+              for step in (1, 2, 3)),
+            dispatcher.feed_update(bot, callback_update(bot, 4, "view_wish:7", user_id=2)),
+        )
+        elapsed = time.monotonic() - started
+        await bot.session.close()
+        return events, elapsed
+
+    events, elapsed = asyncio.run(run())
+    first_user = [event for event in events if event[1].startswith("view_task:")]
+    assert first_user == [
+        ("start", "view_task:1"), ("end", "view_task:1"),
+        ("start", "view_task:2"), ("end", "view_task:2"),
+        ("start", "view_task:3"), ("end", "view_task:3"),
+    ]
+    # Второй пользователь не ждёт, пока закончится очередь первого
+    assert events.index(("end", "view_wish:7")) < events.index(("end", "view_task:1"))
+    assert elapsed < 0.5
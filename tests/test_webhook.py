@@ -0,0 +1,59 @@
+"""Проверка секрета вебхука на тестовом aiohttp-сервере"""
+import asyncio
+
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiohttp.test_utils import TestClient, TestServer
+
+from webhook import check_webhook_config, create_app
+
+PATH = "/webhook"
+SECRET = "s3cret"
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+UPDATE = {"update_id": 1, "message": {
+    "message_id": 1, "date": 0, "text": "привет",
+    "chat": {"id": 1, "type": "private"},
+    "from": {"id": 1, "is_bot": False, "first_name": "test"},
+}}
+
+def post_update(headers: dict, secret_token: str = SECRET) -> tuple:
+    """Отправляет обновление в вебхук и возвращает (статус, обработанные тексты)"""
+    async def run():
+        handled = []
+        dispatcher = Dispatcher()
+        router = Router()
+
+        @router.message()
+        async def handler(message):
+            handled.append(message.text)
+
+        dispatcher.include_router(router)
+        bot = Bot("1:test")
+        app = create_app(dispatcher, bot, PATH, secret_token, workers=2)
+        async with TestClient(TestServer(app)) as client:
+            response = await client.post(PATH, json=UPDATE, headers=headers)
+            status = response.status
+        await bot.session.close()
+        return status, handled
+
+    return asyncio.run(run())
+
+def test_missing_header_rejected():
+    assert post_update({}) == (401, [])
+
+def test_wrong_header_rejected():
+    assert post_update({SECRET_HEADER: "wrong"}) == (401, [])
+
+def test_correct_header_accepted():
+    assert post_update({SECRET_HEADER: SECRET}) == (200, ["привет"])
+
+def test_empty_secret_rejects_everything():
+    assert post_update({SECRET_HEADER: ""}, secret_token="") == (401, [])
+
+def test_config_requires_secret_and_base_url():
+    with pytest.raises(RuntimeError, match="WEBHOOK_BASE_URL, WEBHOOK_SECRET"):
+        check_webhook_config("", "")
+    with pytest.raises(RuntimeError, match="WEBHOOK_SECRET"):
+        check_webhook_config("https://example.org", "")
+    check_webhook_config("https://example.org", SECRET)
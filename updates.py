@@ -0,0 +1,451 @@
+import asyncio
+import contextlib
+import logging
+import signal
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.exceptions import TelegramAPIError, TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from aiogram.types import CallbackQuery, Update
+from notifications import TokenBucket
+
+# Сколько последних update_id помнить в памяти. Повтор более старого
+# обновления проверяется запросом к базе
+JOURNAL_MEMORY = 10000
+
+# Сколько хранить записи журнала: Telegram держит недоставленные
+# обновления не больше суток
+JOURNAL_KEEP = timedelta(days=2)
+
+# Скорость разбора накопившихся за время перезапуска обновлений, чтобы
+# старые нажатия не шли одной пачкой
+REPLAY_RATE = 10
+REPLAY_BURST = 10
+REPLAY_BATCH_SIZE = 100
+
+# Обработанные обновления пишутся в журнал пачкой раз в столько секунд или
+# сразу, когда их накопится JOURNAL_FLUSH_MAX_BATCH
+JOURNAL_FLUSH_INTERVAL = 0.5
+JOURNAL_FLUSH_MAX_BATCH = 100
+
+# Long polling: сколько секунд Telegram держит запрос getUpdates, и
+# предельная пауза между повторами при сетевых ошибках
+POLL_TIMEOUT = 10
+POLL_MAX_BACKOFF = 30
+
+# Сколько обновлений разных пользователей обрабатывать одновременно
+SCHEDULER_WORKERS = 16
+
+# Ожидание в очереди дольше этого (в секундах) пишется в лог
+SLOW_WAIT = 1.0
+
+# Повторное нажатие той же кнопки того же сообщения в течение стольких
+# секунд после первого нажатия считается двойным нажатием. Помним не
+# больше CALLBACK_MEMORY последних нажатий
+CALLBACK_DEDUP_WINDOW = 1.0
+CALLBACK_MEMORY = 4096
+
+class UpdateJournal(BaseMiddleware):
+    """Пропускает обновления, которые уже обработаны, и ведёт offset.
+
+    Поллинг записывает тела полученных обновлений через receive() до того,
+    как подтвердит их Telegram. Обработанные update_id пишутся в
+    processed_updates пачками раз в JOURNAL_FLUSH_INTERVAL и убираются из
+    полученных, а вместе с ними пишется offset: все обновления до него
+    обработаны. После падения обновления, которые были в работе или не
+    успели попасть в журнал, разбираются заново из базы (см. replay_backlog),
+    то есть доставка - хотя бы один раз. Свежие update_id больше всех
+    известных, поэтому обычно хватает памяти и в базу за проверкой ходить
+    не нужно.
+    """
+
+    def __init__(self, db):
+        self._db = db
+        self._seen = set()
+        self._order = deque()
+        # Все обработанные update_id не меньше _horizon есть в _seen
+        self._horizon = 0
+        self._max_done = None
+        self._in_flight = set()
+        # Обработанные, но ещё не записанные в журнал
+        self._pending = []
+        self._flush_handle = None
+        self._flush_lock = asyncio.Lock()
+        # offset, до которого всё обработано и записано в базу
+        self.offset: Optional[int] = None
+
+    async def load(self):
+        """Загружает offset и последние обработанные update_id, чистит старый журнал"""
+        await self._db.purge_processed_updates(datetime.now() - JOURNAL_KEEP)
+        self.offset = await self._db.get_update_offset()
+        recent = await self._db.get_recent_updates(JOURNAL_MEMORY)
+        for update_id in reversed(recent):
+            self._remember(update_id)
+        if recent:
+            self._horizon = recent[-1]
+        # Обработанные после offset помним, но считаем от него: между ними
+        # могут быть обновления, которые были в работе при остановке
+        if self.offset is not None:
+            self._max_done = self.offset - 1
+
+    def _remember(self, update_id: int):
+        self._seen.add(update_id)
+        self._order.append(update_id)
+        if len(self._order) > JOURNAL_MEMORY:
+            forgotten = self._order.popleft()
+            self._seen.discard(forgotten)
+            self._horizon = max(self._horizon, forgotten + 1)
+
+    async def _is_processed(self, update_id: int) -> bool:
+        if update_id in self._seen:
+            return True
+        if update_id < self._horizon:
+            return await self._db.get_update_processed(update_id)
+        return False
+
+    def _offset(self) -> Optional[int]:
+        if self._in_flight:
+            return min(self._in_flight)
+        return self._max_done + 1 if self._max_done is not None else None
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        update_id = event.update_id
+        if update_id in self._in_flight:
+            return None
+        if await self._is_processed(update_id):
+            logging.info(f"Обновление {update_id} уже обработано, пропускаем")
+            # Повтор пришёл, потому что offset до него не дошёл - двигаем
+            self._mark_done(update_id)
+            self._schedule_flush()
+            return None
+
+        self._in_flight.add(update_id)
+        try:
+            return await handler(event, data)
+        finally:
+            # Упавшее обновление тоже отмечаем: иначе offset застрянет на нём,
+            # а ошибку уже записал в лог диспетчер
+            self._in_flight.discard(update_id)
+            self._remember(update_id)
+            self._mark_done(update_id)
+            self._pending.append(update_id)
+            self._schedule_flush()
+
+    def _mark_done(self, update_id: int):
+        self._max_done = update_id if self._max_done is None else max(self._max_done, update_id)
+
+    def _schedule_flush(self):
+        if len(self._pending) >= JOURNAL_FLUSH_MAX_BATCH:
+            self._start_flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                JOURNAL_FLUSH_INTERVAL, self._start_flush
+            )
+
+    def _start_flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        asyncio.create_task(self.flush())
+
+    async def flush(self):
+        """Пишет накопленные update_id и текущий offset одной транзакцией"""
+        async with self._flush_lock:
+            offset = self._offset()
+            if offset is None or not self._pending and self.offset is not None and offset <= self.offset:
+                return
+            update_ids, self._pending = self._pending, []
+            try:
+                await self._db.mark_updates_processed(update_ids, offset)
+            except Exception as e:
+                logging.error(f"Не удалось записать обновления в журнал: {e}")
+                self._pending[:0] = update_ids
+                self._schedule_flush()
+                return
+            self.offset = offset if self.offset is None else max(self.offset, offset)
+
+    async def receive(self, updates: list):
+        """Записывает полученные обновления, чтобы после падения их можно
+        было разобрать, даже если Telegram их уже не вернёт"""
+        await self._db.save_received_updates([
+            (update.update_id, update.model_dump_json(exclude_unset=True)) for update in updates
+        ])
+
+    async def unfinished(self, bot: Bot) -> list:
+        """Полученные до остановки, но не обработанные обновления"""
+        return [
+            Update.model_validate_json(payload, context={"bot": bot})
+            for _, payload in await self._db.get_received_updates()
+        ]
+
+    async def close(self):
+        """Дописывает в журнал всё, что накопилось"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        await self.flush()
+
+class _UserQueue:
+    __slots__ = ("lock", "depth")
+
+    def __init__(self):
+        # asyncio.Lock отдаёт блокировку ожидающим по порядку прихода
+        self.lock = asyncio.Lock()
+        self.depth = 0
+
+class UpdateScheduler(BaseMiddleware):
+    """Обновления одного пользователя обрабатываются строго по очереди, а
+    разных пользователей - параллельно, но не больше workers одновременно.
+
+    Два быстрых нажатия одного пользователя (например, двойное
+    confirm_delete:) не пересекаются: второе начнётся, когда закончится
+    первое. stats() отдаёт глубину очередей и время ожидания.
+    """
+
+    def __init__(self, workers: int = SCHEDULER_WORKERS):
+        self._workers = asyncio.Semaphore(workers)
+        self._users: Dict[int, _UserQueue] = {}
+        self.waiting = 0
+        self.running = 0
+        self.processed = 0
+        self.max_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        key = user.id if user else None
+        queue = self._users.get(key)
+        if queue is None:
+            queue = self._users[key] = _UserQueue()
+        queue.depth += 1
+        self.max_depth = max(self.max_depth, queue.depth)
+        # Обновления без пользователя (посты каналов и т.п.) не упорядочиваем
+        lock = queue.lock if key is not None else contextlib.nullcontext()
+
+        queued_at = time.monotonic()
+        self.waiting += 1
+        waiting = True
+        try:
+            async with lock, self._workers:
+                waiting = False
+                self.waiting -= 1
+                self._record_wait(time.monotonic() - queued_at, event.update_id, key)
+                self.running += 1
+                try:
+                    return await handler(event, data)
+                finally:
+                    self.running -= 1
+                    self.processed += 1
+        finally:
+            if waiting:
+                self.waiting -= 1
+            queue.depth -= 1
+            if not queue.depth:
+                del self._users[key]
+
+    def _record_wait(self, wait: float, update_id: int, user_id: Optional[int]):
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        if wait > SLOW_WAIT:
+            logging.warning(f"Обновление {update_id} пользователя {user_id} ждало очереди {wait:.1f} с")
+
+    def stats(self) -> dict:
+        started = self.processed + self.running
+        return {
+            'waiting': self.waiting,
+            'running': self.running,
+            'queued_users': len(self._users),
+            'processed': self.processed,
+            'max_user_depth': self.max_depth,
+            'avg_wait_ms': round(self.total_wait / started * 1000, 1) if started else 0,
+            'max_wait_ms': round(self.max_wait * 1000, 1),
+        }
+
+class CallbackDeduplicator(BaseMiddleware):
+    """Отбрасывает повторные нажатия одной кнопки (двойной тап).
+
+    Ключ - пользователь, сообщение и data кнопки. Пока первое нажатие
+    обрабатывается и CALLBACK_DEDUP_WINDOW секунд после него самого, такие же
+    нажатия сразу получают пустой ответ, а обработчик не вызывается. Окно
+    считается от первого нажатия, поэтому повторное нажатие той же кнопки
+    после того, как сообщение обновилось, доходит до обработчика. Если
+    обработчик упал, ключ забывается, чтобы нажатие можно было повторить.
+
+    Ставится на update до UpdateScheduler, чтобы повтор не ждал в очереди
+    пользователя, пока закончится первое нажатие.
+    """
+
+    def __init__(self, window: float = CALLBACK_DEDUP_WINDOW, memory: int = CALLBACK_MEMORY):
+        self._window = window
+        self._memory = memory
+        # Ключ -> время первого нажатия
+        self._seen = OrderedDict()
+        self._running = set()
+        self.suppressed = 0
+
+    @staticmethod
+    def _key(callback: CallbackQuery) -> tuple:
+        message = callback.message
+        target = (message.chat.id, message.message_id) if message else callback.inline_message_id
+        return callback.from_user.id, target, callback.data
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        callback = event.callback_query
+        if callback is None:
+            return await handler(event, data)
+
+        key = self._key(callback)
+        now = time.monotonic()
+        tapped_at = self._seen.get(key)
+        if key in self._running or tapped_at is not None and now - tapped_at < self._window:
+            self.suppressed += 1
+            logging.info(f"Повторное нажатие {callback.data!r} пользователем {callback.from_user.id} пропущено")
+            # Ответ убирает часики на кнопке
+            try:
+                await callback.answer()
+            except TelegramAPIError:
+                pass
+            return None
+
+        self._seen[key] = now
+        self._seen.move_to_end(key)
+        # Вытесняем самые старые нажатия. Те, что ещё обрабатываются,
+        # защищает _running
+        while len(self._seen) > self._memory:
+            self._seen.popitem(last=False)
+        self._running.add(key)
+        try:
+            return await handler(event, data)
+        except BaseException:
+            self._seen.pop(key, None)
+            raise
+        finally:
+            self._running.discard(key)
+
+    def stats(self) -> dict:
+        return {'suppressed_callbacks': self.suppressed}
+
+async def replay_backlog(dispatcher: Dispatcher, bot: Bot, journal: UpdateJournal) -> int:
+    """Разбирает обновления, не обработанные до остановки, не быстрее
+    REPLAY_RATE в секунду.
+
+    Сначала идут полученные, но не обработанные обновления из базы, затем
+    накопившиеся в Telegram с записанного offset. Запрос getUpdates с offset
+    подтверждает Telegram всё, что раньше него, поэтому перед каждым
+    запросом журнал дописывается в базу. Возвращает число разобранных
+    обновлений.
+    """
+    bucket = TokenBucket(REPLAY_RATE, REPLAY_BURST)
+    allowed_updates = dispatcher.resolve_used_update_types()
+    replayed = 0
+    for update in await journal.unfinished(bot):
+        await asyncio.sleep(bucket.take())
+        try:
+            await dispatcher.feed_update(bot, update)
+        except Exception as e:
+            logging.error(f"Ошибка при разборе обновления {update.update_id}: {e}")
+        replayed += 1
+    while True:
+        await journal.flush()
+        updates = await bot.get_updates(
+            offset=journal.offset, limit=REPLAY_BATCH_SIZE, timeout=0, allowed_updates=allowed_updates
+        )
+        if not updates:
+            break
+        for update in updates:
+            await asyncio.sleep(bucket.take())
+            try:
+                await dispatcher.feed_update(bot, update)
+            except Exception as e:
+                logging.error(f"Ошибка при разборе обновления {update.update_id}: {e}")
+            replayed += 1
+    if replayed:
+        logging.info(f"Разобрано обновлений, накопившихся за перезапуск: {replayed}")
+    return replayed
+
+async def _poll(dispatcher: Dispatcher, bot: Bot, journal: UpdateJournal, handlers: set):
+    allowed_updates = dispatcher.resolve_used_update_types()
+    # Следующий getUpdates берёт только новые обновления и тем самым
+    # подтверждает Telegram уже полученные: они к этому времени записаны в
+    # журнал, и после падения их разберёт replay_backlog
+    last_fed = journal.offset - 1 if journal.offset is not None else None
+    backoff = 1
+    while True:
+        try:
+            updates = await bot.get_updates(
+                offset=last_fed + 1 if last_fed is not None else None,
+                timeout=POLL_TIMEOUT, allowed_updates=allowed_updates
+            )
+            backoff = 1
+        except TelegramRetryAfter as e:
+            logging.warning(f"Telegram просит подождать {e.retry_after} с перед getUpdates")
+            await asyncio.sleep(e.retry_after)
+            continue
+        except (TelegramNetworkError, TelegramServerError) as e:
+            logging.warning(f"Ошибка getUpdates ({e}), повтор через {backoff} с")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, POLL_MAX_BACKOFF)
+            continue
+
+        if not updates:
+            continue
+        try:
+            await journal.receive(updates)
+        except Exception as e:
+            # Не записали - не подтверждаем: тот же запрос вернёт их снова
+            logging.error(f"Не удалось записать полученные обновления ({e}), повтор через {backoff} с")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, POLL_MAX_BACKOFF)
+            continue
+        for update in updates:
+            task = asyncio.create_task(dispatcher.feed_update(bot, update))
+            handlers.add(task)
+            task.add_done_callback(handlers.discard)
+        last_fed = updates[-1].update_id
+
+async def run_polling(dispatcher: Dispatcher, bot: Bot, journal: UpdateJournal):
+    """Long polling до SIGINT/SIGTERM. В отличие от start_polling, обновления
+    подтверждаются Telegram только после записи в журнал: те, что были в
+    работе при падении, после перезапуска разберёт replay_backlog.
+
+    Обновления обрабатываются параллельно (порядок и предел задаёт
+    UpdateScheduler). При остановке новые не берутся, а начатые дорабатываются.
+    """
+    handlers = set()
+    poller = asyncio.create_task(_poll(dispatcher, bot, journal, handlers), name="polling")
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    logging.info("Поллинг запущен")
+    try:
+        await asyncio.wait({poller, asyncio.create_task(stop.wait())}, return_when=asyncio.FIRST_COMPLETED)
+        if poller.done():
+            # _poll сам не завершается, значит упал
+            poller.result()
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
+        poller.cancel()
+        await asyncio.gather(poller, return_exceptions=True)
+        if handlers:
+            await asyncio.gather(*handlers, return_exceptions=True)
+        await journal.close()
@@ -0,0 +1,87 @@
+import asyncio
+import logging
+import secrets
+import signal
+from typing import Callable, Optional
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+class WebhookHandler(SimpleRequestHandler):
+    """Принимает обновления от Telegram и обрабатывает их до ответа.
+
+    Telegram считает обновление доставленным только после ответа 200, поэтому
+    всё, что не успели обработать к остановке, он пришлёт ещё раз. Одновременно
+    обрабатывается не больше workers обновлений, остальные ждут.
+
+    Запрос без верного X-Telegram-Bot-Api-Secret-Token отклоняется, в том
+    числе когда секрет не задан: обработчики доверяют from_user.id.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, secret_token: str, workers: int):
+        super().__init__(dispatcher, bot, handle_in_background=False, secret_token=secret_token)
+        self._workers = asyncio.Semaphore(workers)
+
+    def verify_secret(self, telegram_secret_token: str, bot: Bot) -> bool:
+        return bool(self.secret_token) and secrets.compare_digest(telegram_secret_token, self.secret_token)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        async with self._workers:
+            return await super().handle(request)
+
+def check_webhook_config(base_url: str, secret_token: str):
+    """Не даёт запустить вебхук без публичного адреса или без секрета"""
+    missing = [name for name, value in (("WEBHOOK_BASE_URL", base_url), ("WEBHOOK_SECRET", secret_token))
+               if not value]
+    if missing:
+        raise RuntimeError(f"Для режима webhook нужно задать {', '.join(missing)}")
+
+def create_app(dispatcher: Dispatcher, bot: Bot, path: str, secret_token: str, workers: int,
+               stats: Optional[Callable[[], dict]] = None) -> web.Application:
+    """aiohttp-приложение с маршрутом вебхука и /health (плюс метрики из stats())"""
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok", **(stats() if stats else {})})
+
+    app = web.Application()
+    handler = WebhookHandler(dispatcher, bot, secret_token, workers)
+    # Маршрут добавляем сами: register() закрыл бы сессию бота при остановке
+    # сервера, а после неё ещё досылаются уведомления
+    app.router.add_post(path, handler.handle)
+    app.router.add_get("/health", health)
+    setup_application(app, dispatcher, bot=bot)
+    return app
+
+async def run_webhook(dispatcher: Dispatcher, bot: Bot, base_url: str, path: str, secret_token: str,
+                      host: str, port: int, workers: int, stats: Optional[Callable[[], dict]] = None):
+    """Регистрирует вебхук и обслуживает его до SIGINT/SIGTERM.
+
+    При остановке вебхук не удаляется: обновления, пришедшие во время
+    перезапуска, Telegram доставит новому процессу.
+    """
+    check_webhook_config(base_url, secret_token)
+    app = create_app(dispatcher, bot, path, secret_token, workers, stats)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    logging.info(f"Вебхук слушает {host}:{port}{path}")
+
+    await bot.set_webhook(
+        base_url.rstrip("/") + path,
+        secret_token=secret_token,
+        max_connections=workers,
+        allowed_updates=dispatcher.resolve_used_update_types(),
+        drop_pending_updates=False,
+    )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(sig)
+        # Перестаём принимать запросы и ждём обработки уже принятых
+        await runner.cleanup()